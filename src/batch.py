@@ -0,0 +1,178 @@
+import argparse
+import csv
+import json
+import os
+from collections import OrderedDict
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from src.io_ports import output_value, read_input_events
+from src.isa import unpack_program
+from src.machine import Engine, Machine
+from src.trace import NullTraceSink
+
+
+@dataclass
+class BatchJob:
+    program: Path
+    inputs: list[Path]
+
+
+@dataclass
+class BatchResult:
+    program: str
+    input: str
+    exit_reason: str  # "halt", "limit" or "error: <message>"
+    ticks: int
+    output: list[int]
+
+    @property
+    def output_text(self) -> str:
+        return "".join(str(output_value(c)) for c in self.output)
+
+
+def read_manifest(manifest_path: Path) -> list[BatchJob]:
+    # {"program": "cat.bin", "inputs": ["a.input", "b.input"]} per line,
+    # paths are relative to the manifest
+    base = manifest_path.parent
+    jobs = []
+    with manifest_path.open() as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            inputs = entry.get("inputs", [entry.get("input")])
+            jobs.append(BatchJob(
+                base / entry["program"],
+                [base / path for path in inputs if path is not None],
+            ))
+    return jobs
+
+
+# programs a worker keeps predecoded, least recently used are dropped
+WARM_MACHINES = 16
+
+# every worker process unpacks and predecodes a program once per version
+# of the file, keyed on its mtime and size so a rewritten program reloads
+_machines: OrderedDict[tuple[Path, int, int, str], Machine] = OrderedDict()
+
+
+def _warm_machine(program_path: Path, engine: Engine) -> Machine:
+    stat = program_path.stat()
+    key = (program_path, stat.st_mtime_ns, stat.st_size, engine)
+    machine = _machines.get(key)
+    if machine is None:
+        machine = Machine()
+        machine.load_program(
+            unpack_program(program_path.read_bytes()), engine)
+        _machines[key] = machine
+        if len(_machines) > WARM_MACHINES:
+            _machines.popitem(last=False)
+    else:
+        _machines.move_to_end(key)
+    return machine
+
+
+def run_one(
+    machine: Machine, input_path: Path, engine: Engine, limit: int
+) -> tuple[str, int, list[int]]:
+    machine.reset()
+    try:
+        machine.simulate(
+            read_input_events(input_path), machine.program,
+            limit=limit, engine=engine, trace=NullTraceSink(),
+        )
+    except StopIteration as e:
+        reason = "limit" if e.value == "limit" else "halt"
+    except Exception as e:
+        reason = f"error: {type(e).__name__}: {e}"
+    return reason, machine.cu._tick, machine.io_controller.output_buffer
+
+
+def run_chunk(
+    program_path: Path, inputs: list[Path], engine: Engine, limit: int
+) -> list[BatchResult]:
+    try:
+        machine = _warm_machine(program_path, engine)
+    except Exception as e:
+        # a program that cannot be loaded fails its own jobs only
+        reason = f"error: {type(e).__name__}: {e}"
+        return [BatchResult(str(program_path), str(input_path), reason, 0, [])
+                for input_path in inputs]
+    results = []
+    for input_path in inputs:
+        reason, ticks, output = run_one(machine, input_path, engine, limit)
+        results.append(BatchResult(
+            str(program_path), str(input_path), reason, ticks, output))
+    return results
+
+
+def _chunks(
+    jobs: list[BatchJob], chunk_size: int
+) -> Iterator[tuple[Path, list[Path]]]:
+    for job in jobs:
+        for i in range(0, len(job.inputs), chunk_size):
+            yield job.program, job.inputs[i:i + chunk_size]
+
+
+def run_batch(
+    jobs: list[BatchJob],
+    workers: int | None = None,
+    engine: Engine = "fast",
+    limit: int = 100000,
+    chunk_size: int | None = None,
+) -> list[BatchResult]:
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        # a few chunks per worker keeps the pool busy while still letting
+        # each worker reuse its predecoded program across many inputs
+        total = sum(len(job.inputs) for job in jobs)
+        chunk_size = max(1, total // (workers * 4))
+
+    chunks = list(_chunks(jobs, chunk_size))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_chunk, program, inputs, engine, limit)
+            for program, inputs in chunks
+        ]
+        return [result for f in futures for result in f.result()]
+
+
+def write_report(results: list[BatchResult], report_path: Path) -> None:
+    with report_path.open("w", newline="") as f:
+        if report_path.suffix == ".csv":
+            writer = csv.writer(f)
+            writer.writerow(["program", "input", "exit_reason", "ticks",
+                             "output"])
+            for r in results:
+                writer.writerow([r.program, r.input, r.exit_reason, r.ticks,
+                                 r.output_text])
+        else:
+            for r in results:
+                f.write(json.dumps(
+                    {**asdict(r), "output_text": r.output_text}) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Run many (program, input) pairs across a process pool")
+    parser.add_argument("manifest", type=Path)
+    parser.add_argument("report", type=Path, help="*.jsonl or *.csv")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", choices=["signal", "fast", "jit"],
+                        default="fast")
+    parser.add_argument("--limit", type=int, default=100000)
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+
+    results = run_batch(
+        read_manifest(args.manifest), args.workers, args.engine,
+        args.limit, args.chunk_size,
+    )
+    write_report(results, args.report)
+
+
+if __name__ == "__main__":
+    main()
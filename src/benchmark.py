@@ -0,0 +1,241 @@
+import argparse
+import contextlib
+import json
+import platform
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from src.compiler import compile, compile_with_labels
+from src.io_ports import read_input_events
+from src.isa import Program, pack_program, unpack_program
+from src.machine import Engine, Machine
+from src.profiler import Profiler
+from src.trace import NullTraceSink
+
+EXAMPLES = Path(__file__).parent.parent / "examples"
+EXAMPLE_PROGRAMS = ["prob1", "cat", "hello_user"]
+ENGINES: list[Engine] = ["signal", "fast", "jit"]
+
+# every metric is a throughput, higher is better
+DEFAULT_THRESHOLD = 0.10
+
+
+@dataclass
+class Metric:
+    name: str
+    value: float
+    unit: str
+
+
+def best_time(run: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def synthetic_source(lines: int) -> str:
+    # a loop of `lines` instructions that never halts, mixing every
+    # instruction shape the engines specialise
+    body = [
+        "ADD R1, 1",
+        "ST R1, 5",
+        "LD R2, 5",
+        "SUB R2, R1",
+        "JE R2, NEXT{i}",
+        "NEXT{i}: MUL R2, 3",
+        "DIV R2, 2",
+        "ST R2, 6",
+    ]
+    source = ["INT: RST", "START:", "    SUB R1, R1", "LOOP:"]
+    for i in range(max(1, lines // len(body))):
+        source.extend(f"    {line.format(i=i)}" for line in body)
+    source.append("    JMP LOOP")
+    return "\n".join(source) + "\n"
+
+
+def _run(
+    program: Program,
+    events: list[tuple[int, int]],
+    engine: Engine,
+    limit: int,
+    profiler: Profiler | None = None,
+) -> Machine:
+    machine = Machine(profiler=profiler)
+    with contextlib.suppress(StopIteration):
+        machine.simulate(list(events), program, limit=limit, engine=engine,
+                         trace=NullTraceSink())
+    return machine
+
+
+def executed_instructions(
+    program: Program, events: list[tuple[int, int]], limit: int
+) -> int:
+    profiler = Profiler(program)
+    _run(program, events, "fast", limit, profiler)
+    return sum(profiler.counts)
+
+
+def bench_compiler(scale: int, repeat: int) -> list[Metric]:
+    sources = {
+        name: (EXAMPLES / f"{name}.asm").read_text()
+        for name in EXAMPLE_PROGRAMS
+    }
+    sources[f"synthetic_{scale}"] = synthetic_source(scale)
+    metrics = []
+    for name, source in sources.items():
+        lines = len(source.splitlines())
+        # the small examples are timed in batches to get above timer noise
+        batch = max(1, 20000 // lines)
+        elapsed = best_time(
+            lambda source=source, batch=batch: [
+                compile_with_labels(source) for _ in range(batch)],
+            repeat)
+        metrics.append(Metric(
+            f"compile/{name}", lines * batch / elapsed, "lines/s"))
+    return metrics
+
+
+def bench_unpack(scale: int, repeat: int) -> list[Metric]:
+    image = pack_program(compile(synthetic_source(scale)))
+    words = len(image) // 2
+    return [
+        Metric(f"unpack/synthetic_{scale}",
+               words / best_time(lambda: unpack_program(image), repeat),
+               "words/s"),
+        Metric(f"decode/synthetic_{scale}",
+               words / best_time(
+                   lambda: list(unpack_program(image).instructions), repeat),
+               "words/s"),
+    ]
+
+
+def bench_simulator(
+    scale: int, repeat: int, engines: list[Engine] = ENGINES
+) -> list[Metric]:
+    cases = [
+        (
+            name,
+            compile((EXAMPLES / f"{name}.asm").read_text()),
+            read_input_events(EXAMPLES / f"{name}.input"),
+            100000,
+        )
+        for name in EXAMPLE_PROGRAMS
+    ]
+    cases.append(
+        (f"synthetic_{scale}", compile(synthetic_source(64)), [], scale))
+
+    metrics = []
+    for name, program, events, limit in cases:
+        instructions = executed_instructions(program, events, limit)
+        for engine in engines:
+            ticks = _run(program, events, engine, limit).cu._tick
+            elapsed = best_time(
+                lambda program=program, events=events, engine=engine,
+                limit=limit: _run(program, events, engine, limit),
+                repeat)
+            metrics.append(Metric(
+                f"simulate/{name}/{engine}/instructions",
+                instructions / elapsed, "instructions/s"))
+            metrics.append(Metric(
+                f"simulate/{name}/{engine}/ticks", ticks / elapsed, "ticks/s"))
+    return metrics
+
+
+def run_suite(scale: int = 100000, repeat: int = 3) -> dict:
+    metrics = [
+        *bench_compiler(scale, repeat),
+        *bench_unpack(scale, repeat),
+        *bench_simulator(scale, repeat),
+    ]
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "scale": scale,
+            "repeat": repeat,
+        },
+        "metrics": {m.name: asdict(m) for m in metrics},
+    }
+
+
+@dataclass
+class Comparison:
+    name: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def compare(
+    baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD
+) -> tuple[list[Comparison], list[Comparison]]:
+    # returns every metric present in both runs and the ones that dropped
+    # by more than threshold
+    compared = [
+        Comparison(name, metric["value"],
+                   current["metrics"][name]["value"])
+        for name, metric in baseline["metrics"].items()
+        if name in current["metrics"]
+    ]
+    regressions = [c for c in compared if c.ratio < 1 - threshold]
+    return compared, regressions
+
+
+def format_comparison(compared: list[Comparison], threshold: float) -> str:
+    lines = []
+    for c in compared:
+        flag = "REGRESSION" if c.ratio < 1 - threshold else ""
+        lines.append(
+            f"{c.name:<50} {c.baseline:>14.0f} {c.current:>14.0f}"
+            f" {c.ratio:>7.2f}x {flag}".rstrip())
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compiler and simulator throughput benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the suite")
+    run.add_argument("--output", type=Path, default=Path("benchmark.json"))
+    run.add_argument("--scale", type=int, default=100000,
+                     help="synthetic program lines and instruction limit")
+    run.add_argument("--repeat", type=int, default=3)
+
+    cmp = commands.add_parser(
+        "compare", help="flag regressions against a baseline")
+    cmp.add_argument("baseline", type=Path)
+    cmp.add_argument("current", type=Path)
+    cmp.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite(args.scale, args.repeat)
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+        for metric in results["metrics"].values():
+            print(f"{metric['name']:<50} {metric['value']:>14.0f}"
+                  f" {metric['unit']}")
+        return
+
+    compared, regressions = compare(
+        json.loads(args.baseline.read_text()),
+        json.loads(args.current.read_text()),
+        args.threshold,
+    )
+    print(format_comparison(compared, args.threshold))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
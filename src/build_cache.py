@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.compiler import (
+    COMPILER_VERSION,
+    LabelsMap,
+    ParsedLine,
+    compile_with_labels,
+    parse_line,
+    write_labels,
+)
+from src.isa import Program, pack_program, unpack_program
+
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get("ASSTROK_CACHE_DIR", Path.home() / ".cache" / "asstrok"))
+# parsed lines an IncrementalCompiler keeps, the least recently used go
+# first
+MAX_PARSED_LINES = 1 << 16
+
+
+def source_key(source: str, optimize: bool = False) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"asstrok {COMPILER_VERSION} O{int(optimize)}\n".encode())
+    digest.update(source.encode())
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    # concurrent builds of the same source race on the same key, readers
+    # must never see a half written artifact
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class IncrementalCompiler:
+    # keeps the parse of recently seen lines, after an edit only new lines
+    # are parsed again, jumps are resolved through the fixup table anyway
+    lines: OrderedDict[str, ParsedLine]
+    max_lines: int
+    parsed: int
+    reused: int
+
+    def __init__(self, max_lines: int = MAX_PARSED_LINES) -> None:
+        if max_lines < 1:
+            raise ValueError(f"max_lines must be positive, got {max_lines}")
+        self.lines = OrderedDict()
+        self.max_lines = max_lines
+        self.parsed = 0
+        self.reused = 0
+
+    def parse(self, line: str) -> ParsedLine:
+        lines = self.lines
+        parsed = lines.get(line)
+        if parsed is None:
+            parsed = lines[line] = parse_line(line)
+            self.parsed += 1
+            if len(lines) > self.max_lines:
+                lines.popitem(last=False)
+        else:
+            lines.move_to_end(line)
+            self.reused += 1
+        return parsed
+
+    def compile(
+        self, source: str, optimize: bool = False
+    ) -> tuple[Program, LabelsMap]:
+        return compile_with_labels(source, optimize, self.parse)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
+
+class BuildCache:
+    # content addressed: <key>.bin and <key>.labels.json per compiled source
+    root: Path
+    compiler: IncrementalCompiler
+    stats: CacheStats
+
+    def __init__(self, root: Path = DEFAULT_CACHE_DIR) -> None:
+        self.root = root
+        self.compiler = IncrementalCompiler()
+        self.stats = CacheStats()
+
+    def paths(self, key: str) -> tuple[Path, Path]:
+        return self.root / f"{key}.bin", self.root / f"{key}.labels.json"
+
+    def get(self, key: str) -> tuple[Program, LabelsMap] | None:
+        binary_path, labels_path = self.paths(key)
+        try:
+            binary = binary_path.read_bytes()
+            labels = json.loads(labels_path.read_text())
+        except FileNotFoundError:
+            return None
+        return unpack_program(binary), labels
+
+    def put(self, key: str, program: Program, labels: LabelsMap) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        binary_path, labels_path = self.paths(key)
+        # labels first, a present .bin means the entry is complete
+        _write_atomic(labels_path, json.dumps(labels).encode())
+        _write_atomic(binary_path, pack_program(program))
+
+    def build(
+        self, source: str, optimize: bool = False
+    ) -> tuple[Program, LabelsMap]:
+        key = source_key(source, optimize)
+        cached = self.get(key)
+        if cached is not None:
+            self.stats.hits += 1
+            return cached
+        self.stats.misses += 1
+        program, labels = self.compiler.compile(source, optimize)
+        self.put(key, program, labels)
+        return program, labels
+
+    def build_file(
+        self, source_path: Path, optimize: bool = False
+    ) -> tuple[Program, LabelsMap]:
+        return self.build(source_path.read_text(), optimize)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compile through the content addressed build cache")
+    parser.add_argument("source", type=Path)
+    parser.add_argument("-O", dest="optimize", action="store_true")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    program, labels = BuildCache(args.cache_dir).build_file(
+        args.source, args.optimize)
+    args.source.with_suffix(".bin").write_bytes(pack_program(program))
+    write_labels(labels, args.source.with_suffix(".labels.json"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import random
+from collections.abc import MutableSequence
+from dataclasses import dataclass, field
+from enum import Enum
+
+
+class Replacement(Enum):
+    LRU = "lru"
+    FIFO = "fifo"
+    RANDOM = "random"
+
+
+class WritePolicy(Enum):
+    # write-through does not allocate lines on write misses,
+    # write-back allocates and defers the memory write until eviction
+    WRITE_THROUGH = "write-through"
+    WRITE_BACK = "write-back"
+
+
+@dataclass
+class CacheConfig:
+    sets: int = 16
+    ways: int = 1
+    line_size: int = 4  # words per line
+    replacement: Replacement = Replacement.LRU
+    write_policy: WritePolicy = WritePolicy.WRITE_BACK
+    # latencies are in ticks, the first tick of every access is already
+    # paid by the instruction itself, the rest stalls the control unit
+    hit_latency: int = 1
+    miss_latency: int = 10
+    writeback_latency: int = 10
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        if self.sets < 1 or self.ways < 1 or self.line_size < 1:
+            raise ValueError(f"Invalid cache geometry: {self}")
+        if min(self.hit_latency, self.miss_latency) < 1:
+            raise ValueError("Cache latencies must be at least one tick")
+
+    @classmethod
+    def direct_mapped(cls, lines: int, **kwargs: object) -> "CacheConfig":
+        return cls(sets=lines, ways=1, **kwargs)  # type: ignore
+
+    @classmethod
+    def fully_associative(cls, lines: int, **kwargs: object) -> "CacheConfig":
+        return cls(sets=1, ways=lines, **kwargs)  # type: ignore
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    writebacks: int = 0
+    stall_ticks: int = 0
+
+    @property
+    def accesses(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.accesses if self.accesses else 0.0
+
+
+@dataclass
+class CacheLine:
+    block: int
+    data: list[int]
+    dirty: bool = False
+
+
+@dataclass
+class CacheSet:
+    # lines are kept in replacement order, the victim is always lines[0]
+    lines: list[CacheLine] = field(default_factory=list)
+
+
+class Cache:
+    config: CacheConfig
+    # datapath.Memory: a list of ints or a typed, possibly mapped, array
+    memory: MutableSequence[int] | memoryview
+    sets: list[CacheSet]
+    stats: CacheStats
+    pending_stall: int
+
+    def __init__(
+        self, config: CacheConfig, memory: MutableSequence[int] | memoryview
+    ) -> None:
+        self.config = config
+        self.memory = memory
+        self.sets = [CacheSet() for _ in range(config.sets)]
+        self.stats = CacheStats()
+        self.pending_stall = 0
+        self._random = random.Random(config.seed)
+
+    def _locate(self, addr: int) -> tuple[CacheSet, int, int]:
+        if not 0 <= addr < len(self.memory):
+            raise IndexError(f"Address {addr} is out of data memory")
+        block, offset = divmod(addr, self.config.line_size)
+        return self.sets[block % self.config.sets], block, offset
+
+    def _lookup(self, cache_set: CacheSet, block: int) -> CacheLine | None:
+        for i, line in enumerate(cache_set.lines):
+            if line.block == block:
+                if self.config.replacement == Replacement.LRU:
+                    cache_set.lines.append(cache_set.lines.pop(i))
+                return line
+        return None
+
+    def _stall(self, latency: int) -> None:
+        self.pending_stall += latency - 1
+        self.stats.stall_ticks += latency - 1
+
+    def _write_back(self, line: CacheLine) -> None:
+        base = line.block * self.config.line_size
+        memory = self.memory
+        for offset, value in enumerate(line.data):
+            memory[base + offset] = value
+        line.dirty = False
+        self.stats.writebacks += 1
+
+    def _fill(self, cache_set: CacheSet, block: int) -> CacheLine:
+        latency = self.config.miss_latency
+        if len(cache_set.lines) == self.config.ways:
+            if self.config.replacement == Replacement.RANDOM:
+                victim_index = self._random.randrange(self.config.ways)
+            else:
+                victim_index = 0
+            victim = cache_set.lines.pop(victim_index)
+            self.stats.evictions += 1
+            if victim.dirty:
+                self._write_back(victim)
+                latency += self.config.writeback_latency
+        base = block * self.config.line_size
+        # a copy: a slice of a memoryview would alias memory and write
+        # every store through
+        line = CacheLine(
+            block, list(self.memory[base:base + self.config.line_size]))
+        cache_set.lines.append(line)
+        self._stall(latency)
+        return line
+
+    def read(self, addr: int) -> int:
+        cache_set, block, offset = self._locate(addr)
+        line = self._lookup(cache_set, block)
+        if line is None:
+            self.stats.misses += 1
+            line = self._fill(cache_set, block)
+        else:
+            self.stats.hits += 1
+            self._stall(self.config.hit_latency)
+        return line.data[offset]
+
+    def write(self, addr: int, value: int) -> None:
+        cache_set, block, offset = self._locate(addr)
+        line = self._lookup(cache_set, block)
+        if line is not None:
+            self.stats.hits += 1
+            self._stall(self.config.hit_latency)
+        else:
+            self.stats.misses += 1
+            if self.config.write_policy == WritePolicy.WRITE_BACK:
+                line = self._fill(cache_set, block)
+            else:
+                self._stall(self.config.miss_latency)
+
+        if self.config.write_policy == WritePolicy.WRITE_THROUGH:
+            self.memory[addr] = value
+            if line is not None:
+                line.data[offset] = value
+        else:
+            assert line is not None
+            line.data[offset] = value
+            line.dirty = True
+
+    def peek(self, addr: int) -> int:
+        # the value a read would return, without touching stats or the
+        # replacement order
+        cache_set, block, offset = self._locate(addr)
+        for line in cache_set.lines:
+            if line.block == block:
+                return line.data[offset]
+        return self.memory[addr]
+
+    def overlay(self, cells: list[int], start: int = 0) -> None:
+        # replaces cells[i], a copy of memory[start + i], with the cached
+        # value, so dirty lines show up before they are written back
+        line_size, stop = self.config.line_size, start + len(cells)
+        for cache_set in self.sets:
+            for line in cache_set.lines:
+                base = line.block * line_size
+                if base >= stop or base + line_size <= start:
+                    continue
+                for addr in range(max(base, start), min(base + line_size, stop)):
+                    cells[addr - start] = line.data[addr - base]
+
+    def take_stall(self) -> int:
+        stall, self.pending_stall = self.pending_stall, 0
+        return stall
+
+    def flush(self) -> None:
+        for cache_set in self.sets:
+            for line in cache_set.lines:
+                if line.dirty:
+                    self._write_back(line)
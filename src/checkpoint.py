@@ -0,0 +1,151 @@
+import itertools
+import struct
+import zlib
+from array import array
+from collections.abc import Iterable
+from pathlib import Path
+from typing import TextIO
+
+from src.io_ports import StreamOutput
+from src.isa import pack_program, unpack_program
+from src.machine import Engine, Machine
+from src.machine_config import MachineConfig
+from src.trace import TraceSink
+
+CHECKPOINT_MAGIC = b"ASTRCKP2"
+
+# pc, tick, r1, r2, alu_l, alu_r, alu_out, data_out, sp, stack base,
+# word width, memory cells, interruption flag, inputs taken, queued inputs (-1 when the
+# input is streamed), output values kept (-1 when streamed), output written,
+# program size, engine name size
+_HEADER = struct.Struct("<12q?6q")
+
+
+def _words(values: Iterable[int]) -> bytes:
+    return array("q", values).tobytes()
+
+
+def dumps(machine: Machine) -> bytes:
+    dp, cu, io = machine.datapath, machine.cu, machine.io_controller
+    if dp.cache is not None:
+        raise ValueError("Cannot checkpoint a machine with a data cache")
+
+    program = pack_program(machine.program)
+    engine = machine.engine.encode()
+    queued = -1 if io.streaming else len(io.input_buffer)
+    if isinstance(io.output_buffer, StreamOutput):
+        output_values: list[int] = []
+        kept, written = -1, len(io.output_buffer)
+    else:
+        output_values = io.output_buffer
+        kept, written = len(output_values), len(output_values)
+
+    header = _HEADER.pack(
+        cu.program_counter, cu._tick,
+        dp.r1, dp.r2, dp.alu_l, dp.alu_r, dp.alu_out, dp.data_out,
+        dp.stack_pointer, dp.stack_base, dp.config.word_width,
+        len(dp.data_memory), io.interruption_flag, io.inputs_taken,
+        queued, kept, written, len(program), len(engine),
+    )
+    payload = b"".join([
+        header,
+        program,
+        engine,
+        _words(dp.data_memory),
+        _words(itertools.chain.from_iterable(io.input_buffer))
+        if queued != -1 else b"",
+        _words(output_values),
+    ])
+    return CHECKPOINT_MAGIC + zlib.compress(payload)
+
+
+def loads(
+    data: bytes,
+    input_events: Iterable[tuple[int, int]] | None = None,
+    output: TextIO | None = None,
+) -> Machine:
+    # a checkpoint of a streamed run only stores how many inputs were
+    # taken, the same input stream has to be supplied again to resume it
+    if not data.startswith(CHECKPOINT_MAGIC):
+        raise ValueError("Not a machine checkpoint")
+    payload = zlib.decompress(data[len(CHECKPOINT_MAGIC):])
+    (pc, tick, r1, r2, alu_l, alu_r, alu_out, data_out, sp, stack_base,
+     word_width, memory_size, interruption_flag, inputs_taken, queued, kept, written,
+     program_size, engine_size) = _HEADER.unpack_from(payload)
+
+    offset = _HEADER.size
+
+    def take(size: int) -> bytes:
+        nonlocal offset
+        chunk = payload[offset:offset + size]
+        offset += size
+        return chunk
+
+    def take_words(count: int) -> list[int]:
+        words = array("q")
+        words.frombytes(take(count * words.itemsize))
+        return words.tolist()
+
+    program = unpack_program(take(program_size))
+    engine: Engine = take(engine_size).decode()  # type: ignore
+    memory = take_words(memory_size)
+
+    machine = Machine(config=MachineConfig(memory_size, word_width, stack_base))
+    machine.load_program(program, engine)
+    dp, cu, io = machine.datapath, machine.cu, machine.io_controller
+    cu.program_counter, cu._tick = pc, tick
+    dp.r1, dp.r2, dp.alu_l, dp.alu_r, dp.alu_out, dp.data_out = (
+        r1, r2, alu_l, alu_r, alu_out, data_out)
+    dp.stack_pointer = sp
+    dp.data_memory[:] = memory
+
+    io.interruption_flag = interruption_flag
+    if queued != -1:
+        flat = take_words(queued * 2)
+        io.load_input(list(zip(flat[::2], flat[1::2], strict=True)))
+    elif input_events is not None:
+        io.load_input(itertools.islice(input_events, inputs_taken, None))
+    else:
+        raise ValueError("Checkpoint of a streamed run needs its input events")
+    io.inputs_taken = inputs_taken
+
+    if output is not None:
+        io.output_buffer = StreamOutput(output)
+        io.output_buffer.written = written
+    elif kept != -1:
+        io.output_buffer = take_words(kept)
+    return machine
+
+
+def save_checkpoint(machine: Machine, path: Path) -> None:
+    path.write_bytes(dumps(machine))
+
+
+def load_checkpoint(
+    path: Path,
+    input_events: Iterable[tuple[int, int]] | None = None,
+    output: TextIO | None = None,
+) -> Machine:
+    return loads(path.read_bytes(), input_events, output)
+
+
+def run_with_checkpoints(
+    machine: Machine,
+    path: Path,
+    every: int,
+    limit: int = 100000,
+    trace: TraceSink | None = None,
+) -> None:
+    # same contract as Machine.run, with a checkpoint every `every`
+    # instructions so an interrupted run can be resumed from `path`
+    done = 0
+    while done < limit:
+        step = min(every, limit - done)
+        try:
+            machine.run(step, trace)
+        except StopIteration as e:
+            if e.value != "limit":
+                raise
+        done += step
+        save_checkpoint(machine, path)
+    raise StopIteration("limit")
@@ -1,7 +1,12 @@
+import json
+import re
 import sys
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import NamedTuple
 
+from src import optimizer
 from src.isa import (
     ArithmeticInstructionImm,
     ArithmeticInstructionReg,
@@ -21,139 +26,312 @@ from src.isa import (
     pack_program,
 )
 
+LabelsMap = dict[str, int]
 
-def get_meaningful_token(line: str) -> str:
-    return line.split(";", 1)[0].strip()
+# bump whenever the same source would compile to a different binary
+COMPILER_VERSION = "3"
 
+# words are separated by whitespace and/or commas, ; starts a comment
+_WORD = re.compile(r"[^\s,;]+")
 
-def extract_labels(lines: List[str]) -> Tuple[List[str], Dict[str, int], int]:
-    labels: Dict[str, int] = {}
-    clean_lines: List[str] = []
-    # entry point of the program
-    start = 0
 
-    for line in lines:
-        line = get_meaningful_token(line)
-        if not line:
-            continue
+class Token(NamedTuple):
+    text: str
+    line: int
+    column: int
 
-        pc = len(clean_lines)
-        parts = line.split()
-        # If the line store the label and the instruction
-        if parts[0].endswith(":") and len(parts) > 1:
-            label = parts[0][:-1]
-            assert label not in labels, f"Label {label} already defined"
-            labels[label] = pc
-            clean_lines.append(" ".join(parts[1:]))
-            start = pc if parts[0] == "START:" else start
-        # If the line store only the label
-        elif parts[0].endswith(":"):
-            label = parts[0][:-1]
-            assert label not in labels, f"Label {label} already defined"
-            labels[label] = pc
-            start = pc if parts[0] == "START:" else start
-        else:
-            clean_lines.append(line)
-
-    return clean_lines, labels, start
-
-
-LabelsMap = Dict[str, int]
-
-
-def replace_labels_with_addresses(
-    lines: List[str],
-    labels: LabelsMap,
-) -> List[str]:
-    replaced_lines = []
-
-    for line in lines:
-        parts = line.split()
-        if parts[0] in {"JMP", "JE", "CALL"} and parts[-1] in labels:
-            parts[-1] = str(labels[parts[-1]])
-        elif parts[0] not in {"JMP", "JE", "CALL"} and parts[-1] in labels:
-            raise ValueError(
-                f"Label {parts[-1]} is not allowed with {parts[0]}")
-        replaced_lines.append(" ".join(parts))
-
-    return replaced_lines
-
-
-def parse_instructions(lines: List[str], start: int) -> Program:
-    program: List[Instruction] = []
-    for line in lines:
-        parts = [
-            part.strip(",")
-            for part in line.strip().split()
-        ]
-        if not parts or parts[0].startswith(';'):
-            continue  # Skip empty lines and comments
-
-        opcode = Opcode[parts[0]]
-        if opcode in {Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV}:
-            dest = Registers[parts[1]]
-            if parts[2] in {"R1", "R2"}:
-                src = Registers[parts[2]]
-                program.append(ArithmeticInstructionReg(
-                    opcode, dest, src))  # type: ignore
-            else:
-                program.append(ArithmeticInstructionImm(
-                    opcode, dest, int(parts[2])))  # type: ignore
-        elif opcode == Opcode.RET:
-            program.append(RetInstruction(opcode))
-        elif opcode == Opcode.CALL:
-            addr = int(parts[1])
-            program.append(CallInstruction(opcode, addr))
-        elif opcode == Opcode.JMP:
-            addr = int(parts[1])
-            program.append(JumpInstruction(opcode, addr))
-        elif opcode == Opcode.JE:
-            src = Registers[parts[1]]
-            addr = int(parts[2])
-            program.append(JumpEqInstruction(opcode, src, addr))
-        elif opcode in {Opcode.LD, Opcode.ST}:
-            dest = Registers[parts[1]]
-            if parts[2] in {"R1", "R2"}:
-                r = Registers[parts[2]]
-                program.append(IOMemoryInstructionReg(opcode, dest, r))  # type: ignore
-            else:
-                addr = int(parts[2])
-                program.append(IOMemoryInstructionImm(opcode, dest, addr))  # type: ignore
 
-        elif opcode == Opcode.OUT:
-            src = Registers[parts[1]]
-            program.append(IOOutInstruction(opcode, src))
-        elif opcode == Opcode.HLT:
-            program.append(ManagementInstruction(opcode))
-        elif opcode == Opcode.RST:
-            program.append(IORstInstruction(opcode))
-        else:
-            raise ValueError(f"Unknown opcode: {parts[0]} at:\n{line}")
+def tokenize_line(text: str, line: int = 0) -> list[Token]:
+    code = text.split(";", 1)[0]
+    return [
+        Token(match.group(), line, match.start() + 1)
+        for match in _WORD.finditer(code)
+    ]
+
+
+def tokenize(source: str) -> Iterator[Token]:
+    for line, text in enumerate(source.splitlines(), start=1):
+        yield from tokenize_line(text, line)
+
+
+@dataclass
+class Diagnostic:
+    line: int  # 0 when the error is about the whole source
+    column: int
+    message: str
+
+    def __str__(self) -> str:
+        if not self.line:
+            return self.message
+        return f"{self.line}:{self.column}: {self.message}"
+
+
+class CompileError(ValueError):
+    diagnostics: list[Diagnostic]
+
+    def __init__(self, diagnostics: list[Diagnostic]) -> None:
+        self.diagnostics = diagnostics
+        super().__init__("\n".join(str(d) for d in diagnostics))
+
+
+class _SyntaxError(Exception):
+    # raised while parsing a line, index is the offending word
+    index: int
+    message: str
+
+    def __init__(self, index: int, message: str) -> None:
+        self.index = index
+        self.message = message
+
+
+class ParsedLine(NamedTuple):
+    label: str | None
+    instruction: Instruction | None
+    # JMP/JE/CALL are built once their target is known:
+    # (opcode, register tested by JE, label or address)
+    jump: tuple[Opcode, Registers | None, str] | None
+    # (column, message)
+    errors: tuple[tuple[int, str], ...]
+
+
+_EMPTY = ParsedLine(None, None, None, ())
+
+_REGISTERS = {"R1": Registers.R1, "R2": Registers.R2}
+
+OperandParser = Callable[[Opcode, list[str]], ParsedLine]
+
+
+def _register(parts: list[str], index: int) -> Registers:
+    register = _REGISTERS.get(parts[index])
+    if register is None:
+        raise _SyntaxError(
+            index, f"Expected register R1 or R2, got {parts[index]!r}")
+    return register
+
+
+def _immediate(parts: list[str], index: int) -> int:
+    try:
+        return int(parts[index])
+    except ValueError:
+        raise _SyntaxError(
+            index, f"Expected register or number, got {parts[index]!r}"
+        ) from None
+
+
+def _arithmetic(opcode: Opcode, parts: list[str]) -> ParsedLine:
+    dest = _register(parts, 1)
+    src = _REGISTERS.get(parts[2])
+    if src is not None:
+        instr: Instruction = ArithmeticInstructionReg(
+            opcode, dest, src)  # type: ignore
+    else:
+        instr = ArithmeticInstructionImm(
+            opcode, dest, _immediate(parts, 2))  # type: ignore
+    return ParsedLine(None, instr, None, ())
+
+
+def _memory(opcode: Opcode, parts: list[str]) -> ParsedLine:
+    dest = _register(parts, 1)
+    src = _REGISTERS.get(parts[2])
+    if src is not None:
+        instr: Instruction = IOMemoryInstructionReg(
+            opcode, dest, src)  # type: ignore
+    else:
+        instr = IOMemoryInstructionImm(
+            opcode, dest, _immediate(parts, 2))  # type: ignore
+    return ParsedLine(None, instr, None, ())
+
+
+def _jump(opcode: Opcode, parts: list[str]) -> ParsedLine:
+    return ParsedLine(None, None, (opcode, None, parts[1]), ())
+
 
-    return Program(start, program)
+def _jump_eq(opcode: Opcode, parts: list[str]) -> ParsedLine:
+    return ParsedLine(None, None, (opcode, _register(parts, 1), parts[2]), ())
 
 
-def compile(source: str) -> Program:
+def _out(opcode: Opcode, parts: list[str]) -> ParsedLine:
+    return ParsedLine(
+        None, IOOutInstruction(opcode, _register(parts, 1)), None, ())  # type: ignore
+
+
+def _no_operands(make: Callable[[Opcode], Instruction]) -> OperandParser:
+    return lambda opcode, parts: ParsedLine(None, make(opcode), None, ())
+
+
+# mnemonic -> (opcode, number of words with the mnemonic, operand parser)
+_SYNTAX: dict[str, tuple[Opcode, int, OperandParser]] = {
+    "ADD": (Opcode.ADD, 3, _arithmetic),
+    "SUB": (Opcode.SUB, 3, _arithmetic),
+    "MUL": (Opcode.MUL, 3, _arithmetic),
+    "DIV": (Opcode.DIV, 3, _arithmetic),
+    "LD": (Opcode.LD, 3, _memory),
+    "ST": (Opcode.ST, 3, _memory),
+    "JMP": (Opcode.JMP, 2, _jump),
+    "CALL": (Opcode.CALL, 2, _jump),
+    "JE": (Opcode.JE, 3, _jump_eq),
+    "OUT": (Opcode.OUT, 2, _out),
+    "RET": (Opcode.RET, 1, _no_operands(RetInstruction)),  # type: ignore
+    "RST": (Opcode.RST, 1, _no_operands(IORstInstruction)),  # type: ignore
+    "HLT": (Opcode.HLT, 1, _no_operands(ManagementInstruction)),  # type: ignore
+}
+
+
+def _column(text: str, index: int) -> int:
+    # only computed for diagnostics, the parser itself works on plain words
+    tokens = tokenize_line(text)
+    if index < len(tokens):
+        return tokens[index].column
+    return len(text.split(";", 1)[0].rstrip()) + 1
+
+
+def parse_line(text: str) -> ParsedLine:
+    # [LABEL:] [MNEMONIC [operand[,] ...]] [; comment]
+    code = text.split(";", 1)[0] if ";" in text else text
+    parts = code.replace(",", " ").split()
+    if not parts:
+        return _EMPTY
+
+    label = None
+    if parts[0][-1] == ":":
+        label = parts[0][:-1]
+        parts = parts[1:]
+        if not parts:
+            return ParsedLine(label, None, None, ())
+
+    try:
+        syntax = _SYNTAX.get(parts[0])
+        if syntax is None:
+            raise _SyntaxError(0, f"Unknown instruction {parts[0]!r}")
+        opcode, size, parse_operands = syntax
+        if len(parts) != size:
+            raise _SyntaxError(
+                min(len(parts), size),
+                f"{parts[0]} takes {size - 1} operand(s), got {len(parts) - 1}",
+            )
+        parsed = parse_operands(opcode, parts)
+    except _SyntaxError as e:
+        column = _column(text, e.index + (label is not None))
+        return ParsedLine(label, None, None, ((column, e.message),))
+    return parsed if label is None else parsed._replace(label=label)
+
+
+LineParser = Callable[[str], ParsedLine]
+
+
+def _make_jump(
+    opcode: Opcode, src: Registers | None, addr: int
+) -> Instruction:
+    if opcode == Opcode.JMP:
+        return JumpInstruction(opcode, addr)  # type: ignore
+    if opcode == Opcode.CALL:
+        return CallInstruction(opcode, addr)  # type: ignore
+    return JumpEqInstruction(opcode, src, addr)  # type: ignore
+
+
+class _ParsedLines(dict[str, ParsedLine]):
+    # a line parses the same wherever it is. Lives for one compile, real
+    # programs repeat lines such as OUT R1 or RST often enough to gain
+    # from it and nothing is reused across compiles.
+    def __missing__(self, text: str) -> ParsedLine:
+        parsed = self[text] = parse_line(text)
+        return parsed
+
+
+def _target_column(text: str) -> int:
+    # the target is the last word of a JMP/JE/CALL line
+    return tokenize_line(text)[-1].column
+
+
+def compile_with_labels(
+    source: str, optimize: bool = False, parse: LineParser | None = None
+) -> tuple[Program, LabelsMap]:
+    # one pass over the lines, jump targets go into a fixup table that is
+    # resolved once every label is known. PC 0 is always CALL INT, every
+    # error is collected before CompileError is raised.
     lines = source.splitlines()
-    lines.insert(0, "CALL INT")
-    clean_lines, labels, start = extract_labels(lines)
-    if "INT" and "START" not in labels:
-        raise ValueError("INT and START labels are required")
+    labels: LabelsMap = {}
+    instructions: list[Instruction | None] = [None]
+    # (pc, line, opcode, JE register, label or address)
+    fixups: list[tuple[int, int, Opcode, Registers | None, str]] = [
+        (0, 0, Opcode.CALL, None, "INT")]
+    diagnostics: list[Diagnostic] = []
+    if parse is None:
+        parse = _ParsedLines().__getitem__
+
+    for line, text in enumerate(lines, start=1):
+        parsed = parse(text)
+        if parsed is _EMPTY:
+            continue
+        label, instr, jump, errors = parsed
+        if label is not None:
+            if label in labels:
+                diagnostics.append(Diagnostic(
+                    line, _column(text, 0), f"Label {label} already defined"))
+            else:
+                labels[label] = len(instructions)
+        if errors:
+            diagnostics.extend(
+                Diagnostic(line, column, message) for column, message in errors)
+            instructions.append(None)
+        elif jump is not None:
+            fixups.append((len(instructions), line, *jump))
+            instructions.append(None)
+        elif instr is not None:
+            instructions.append(instr)
+
+    if "INT" not in labels or "START" not in labels:
+        diagnostics.append(Diagnostic(0, 0, "INT and START labels are required"))
+        fixups = fixups[1:]
+
+    for pc, line, opcode, src, target in fixups:
+        addr = labels.get(target)
+        if addr is None:
+            try:
+                addr = int(target)
+            except ValueError:
+                diagnostics.append(Diagnostic(
+                    line, _target_column(lines[line - 1]),
+                    f"Unknown label {target}"))
+                continue
+        instructions[pc] = _make_jump(opcode, src, addr)
+
+    if diagnostics:
+        diagnostics.sort(key=lambda d: (d.line, d.column))
+        raise CompileError(diagnostics)
+
+    program = Program(labels["START"], instructions)  # type: ignore
+    if optimize:
+        program, labels, _ = optimizer.optimize(program, labels)
+    return program, labels
+
+
+def compile(source: str, optimize: bool = False) -> Program:
+    return compile_with_labels(source, optimize)[0]
+
 
-    replaced_lines = replace_labels_with_addresses(clean_lines, labels)
-    return parse_instructions(replaced_lines, start)
+def write_labels(labels: LabelsMap, labels_path: Path) -> None:
+    labels_path.write_text(json.dumps(labels, indent=2) + "\n")
 
 
-def main(source_path: Path, output_path: Path) -> None:
+def main(
+    source_path: Path,
+    output_path: Path,
+    labels_path: Path | None = None,
+    optimize: bool = False,
+) -> None:
     with source_path.open() as f:
         source = f.read()
 
-    program = compile(source)
+    program, labels = compile_with_labels(source, optimize)
     output_path.write_bytes(pack_program(program))
+    if labels_path is not None:
+        write_labels(labels, labels_path)
 
 
 if __name__ == "__main__":
-    assert len(sys.argv) == 2, "Usage: python compiler.py <source.asm>"
+    assert len(sys.argv) in (2, 3) and sys.argv[2:] in ([], ["-O"]), (
+        "Usage: python compiler.py <source.asm> [-O]")
     path = Path(sys.argv[1])
     output = path.with_suffix(".bin")
-    main(path, output)
+    main(path, output, path.with_suffix(".labels.json"), sys.argv[2:] == ["-O"])
@@ -20,6 +20,7 @@ from src.isa import (
     RetInstruction,
 )
 from src.machine_signals import Signals
+from src.profiler import Profiler
 
 
 class ControlUnit:
@@ -30,18 +31,27 @@ class ControlUnit:
 
     program_counter: int
     _tick: int
+    # told about every instruction start and interrupt by Machine.run
+    profiler: Optional[Profiler]
 
     def __init__(
-        self, program: Program, data_path: DataPath, controller: IOController
+        self,
+        program: Program,
+        data_path: DataPath,
+        controller: IOController,
+        profiler: Optional[Profiler] = None,
     ) -> None:
         self.program = program
         self.data_path = data_path
         self.controller = controller
         self.program_counter = 0
         self._tick = 0
+        self.profiler = profiler
 
     def tick(self) -> None:
         self._tick += 1
+        if self.data_path.cache is not None:
+            self._tick += self.data_path.cache.take_stall()
 
     def signal_latch_program_counter(
         self,
@@ -205,7 +215,7 @@ class ControlUnit:
 
             self.program_counter = 0
             self.data_path.signal_latch_r2(
-                Signals.INPUT, self.controller.input_buffer.pop(0)[1]
+                Signals.INPUT, self.controller.pop_input()
             )
             self.tick()
         
@@ -213,8 +223,8 @@ class ControlUnit:
         datapath_repr = f"R1: {self.data_path.r1}\tR2: {self.data_path.r2}\tSP: {self.data_path.stack_pointer}"  # noqa: E501
         cu_repr = f"TICK: {self._tick}\tPC: {self.program_counter}"
         instr_repr = self.program.instructions[self.program_counter]
-        mem_repr = f"MEMORY: {self.data_path.data_memory[:10]}"
-        stack_repr = f"STACK: {self.data_path.data_memory[self.data_path.stack_pointer + 1:]}"  # noqa: E501
+        mem_repr = f"MEMORY: {self.data_path.memory_cells(0, 10)}"
+        stack_repr = f"STACK: {self.data_path.memory_cells(self.data_path.stack_pointer + 1)}"  # noqa: E501
         alu_repr = f"ALU_L: {self.data_path.alu_l}\tALU_R: {self.data_path.alu_r}\tALU_OUT: {self.data_path.alu_out}"  # noqa: E501
 
         if self.controller.interruption_flag:
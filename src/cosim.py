@@ -0,0 +1,309 @@
+import argparse
+import copy
+import sys
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src.io_ports import read_input_events
+from src.isa import Program, unpack_program
+from src.machine import Engine, Machine, StopReason
+from src.machine_config import MachineConfig, WordWidth
+from src.trace import NullTraceSink
+
+# Lockstep co-simulation: the reference runs on the "signal" engine, the
+# candidate on a faster one, both are advanced by the same number of
+# instructions and compared at every check. A divergence is narrowed down
+# by replaying both machines to the last agreeing check with the same
+# strides, then advancing copies of them by 1, 2, ... instructions in one
+# call each until the first copy that differs.
+REFERENCE: Engine = "signal"
+# instructions between checks. Compiled blocks and superinstructions only
+# run when they fit in a stride, a stride of 1 never exercises them.
+DEFAULT_EVERY = 64
+REGISTERS = ("tick", "pc", "r1", "r2", "sp")
+# memory cells shown in a divergence report
+MAX_CELLS = 8
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    status: str  # "running", "halt" or "error: <message>"
+    tick: int
+    pc: int
+    r1: int
+    r2: int
+    sp: int
+    memory: list[int] = field(repr=False)
+    output: list[int]
+
+
+def snapshot(machine: Machine, status: str) -> Snapshot:
+    dp, cu = machine.datapath, machine.cu
+    return Snapshot(
+        status, cu._tick, cu.program_counter, dp.r1, dp.r2, dp.stack_pointer,
+        dp.memory_cells(), list(machine.io_controller.output_buffer),
+    )
+
+
+@dataclass(frozen=True)
+class Divergence:
+    engine: Engine
+    # instructions executed when the states first differ
+    instructions: int
+    reference: Snapshot
+    candidate: Snapshot
+
+    def diff(self) -> list[tuple[str, object, object]]:
+        # (field, reference value, candidate value), memory cells as mem[addr]
+        ref, cand = self.reference, self.candidate
+        diff: list[tuple[str, object, object]] = [
+            (name, getattr(ref, name), getattr(cand, name))
+            for name in ("status", *REGISTERS)
+            if getattr(ref, name) != getattr(cand, name)
+        ]
+        diff.extend(
+            (f"mem[{addr}]", a, b)
+            for addr, (a, b) in enumerate(zip(ref.memory, cand.memory,
+                                              strict=True))
+            if a != b
+        )
+        if ref.output != cand.output:
+            diff.append(("output", ref.output, cand.output))
+        return diff
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.engine} diverges from {REFERENCE} at tick "
+            f"{self.reference.tick} after {self.instructions} instructions"
+        ]
+        cells = 0
+        for name, ref, cand in self.diff():
+            if name.startswith("mem["):
+                cells += 1
+                if cells > MAX_CELLS:
+                    continue
+            lines.append(f"  {name}: {ref} != {cand}")
+        if cells > MAX_CELLS:
+            lines.append(f"  ... {cells - MAX_CELLS} more cells")
+        return "\n".join(lines)
+
+
+@dataclass(frozen=True)
+class CosimResult:
+    engine: Engine
+    # instructions the reference executed up to the last comparison
+    instructions: int
+    # "halt", "limit" or "error: <message>" on both sides, or "diverged"
+    status: str
+    divergence: Divergence | None
+
+    @property
+    def ok(self) -> bool:
+        return self.divergence is None
+
+
+def _advance(machine: Machine, n: int) -> str:
+    # Machine.run executes exactly n instructions on every engine, a
+    # compiled block or superinstruction only runs when it fits in what is
+    # left of n, the instructions that do not fit run one at a time
+    try:
+        machine.run(n, NullTraceSink())
+    except StopIteration as e:
+        return "running" if e.value == "limit" else "halt"
+    except Exception as e:
+        return f"error: {type(e).__name__}: {e}"
+    return "running"
+
+
+def _advance_reference(machine: Machine, n: int) -> tuple[str, int]:
+    # run_until counts the instructions of a stride that ends in HLT
+    try:
+        result = machine.run_until(limit=n)
+    except Exception as e:
+        return f"error: {type(e).__name__}: {e}", n
+    status = "halt" if result.reason == StopReason.HALT else "running"
+    return status, result.instructions
+
+
+def _agree(reference: Machine, candidate: Machine) -> bool:
+    rdp, cdp = reference.datapath, candidate.datapath
+    return (
+        reference.cu._tick == candidate.cu._tick
+        and reference.cu.program_counter == candidate.cu.program_counter
+        and rdp.r1 == cdp.r1 and rdp.r2 == cdp.r2
+        and rdp.stack_pointer == cdp.stack_pointer
+        and rdp.memory_cells() == cdp.memory_cells()
+        and (reference.io_controller.output_buffer
+             == candidate.io_controller.output_buffer)
+    )
+
+
+class Lockstep:
+    reference: Machine
+    candidate: Machine
+    engine: Engine
+    instructions: int
+
+    def __init__(
+        self,
+        program: Program,
+        events: list[tuple[int, int]],
+        engine: Engine,
+        config: MachineConfig | None = None,
+    ) -> None:
+        self.engine = engine
+        self.reference = Machine(config=config)
+        self.candidate = Machine(config=config)
+        self.reference.prepare(events, program, engine=REFERENCE)
+        self.candidate.prepare(events, program, engine=engine)
+        self.instructions = 0
+
+    def advance(self, n: int) -> tuple[str, str]:
+        # statuses of the reference and the candidate after n instructions
+        status, executed = _advance_reference(self.reference, n)
+        self.instructions += executed
+        return status, _advance(self.candidate, n)
+
+    def agree(self, statuses: tuple[str, str]) -> bool:
+        return (statuses[0] == statuses[1]
+                and _agree(self.reference, self.candidate))
+
+    def divergence(self, statuses: tuple[str, str], at: int) -> Divergence:
+        return Divergence(self.engine, at,
+                          snapshot(self.reference, statuses[0]),
+                          snapshot(self.candidate, statuses[1]))
+
+
+def cosimulate(
+    program: Program,
+    events: Iterable[tuple[int, int]] = (),
+    engine: Engine = "fast",
+    every: int = DEFAULT_EVERY,
+    limit: int = 100000,
+    config: MachineConfig | None = None,
+) -> CosimResult:
+    # compares the candidate engine with the reference after every `every`
+    # instructions until both halt, fail the same way or reach limit
+    if every < 1:
+        raise ValueError(f"Check interval must be positive, got {every}")
+    events = list(events)
+    pair = Lockstep(program, events, engine, config)
+    agreed = 0
+    while pair.instructions < limit:
+        stride = min(every, limit - pair.instructions)
+        statuses = pair.advance(stride)
+        if not pair.agree(statuses):
+            divergence = (
+                _first_divergence(program, events, engine, config, every,
+                                  agreed, stride)
+                or pair.divergence(statuses, pair.instructions))
+            return CosimResult(engine, divergence.instructions, "diverged",
+                               divergence)
+        agreed = pair.instructions
+        if statuses[0] != "running":
+            return CosimResult(engine, agreed, statuses[0], None)
+    return CosimResult(engine, agreed, "limit", None)
+
+
+def _first_divergence(
+    program: Program,
+    events: list[tuple[int, int]],
+    engine: Engine,
+    config: MachineConfig | None,
+    every: int,
+    agreed: int,
+    stride: int,
+) -> Divergence | None:
+    # replays both engines to the last agreeing check with the strides
+    # that got there, then advances a copy of the pair by k instructions in
+    # one call for k = 1 .. stride, so blocks and superinstructions run as
+    # they did in the stride that diverged
+    if stride == 1:
+        return None
+    pair = Lockstep(program, events, engine, config)
+    while pair.instructions < agreed:
+        if pair.advance(every) != ("running", "running"):
+            return None
+    # the program is never written, the copies share it
+    memo = {id(program): program}
+    for k in range(1, stride + 1):
+        trial = copy.deepcopy(pair, dict(memo))
+        statuses = trial.advance(k)
+        if not trial.agree(statuses):
+            return trial.divergence(statuses, trial.instructions)
+        if statuses[0] != "running":
+            break
+    return None
+
+
+def assert_cosim(
+    program: Program,
+    events: Iterable[tuple[int, int]] = (),
+    engines: Iterable[Engine] = ("fast", "jit"),
+    every: int = DEFAULT_EVERY,
+    limit: int = 100000,
+    config: MachineConfig | None = None,
+) -> list[CosimResult]:
+    # for tests: raises AssertionError with the state diff of the first
+    # engine that diverges
+    events = list(events)
+    results = []
+    for engine in engines:
+        result = cosimulate(program, events, engine, every, limit, config)
+        if result.divergence is not None:
+            raise AssertionError(str(result.divergence))
+        results.append(result)
+    return results
+
+
+def corpus(paths: Iterable[Path]) -> Iterator[Path]:
+    # .bin files, directories are searched recursively
+    for path in paths:
+        if path.is_dir():
+            yield from sorted(path.rglob("*.bin"))
+        else:
+            yield path
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run engines in lockstep with the signal-level reference")
+    parser.add_argument("programs", type=Path, nargs="+",
+                        help=".bin files or directories of them, a sibling "
+                             ".input file is used as the input stream")
+    parser.add_argument("--engine", action="append",
+                        choices=["fast", "jit"], default=None,
+                        help="candidate engine, repeatable, all by default")
+    parser.add_argument("--every", type=int, default=DEFAULT_EVERY,
+                        help="instructions between state comparisons")
+    parser.add_argument("--limit", type=int, default=100000)
+    parser.add_argument("--memory-size", type=int, default=256,
+                        help="data memory cells")
+    parser.add_argument("--word-width", type=int, default=64,
+                        choices=[16, 32, 64])
+    args = parser.parse_args(argv)
+    word_width: WordWidth = args.word_width
+    config = MachineConfig(args.memory_size, word_width)
+    engines: list[Engine] = args.engine or ["fast", "jit"]
+
+    failed = 0
+    for path in corpus(args.programs):
+        program = unpack_program(path.read_bytes())
+        input_path = path.with_suffix(".input")
+        events = (list(read_input_events(input_path))
+                  if input_path.exists() else [])
+        for engine in engines:
+            result = cosimulate(program, events, engine, args.every,
+                                args.limit, config)
+            if result.divergence is not None:
+                failed += 1
+                print(f"{path}: {result.divergence}")
+            else:
+                print(f"{path}: {engine} ok, {result.status} after "
+                      f"{result.instructions} instructions")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,77 @@
-from typing import List, Literal
+from __future__ import annotations
 
+import mmap
+import os
+import tempfile
+from array import array
+from collections.abc import MutableSequence
+from dataclasses import replace
+from pathlib import Path
+from typing import Literal
+
+from src.cache import Cache, CacheConfig
 from src.isa import Opcode, Registers
+from src.machine_config import MachineConfig
 from src.machine_signals import Signals
 
+# a list of ints, or a typed array of 64-bit cells, possibly mapped
+Memory = MutableSequence[int] | memoryview
+
+MEMORY_TYPECODE = "q"
+_CELL = array(MEMORY_TYPECODE).itemsize
+
+
+def typed_memory(size: int) -> array[int]:
+    return array(MEMORY_TYPECODE, bytes(size * _CELL))
+
+
+def map_memory(
+    path: Path, size: int | None = None, write_through: bool = False
+) -> memoryview:
+    # cells are native 64-bit ints. The default copy on write mapping
+    # only initializes memory from the file, with write_through every
+    # store lands in the file.
+    if write_through:
+        path.touch()
+    with path.open("r+b" if write_through else "rb") as f:
+        length = path.stat().st_size
+        if size is None:
+            size = length // _CELL
+        if write_through and length < size * _CELL:
+            f.truncate(size * _CELL)
+            length = size * _CELL
+        if size == 0 or length < size * _CELL:
+            # a copy on write mapping cannot grow the file
+            memory = typed_memory(size)
+            cells = array(MEMORY_TYPECODE)
+            cells.frombytes(f.read(min(length, size * _CELL) // _CELL * _CELL))
+            memory[:len(cells)] = cells
+            return memoryview(memory)
+        image = mmap.mmap(
+            f.fileno(), size * _CELL,
+            access=mmap.ACCESS_WRITE if write_through else mmap.ACCESS_COPY)
+    return memoryview(image).cast(MEMORY_TYPECODE)
+
+
+def dump_memory(memory: Memory, path: Path) -> None:
+    # written next to path and renamed, truncating a file that is still
+    # mapped, e.g. the image memory was loaded from, would fault readers
+    if isinstance(memory, list):
+        memory = array(MEMORY_TYPECODE, memory)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(memoryview(memory).cast("B"))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
 
 class DataPath:
+    config: MachineConfig
     data_memory_size: int
-    data_memory: List[int]
+    data_memory: Memory
     data_out: int
     r1: int
     r2: int
@@ -14,18 +79,60 @@ class DataPath:
     alu_l: int
     alu_r: int
     stack_pointer: int
+    stack_base: int
+    word_min: int
+    word_max: int
     address_register: int
+    cache: Cache | None
 
-    def __init__(self, data_memory_size: int) -> None:
+    def __init__(
+        self,
+        data_memory_size: int,
+        cache: CacheConfig | None = None,
+        memory: Memory | None = None,
+        config: MachineConfig | None = None,
+    ) -> None:
+        # config brings the word width and stack base, memory replaces the
+        # list of ints, e.g. a typed or mapped array
+        if config is None:
+            config = MachineConfig(
+                data_memory_size if memory is None else len(memory))
+        elif memory is not None and len(memory) != config.data_memory_size:
+            config = replace(config, data_memory_size=len(memory))
+        self.config = config
+        data_memory_size = config.data_memory_size
         self.data_memory_size = data_memory_size
-        self.data_memory = [0] * data_memory_size
+        self.data_memory = (
+            [0] * data_memory_size if memory is None else memory)
+        self.cache = Cache(cache, self.data_memory) if cache else None
         self.r1 = 0
         self.r2 = 0
         self.alu_out = 0
-        self.stack_pointer = data_memory_size - 1
+        self.stack_base = self.stack_pointer = config.initial_stack_pointer
+        self.word_min = config.word_min
+        self.word_max = config.word_max
         self.data_out = 0
         self.alu_l = 0
         self.alu_r = 0
+
+    def read_memory(self, addr: int) -> int:
+        if self.cache is None:
+            return self.data_memory[addr]
+        return self.cache.read(addr)
+
+    def memory_cells(self, start: int = 0, stop: int | None = None) -> list[int]:
+        # memory as the program sees it, dirty cache lines included, for
+        # state dumps and traces, the cache state and stats are untouched
+        cells = list(self.data_memory[start:stop])
+        if self.cache is not None:
+            self.cache.overlay(cells, min(start, len(self.data_memory)))
+        return cells
+
+    def write_memory(self, addr: int, value: int) -> None:
+        if self.cache is None:
+            self.data_memory[addr] = value
+        else:
+            self.cache.write(addr, value)
     
     def signal_latch_r1(self, sel: Signals) -> None:
         if sel == Signals.MEM_DATA_OUT:
@@ -56,16 +163,16 @@ class DataPath:
         addr: int = 0,
     ) -> None:
         if sel == Signals.SP_INC:
-            if self.stack_pointer == self.data_memory_size:
+            if self.stack_pointer == self.stack_base:
                 raise ValueError("Stack underflow")
             self.stack_pointer += 1
-            self.data_out = self.data_memory[self.stack_pointer]
+            self.data_out = self.read_memory(self.stack_pointer)
         elif sel == Signals.ADDR_IMM:
-            self.data_out = self.data_memory[addr]
+            self.data_out = self.read_memory(addr)
         elif sel == Signals.ADDR_R1:
-            self.data_out = self.data_memory[self.r1]
+            self.data_out = self.read_memory(self.r1)
         elif sel == Signals.ADDR_R2:
-            self.data_out = self.data_memory[self.r2]
+            self.data_out = self.read_memory(self.r2)
     
     def signal_latch_alu_l(self, sel: Signals, value: int = 0) -> None:
         if sel == Signals.DATA_R1:
@@ -98,6 +205,8 @@ class DataPath:
             self.alu_out = self.alu_l // self.alu_r
         else:
             raise ValueError(f"Unknown opcode {opcode}")
+        if not self.word_min <= self.alu_out <= self.word_max:
+            self.alu_out = self.config.wrap(self.alu_out)
     
     def signal_write(
         self, 
@@ -112,14 +221,14 @@ class DataPath:
         if sel == Signals.SP_DEC:
             if self.stack_pointer == 0:
                 raise ValueError("Stack overflow")
-            self.data_memory[self.stack_pointer] = self.alu_out
+            self.write_memory(self.stack_pointer, self.alu_out)
             self.stack_pointer -= 1
         elif sel == Signals.ADDR_IMM:
-            self.data_memory[addr] = self.alu_out
+            self.write_memory(addr, self.alu_out)
         elif sel == Signals.ADDR_R1:
-            self.data_memory[self.r1] = self.alu_out
+            self.write_memory(self.r1, self.alu_out)
         elif sel == Signals.ADDR_R2:
-            self.data_memory[self.r2] = self.alu_out
+            self.write_memory(self.r2, self.alu_out)
         else:
             raise ValueError(f"Unknown signal {sel}")
 
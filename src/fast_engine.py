@@ -0,0 +1,357 @@
+from collections.abc import Callable
+
+from src.control_unit import ControlUnit
+from src.datapath import DataPath
+from src.isa import (
+    ALU_OPERATIONS,
+    ArithmeticInstructionImm,
+    ArithmeticInstructionReg,
+    CallInstruction,
+    Instruction,
+    IOMemoryInstructionImm,
+    IOMemoryInstructionReg,
+    IOOutInstruction,
+    IORstInstruction,
+    JumpEqInstruction,
+    JumpInstruction,
+    ManagementInstruction,
+    Opcode,
+    Program,
+    Registers,
+    RetInstruction,
+)
+from src.machine_config import DEFAULT_CONFIG, MachineConfig
+
+# Every handler reproduces the latch sequence of
+# ControlUnit.decode_and_execute_instruction for one instruction shape,
+# with registers, addresses and the ALU operation resolved at load time.
+Handler = Callable[[ControlUnit, DataPath], None]
+
+MEMORY_INSTRUCTIONS = (
+    IOMemoryInstructionImm,
+    IOMemoryInstructionReg,
+    CallInstruction,
+    RetInstruction,
+    IORstInstruction,
+)
+
+
+def _arithmetic_reg(
+    instr: ArithmeticInstructionReg, config: MachineConfig
+) -> Handler:
+    op = ALU_OPERATIONS[instr.opcode]
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+    # the left ALU input is always latched from R1
+    if instr.dest == Registers.R1 and instr.src == Registers.R1:
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.alu_l = dp.alu_r = dp.r1
+            value = op(dp.alu_l, dp.alu_r)
+            if not lo <= value <= hi:
+                value = wrap(value)
+            dp.r1 = dp.alu_out = value
+            cu._tick += 1
+            cu.program_counter += 1
+    elif instr.dest == Registers.R1:
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.alu_l = dp.r1
+            dp.alu_r = dp.r2
+            value = op(dp.alu_l, dp.alu_r)
+            if not lo <= value <= hi:
+                value = wrap(value)
+            dp.r1 = dp.alu_out = value
+            cu._tick += 1
+            cu.program_counter += 1
+    elif instr.src == Registers.R1:
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.alu_l = dp.alu_r = dp.r1
+            value = op(dp.alu_l, dp.alu_r)
+            if not lo <= value <= hi:
+                value = wrap(value)
+            dp.r2 = dp.alu_out = value
+            cu._tick += 1
+            cu.program_counter += 1
+    else:
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.alu_l = dp.r1
+            dp.alu_r = dp.r2
+            value = op(dp.alu_l, dp.alu_r)
+            if not lo <= value <= hi:
+                value = wrap(value)
+            dp.r2 = dp.alu_out = value
+            cu._tick += 1
+            cu.program_counter += 1
+    return handler
+
+
+def _arithmetic_imm(
+    instr: ArithmeticInstructionImm, config: MachineConfig
+) -> Handler:
+    op = ALU_OPERATIONS[instr.opcode]
+    imm = instr.src
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+    if instr.dest == Registers.R1:
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.alu_r = imm
+            dp.alu_l = dp.r1
+            value = op(dp.alu_l, imm)
+            if not lo <= value <= hi:
+                value = wrap(value)
+            dp.r1 = dp.alu_out = value
+            cu._tick += 1
+            cu.program_counter += 1
+    else:
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.alu_r = imm
+            dp.alu_l = dp.r2
+            value = op(dp.alu_l, imm)
+            if not lo <= value <= hi:
+                value = wrap(value)
+            dp.r2 = dp.alu_out = value
+            cu._tick += 1
+            cu.program_counter += 1
+    return handler
+
+
+def _load(instr: IOMemoryInstructionImm | IOMemoryInstructionReg) -> Handler:
+    to_r1 = instr.dest == Registers.R1
+    if isinstance(instr, IOMemoryInstructionImm):
+        addr = instr.src
+
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.data_out = dp.data_memory[addr]
+            if to_r1:
+                dp.r1 = dp.data_out
+            else:
+                dp.r2 = dp.data_out
+            cu._tick += 1
+            cu.program_counter += 1
+    else:
+        from_r1 = instr.src == Registers.R1
+
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.data_out = dp.data_memory[dp.r1 if from_r1 else dp.r2]
+            if to_r1:
+                dp.r1 = dp.data_out
+            else:
+                dp.r2 = dp.data_out
+            cu._tick += 1
+            cu.program_counter += 1
+    return handler
+
+
+def _store(
+    instr: IOMemoryInstructionImm | IOMemoryInstructionReg,
+    config: MachineConfig,
+) -> Handler:
+    # the value goes through the ALU as value + 0, which wraps an input
+    # that R2 holds as it came
+    from_r1 = instr.dest == Registers.R1
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+    if isinstance(instr, IOMemoryInstructionImm):
+        addr = instr.src
+
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.alu_l = value = dp.r1 if from_r1 else dp.r2
+            dp.alu_r = 0
+            if not lo <= value <= hi:
+                value = wrap(value)
+            # latched before the write, which can fault
+            dp.alu_out = value
+            dp.data_memory[addr] = value
+            cu._tick += 1
+            cu.program_counter += 1
+    else:
+        addr_r1 = instr.src == Registers.R1
+
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            dp.alu_l = value = dp.r1 if from_r1 else dp.r2
+            dp.alu_r = 0
+            if not lo <= value <= hi:
+                value = wrap(value)
+            dp.alu_out = value
+            dp.data_memory[dp.r1 if addr_r1 else dp.r2] = value
+            cu._tick += 1
+            cu.program_counter += 1
+    return handler
+
+
+def _out(instr: IOOutInstruction, config: MachineConfig) -> Handler:
+    from_r1 = instr.src == Registers.R1
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        dp.alu_l = value = dp.r1 if from_r1 else dp.r2
+        dp.alu_r = 0
+        if not lo <= value <= hi:
+            value = wrap(value)
+        dp.alu_out = value
+        cu.controller.output_buffer.append(value)
+        cu._tick += 1
+        cu.program_counter += 1
+    return handler
+
+
+def _jump(instr: JumpInstruction) -> Handler:
+    addr = instr.addr
+
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        cu.program_counter = addr
+        cu._tick += 1
+    return handler
+
+
+def _jump_eq(instr: JumpEqInstruction) -> Handler:
+    addr = instr.addr
+    if instr.src == Registers.R1:
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            if dp.r1 == 0:
+                cu.program_counter = addr
+            else:
+                cu.program_counter += 1
+            cu._tick += 1
+    else:
+        def handler(cu: ControlUnit, dp: DataPath) -> None:
+            if dp.r2 == 0:
+                cu.program_counter = addr
+            else:
+                cu.program_counter += 1
+            cu._tick += 1
+    return handler
+
+
+def _push_alu_out(dp: DataPath) -> None:
+    if dp.stack_pointer == 0:
+        raise ValueError("Stack overflow")
+    dp.data_memory[dp.stack_pointer] = dp.alu_out
+    dp.stack_pointer -= 1
+
+
+def _pop_data_out(dp: DataPath) -> None:
+    if dp.stack_pointer == dp.stack_base:
+        raise ValueError("Stack underflow")
+    dp.stack_pointer += 1
+    dp.data_out = dp.data_memory[dp.stack_pointer]
+
+
+def _call(instr: CallInstruction) -> Handler:
+    addr = instr.addr
+
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        dp.alu_l = dp.alu_out = cu.program_counter
+        dp.alu_r = 0
+        _push_alu_out(dp)
+        cu.program_counter = addr
+        cu._tick += 2
+    return handler
+
+
+def _ret(config: MachineConfig) -> Handler:
+    # the return address goes through the ALU as R1 + 0 like in _out
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        _pop_data_out(dp)
+        dp.r1 = dp.alu_l = value = dp.data_out
+        dp.alu_r = 0
+        if not lo <= value <= hi:
+            value = wrap(value)
+        dp.alu_out = cu.program_counter = value
+        cu._tick += 1
+    return handler
+
+
+def _rst(config: MachineConfig) -> Handler:
+    # drop the return address pushed by CALL INT, then restore PC, R2, R1
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        _pop_data_out(dp)
+        _pop_data_out(dp)
+        dp.r1 = dp.alu_l = value = dp.data_out
+        dp.alu_r = 0
+        if not lo <= value <= hi:
+            value = wrap(value)
+        dp.alu_out = cu.program_counter = value
+        cu._tick += 1
+        _pop_data_out(dp)
+        dp.r2 = dp.data_out
+        cu._tick += 1
+        _pop_data_out(dp)
+        dp.r1 = dp.data_out
+        cu._tick += 1
+    return handler
+
+
+def _halt(cu: ControlUnit, dp: DataPath) -> None:
+    raise StopIteration()
+
+
+def _signal_level(instr: Instruction) -> Handler:
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        cu.decode_and_execute_instruction(instr)
+    return handler
+
+
+def predecode_instruction(
+    instr: Instruction,
+    cached: bool = False,
+    config: MachineConfig = DEFAULT_CONFIG,
+) -> Handler:
+    # a data cache adds stall ticks to memory accesses, which only the
+    # signal-level path accounts for
+    if cached and isinstance(instr, MEMORY_INSTRUCTIONS):
+        return _signal_level(instr)
+    if isinstance(instr, ArithmeticInstructionReg):
+        return _arithmetic_reg(instr, config)
+    elif isinstance(instr, ArithmeticInstructionImm):
+        return _arithmetic_imm(instr, config)
+    elif isinstance(instr, (IOMemoryInstructionImm, IOMemoryInstructionReg)):
+        return (_load(instr) if instr.opcode == Opcode.LD
+                else _store(instr, config))
+    elif isinstance(instr, IOOutInstruction):
+        return _out(instr, config)
+    elif isinstance(instr, JumpInstruction):
+        return _jump(instr)
+    elif isinstance(instr, JumpEqInstruction):
+        return _jump_eq(instr)
+    elif isinstance(instr, CallInstruction):
+        return _call(instr)
+    elif isinstance(instr, RetInstruction):
+        return _ret(config)
+    elif isinstance(instr, IORstInstruction):
+        return _rst(config)
+    elif isinstance(instr, ManagementInstruction):
+        return _halt
+    else:
+        raise ValueError(f"Unknown instruction {instr}")
+
+
+def predecode(
+    program: Program,
+    cached: bool = False,
+    config: MachineConfig = DEFAULT_CONFIG,
+) -> list[Handler]:
+    return [
+        predecode_instruction(instr, cached, config)
+        for instr in program.instructions
+    ]
+
+
+def predecode_lazily(
+    program: Program,
+    cached: bool = False,
+    config: MachineConfig = DEFAULT_CONFIG,
+) -> list[Handler]:
+    # every slot starts as a stub that predecodes its PC on first fetch
+    # and replaces itself, so a large image is only decoded where it runs
+    handlers: list[Handler] = []
+    instructions = program.instructions
+
+    def first_fetch(cu: ControlUnit, dp: DataPath) -> None:
+        pc = cu.program_counter
+        handler = handlers[pc] = predecode_instruction(
+            instructions[pc], cached, config)
+        handler(cu, dp)
+
+    handlers.extend([first_fetch] * len(instructions))
+    return handlers
@@ -0,0 +1,264 @@
+from collections import Counter
+from collections.abc import Callable
+from typing import NamedTuple
+
+from src.control_unit import ControlUnit
+from src.datapath import DataPath
+from src.fast_engine import Handler
+from src.isa import (
+    ALU_OPERATIONS,
+    ArithmeticInstructionImm,
+    ArithmeticInstructionReg,
+    Instruction,
+    IOMemoryInstructionImm,
+    Opcode,
+    Program,
+    Registers,
+)
+from src.machine_config import DEFAULT_CONFIG, MachineConfig
+from src.profiler import Profiler
+
+R1, R2 = Registers.R1, Registers.R2
+
+
+class Superinstruction(NamedTuple):
+    run: Handler
+    name: str
+    length: int
+    # ticks spent before the last instruction starts, every fused
+    # instruction takes one tick
+    lead_ticks: int
+
+
+# a pattern returns the fused handler when the instructions starting at
+# its first argument have its shape
+Pattern = Callable[[list[Instruction], MachineConfig], Handler | None]
+
+
+def _is_reg(
+    instr: Instruction, opcode: Opcode, dest: Registers, src: Registers
+) -> bool:
+    return (isinstance(instr, ArithmeticInstructionReg)
+            and (instr.opcode, instr.dest, instr.src) == (opcode, dest, src))
+
+
+def _is_imm(instr: Instruction, opcode: Opcode) -> bool:
+    return (isinstance(instr, ArithmeticInstructionImm)
+            and instr.opcode == opcode and instr.dest == R1)
+
+
+def _is_memory(instr: Instruction, opcode: Opcode) -> bool:
+    return (isinstance(instr, IOMemoryInstructionImm)
+            and instr.opcode == opcode and instr.dest == R1)
+
+
+def clear_copy(
+    instrs: list[Instruction], config: MachineConfig
+) -> Handler | None:
+    # SUB R1, R1 / ADD R1, R2
+    if not (_is_reg(instrs[0], Opcode.SUB, R1, R1)
+            and _is_reg(instrs[1], Opcode.ADD, R1, R2)):
+        return None
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        # R2 holds an input as it came, the ADD wraps it like any sum
+        dp.alu_l = 0
+        dp.alu_r = value = dp.r2
+        if not lo <= value <= hi:
+            value = wrap(value)
+        dp.r1 = dp.alu_out = value
+        cu._tick += 2
+        cu.program_counter += 2
+    return handler
+
+
+def clear_set(
+    instrs: list[Instruction], config: MachineConfig
+) -> Handler | None:
+    # SUB R1, R1 / ADD R1, imm
+    if not (_is_reg(instrs[0], Opcode.SUB, R1, R1)
+            and _is_imm(instrs[1], Opcode.ADD)):
+        return None
+    imm = instrs[1].src  # type: ignore
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+    value = imm if lo <= imm <= hi else wrap(imm)
+
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        dp.alu_l = 0
+        dp.alu_r = imm
+        dp.r1 = dp.alu_out = value
+        cu._tick += 2
+        cu.program_counter += 2
+    return handler
+
+
+def accumulate(
+    instrs: list[Instruction], config: MachineConfig
+) -> Handler | None:
+    # LD R1, n / ADD R1, R2 / ST R1, n, SUB and MUL accumulate the same way
+    load, arith, store = instrs[:3]
+    if not (_is_memory(load, Opcode.LD) and _is_memory(store, Opcode.ST)
+            and load.src == store.src  # type: ignore
+            and isinstance(arith, ArithmeticInstructionReg)
+            and arith.opcode in (Opcode.ADD, Opcode.SUB, Opcode.MUL)
+            and (arith.dest, arith.src) == (R1, R2)):
+        return None
+    op = ALU_OPERATIONS[arith.opcode]
+    addr = load.src  # type: ignore
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        mem = dp.data_memory
+        dp.data_out = value = mem[addr]
+        value = op(value, dp.r2)
+        if not lo <= value <= hi:
+            value = wrap(value)
+        dp.alu_l = dp.r1 = dp.alu_out = mem[addr] = value
+        dp.alu_r = 0
+        cu._tick += 3
+        cu.program_counter += 3
+    return handler
+
+
+def modulo_test(
+    instrs: list[Instruction], config: MachineConfig
+) -> Handler | None:
+    # DIV R1, k / MUL R1, k / SUB R1, R2 leaves R1 - R1 mod k - R2 in R1,
+    # only fused for a positive k
+    div, mul, sub = instrs[:3]
+    if not (_is_imm(div, Opcode.DIV) and _is_imm(mul, Opcode.MUL)
+            and div.src == mul.src > 0  # type: ignore
+            and _is_reg(sub, Opcode.SUB, R1, R2)):
+        return None
+    k = div.src  # type: ignore
+    lo, hi, wrap = config.word_min, config.word_max, config.wrap
+
+    def handler(cu: ControlUnit, dp: DataPath) -> None:
+        # k is positive, only flooring a value near word_min can leave the
+        # range like the unfused MUL does
+        multiple = dp.r1 // k * k
+        if multiple < lo:
+            multiple = wrap(multiple)
+        dp.alu_l = multiple
+        dp.alu_r = dp.r2
+        value = multiple - dp.r2
+        if not lo <= value <= hi:
+            value = wrap(value)
+        dp.r1 = dp.alu_out = value
+        cu._tick += 3
+        cu.program_counter += 3
+    return handler
+
+
+# tried in order at every PC, the first match wins
+PATTERNS: dict[str, tuple[int, Pattern]] = {
+    "accumulate": (3, accumulate),
+    "modulo_test": (3, modulo_test),
+    "clear_copy": (2, clear_copy),
+    "clear_set": (2, clear_set),
+}
+# patterns whose handlers bypass the data cache
+MEMORY_PATTERNS = {"accumulate"}
+
+
+def fuse_at(
+    program: Program,
+    pc: int,
+    cached: bool = False,
+    config: MachineConfig = DEFAULT_CONFIG,
+) -> Superinstruction | None:
+    instructions = program.instructions
+    for name, (length, pattern) in PATTERNS.items():
+        if cached and name in MEMORY_PATTERNS:
+            continue
+        if pc + length > len(instructions):
+            continue
+        handler = pattern(list(instructions[pc:pc + length]), config)
+        if handler is not None:
+            return Superinstruction(handler, name, length, length - 1)
+    return None
+
+
+class FusionTable:
+    # a superinstruction for every PC that starts a fused sequence, a jump
+    # into the middle of one runs the unfused handlers from there
+    fused: list[Superinstruction | None]
+    # per PC, how often the fused handler ran and how often it was skipped
+    # because an interrupt or the instruction limit fell inside it
+    hits: list[int]
+    fallbacks: list[int]
+
+    def __init__(
+        self,
+        program: Program,
+        cached: bool = False,
+        config: MachineConfig = DEFAULT_CONFIG,
+    ) -> None:
+        self.fused = [
+            fuse_at(program, pc, cached, config)
+            for pc in range(len(program.instructions))
+        ]
+        self.hits = [0] * len(self.fused)
+        self.fallbacks = [0] * len(self.fused)
+
+    def run(
+        self,
+        cu: ControlUnit,
+        handlers: list[Handler],
+        limit: int,
+        profiler: Profiler | None = None,
+    ) -> None:
+        # same contract as Machine.simulate: raises StopIteration on HLT
+        # or when limit instructions have been executed. A profiler sees a
+        # superinstruction as one block.
+        dp = cu.data_path
+        controller = cu.controller
+        fused, hits, fallbacks = self.fused, self.hits, self.fallbacks
+        next_interrupt = controller.next_interrupt_tick
+        count = 0
+        while count < limit:
+            pc = cu.program_counter
+            superinstruction = fused[pc]
+            if superinstruction is not None:
+                if (not controller.interruption_flag
+                        and count + superinstruction.length <= limit
+                        and cu._tick + superinstruction.lead_ticks
+                        < next_interrupt):
+                    # no fused instruction starts at or after the next
+                    # input, so the interrupt is served after all of them
+                    if profiler is not None:
+                        profiler.enter_block(pc, superinstruction.length,
+                                             cu._tick)
+                    superinstruction.run(cu, dp)
+                    count += superinstruction.length
+                    hits[pc] += 1
+                    continue
+                fallbacks[pc] += 1
+
+            count += 1
+            if cu._tick >= next_interrupt:
+                controller.interruption_flag = True
+            if profiler is not None:
+                profiler.enter(pc, cu._tick)
+            handlers[pc](cu, dp)
+            if controller.interruption_flag:
+                if profiler is not None:
+                    profiler.interrupt(cu._tick)
+                cu.check_int_request()
+                next_interrupt = controller.next_interrupt_tick
+
+        raise StopIteration("limit")
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        # sites, executions, fallbacks and instructions covered per pattern
+        stats: dict[str, Counter[str]] = {}
+        for pc, superinstruction in enumerate(self.fused):
+            if superinstruction is None:
+                continue
+            entry = stats.setdefault(superinstruction.name, Counter())
+            entry["sites"] += 1
+            entry["executed"] += self.hits[pc]
+            entry["fallbacks"] += self.fallbacks[pc]
+            entry["instructions"] += self.hits[pc] * superinstruction.length
+        return {name: dict(entry) for name, entry in stats.items()}
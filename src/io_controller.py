@@ -1,17 +1,74 @@
+from collections import deque
+from collections.abc import Iterable, Iterator
+
+from src.io_ports import StreamOutput
+
+# next_interrupt_tick when no input is scheduled
+NO_INTERRUPT = float("inf")
+
+# input events held in memory when they come from a lazy source, the state
+# dump shows the pending input only while a second one is queued behind it
+_LOOKAHEAD = 2
+
+
 class IOController:
-    input_buffer: list[tuple[int, int]]
-    output_buffer: list[int]
+    input_buffer: deque[tuple[int, int]]
+    output_buffer: list[int] | StreamOutput
 
     interruption_flag: bool
+    inputs_taken: int
+    _source: Iterator[tuple[int, int]] | None
 
     def __init__(self) -> None:
-        self.input_buffer = []
+        self.input_buffer = deque()
         self.output_buffer = []
         self.interruption_flag = False
+        self.inputs_taken = 0
+        self._source = None
+
+    def load_input(self, events: Iterable[tuple[int, int]]) -> None:
+        if isinstance(events, (list, tuple, deque)):
+            self.input_buffer = deque(events)
+            self._source = None
+        else:
+            # iterators and generators are drained lazily
+            self.input_buffer = deque()
+            self._source = iter(events)
+            self._refill()
+
+    @property
+    def streaming(self) -> bool:
+        return self._source is not None
+
+    def schedule(self, events: Iterable[tuple[int, int]]) -> None:
+        # (tick, value) input events are delivered in stream order,
+        # each one as soon as the tick of the machine reaches it
+        self.input_buffer.extend(events)
+
+    def _refill(self) -> None:
+        source = self._source
+        if source is None:
+            return
+        while len(self.input_buffer) < _LOOKAHEAD:
+            event = next(source, None)
+            if event is None:
+                self._source = None
+                return
+            self.input_buffer.append(event)
+
+    @property
+    def next_interrupt_tick(self) -> float:
+        return self.input_buffer[0][0] if self.input_buffer else NO_INTERRUPT
+
+    def pop_input(self) -> int:
+        value = self.input_buffer.popleft()[1]
+        self.inputs_taken += 1
+        if self._source is not None:
+            self._refill()
+        return value
 
     def set_interruption_flag(self) -> None:
         self.interruption_flag = True
     
     def push_to_output_buffer(self, data: int) -> None:
         self.output_buffer.append(data)
-    
@@ -0,0 +1,102 @@
+import ast
+import re
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+from typing import TextIO
+
+# one (tick, 'c') pair of an input stream like [(0, 'c'), (10, '\0')]
+_EVENT = re.compile(
+    r"""\(\s*(\d+)\s*,\s*('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")\s*\)""")
+_SEPARATORS = frozenset("[],\n\r\t ")
+_MAX_PENDING = 4096
+
+
+def _parse_event(match: re.Match[str]) -> tuple[int, int]:
+    char = ast.literal_eval(match.group(2))
+    if len(char) != 1:
+        raise ValueError(f"Input value must be a single character: {char!r}")
+    return int(match.group(1)), ord(char)
+
+
+def _check_separators(text: str) -> None:
+    if not set(text) <= _SEPARATORS:
+        raise ValueError(f"Unexpected input stream content: {text.strip()!r}")
+
+
+def iter_input_events(
+    stream: TextIO, chunk_size: int = 1 << 16
+) -> Iterator[tuple[int, int]]:
+    # reads the stream chunk by chunk, only a partial event is carried over
+    pending = ""
+    while chunk := stream.read(chunk_size):
+        pending += chunk
+        end = 0
+        for match in _EVENT.finditer(pending):
+            _check_separators(pending[end:match.start()])
+            end = match.end()
+            yield _parse_event(match)
+        rest = pending[end:]
+        start = rest.find("(")
+        if start == -1:
+            _check_separators(rest)
+            pending = ""
+        else:
+            _check_separators(rest[:start])
+            pending = rest[start:]
+            if len(pending) > _MAX_PENDING:
+                raise ValueError(f"Malformed input event: {pending[:40]!r}")
+    _check_separators(pending)
+
+
+def parse_input_events(text: str) -> list[tuple[int, int]]:
+    events = []
+    end = 0
+    for match in _EVENT.finditer(text):
+        _check_separators(text[end:match.start()])
+        end = match.end()
+        events.append(_parse_event(match))
+    _check_separators(text[end:])
+    return events
+
+
+def read_input_events(input_file: Path) -> list[tuple[int, int]]:
+    with open(input_file) as file:
+        return list(iter_input_events(file))
+
+
+def output_value(value: int) -> str | int:
+    # the character a program printed, or the number when it is not a code
+    # point, e.g. a negative word
+    return chr(value) if 0 <= value <= sys.maxunicode else value
+
+
+class StreamOutput:
+    # stands in for IOController.output_buffer: every appended value is
+    # written out as a character, or as a number when it is not one, at
+    # most buffer_size of them are held back
+    stream: TextIO
+    buffer_size: int
+    written: int
+    _pending: list[str]
+
+    def __init__(self, stream: TextIO, buffer_size: int = 4096) -> None:
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.written = 0
+        self._pending = []
+
+    def append(self, value: int) -> None:
+        self._pending.append(str(output_value(value)))
+        if len(self._pending) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            self.stream.write("".join(self._pending))
+            self.written += len(self._pending)
+            self._pending.clear()
+        self.stream.flush()
+
+    def __len__(self) -> int:
+        return self.written + len(self._pending)
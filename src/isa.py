@@ -1,9 +1,31 @@
 from __future__ import annotations
 
+import mmap
+import operator
+import os
 import struct
+import sys
+from abc import abstractmethod
+from array import array
+from collections.abc import Callable, Iterator, Sequence
 from dataclasses import dataclass
 from enum import Enum
-from typing import Literal, Protocol
+from typing import TYPE_CHECKING, Literal, Protocol, overload
+
+if TYPE_CHECKING:
+    # annotations only, importing pathlib would add to every import of the ISA
+    from pathlib import Path
+    from types import ModuleType
+
+
+def _numpy() -> ModuleType | None:
+    # numpy only speeds up decode_columns and costs more to import than
+    # the whole simulator, so it is imported on first use
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
 
 
 class Opcode(Enum):
@@ -48,23 +70,50 @@ class ArgType(Enum):
         return "REG" if self == ArgType.REG else "IMM"
 
 
-@dataclass
+# The shared bases are plain slotted classes, only the concrete
+# instructions are dataclasses and list every field. Every method a
+# dataclass generates is compiled at import, so repr, == and hash are
+# written once here instead, with the results the generated ones give.
+# A dataclass without a docstring also builds one from its signature,
+# every concrete instruction has its own.
 class Instruction(Protocol):
+    __slots__ = ()
+
     def pack(self) -> bytes:
         """Pack to 16-bit word."""
 
+    def _fields(self) -> tuple:
+        # a concrete instruction's slots are its fields in order
+        return tuple([getattr(self, name) for name in type(self).__slots__])
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}"
+                           for name in type(self).__slots__)
+        return f"{type(self).__qualname__}({fields})"
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._fields() == other._fields()  # type: ignore
+
+    def __hash__(self) -> int:
+        return hash(self._fields())
+
 
-@dataclass
 class ArithmeticInstruction(Instruction):
+    __slots__ = ()
     opcode: Literal[Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV]
     dest: Registers
     src: int | Registers
     arg_type: ArgType
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class ArithmeticInstructionReg(ArithmeticInstruction):
+    """ADD, SUB, MUL or DIV with a register source."""
+
     opcode: Literal[Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV]
+    dest: Registers
     src: Registers
     arg_type: Literal[ArgType.REG] = ArgType.REG
     
@@ -77,9 +126,12 @@ class ArithmeticInstructionReg(ArithmeticInstruction):
         return struct.pack(">H", packed_data)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class ArithmeticInstructionImm(ArithmeticInstruction):
+    """ADD, SUB, MUL or DIV with a 10-bit immediate."""
+
     opcode: Literal[Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV]
+    dest: Registers
     src: int  # src must be between 0 and 0x3FF
     arg_type: Literal[ArgType.IMM] = ArgType.IMM
 
@@ -92,13 +144,15 @@ class ArithmeticInstructionImm(ArithmeticInstruction):
         return struct.pack(">H", packed_data)
 
 
-@dataclass
 class ControlInstruction(Instruction):
+    __slots__ = ()
     opcode: Literal[Opcode.JMP, Opcode.JE, Opcode.CALL, Opcode.RET]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class CallInstruction(ControlInstruction):
+    """CALL addr."""
+
     opcode: Literal[Opcode.CALL]
     addr: int
 
@@ -110,16 +164,20 @@ class CallInstruction(ControlInstruction):
         return struct.pack(">H", packed_data)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class RetInstruction(ControlInstruction):
+    """RET to the address on top of the stack."""
+
     opcode: Literal[Opcode.RET]
 
     def pack(self) -> bytes:
         return struct.pack(">H", self.opcode.value << 12)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class JumpEqInstruction(ControlInstruction):
+    """JE src, addr, taken when src is zero."""
+
     opcode: Literal[Opcode.JE]
     src: Registers
     addr: int
@@ -132,8 +190,10 @@ class JumpEqInstruction(ControlInstruction):
         return struct.pack(">H", packed_data)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class JumpInstruction(ControlInstruction):
+    """JMP addr."""
+
     opcode: Literal[Opcode.JMP]
     addr: int
 
@@ -145,22 +205,25 @@ class JumpInstruction(ControlInstruction):
         return struct.pack(">H", packed_data)
     
 
-@dataclass
 class IOInstruction(Instruction):
+    __slots__ = ()
     opcode: Literal[Opcode.LD, Opcode.ST, Opcode.OUT, Opcode.RST]
 
 
-@dataclass
 class IOMemoryInstruction(IOInstruction):
+    __slots__ = ()
     opcode: Literal[Opcode.LD, Opcode.ST]
     dest: Registers
     src: Registers | int
     arg_type: ArgType
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class IOMemoryInstructionReg(IOMemoryInstruction):
+    """LD or ST with the address in a register."""
+
     opcode: Literal[Opcode.LD, Opcode.ST]
+    dest: Registers
     src: Registers
     arg_type: Literal[ArgType.REG] = ArgType.REG
 
@@ -173,9 +236,12 @@ class IOMemoryInstructionReg(IOMemoryInstruction):
         return struct.pack(">H", packed_data)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class IOMemoryInstructionImm(IOMemoryInstruction):
+    """LD or ST with an immediate address."""
+
     opcode: Literal[Opcode.LD, Opcode.ST]
+    dest: Registers
     src: int
     arg_type: Literal[ArgType.IMM] = ArgType.IMM
 
@@ -188,8 +254,10 @@ class IOMemoryInstructionImm(IOMemoryInstruction):
         return struct.pack(">H", packed_data)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class IOOutInstruction(IOInstruction):
+    """OUT src."""
+
     opcode: Literal[Opcode.OUT]
     src: Registers
 
@@ -201,8 +269,10 @@ class IOOutInstruction(IOInstruction):
         return struct.pack(">H", packed_data)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class IORstInstruction(IOInstruction):
+    """RST, returns from the interrupt handler."""
+
     opcode: Literal[Opcode.RST]
 
     def pack(self) -> bytes:
@@ -211,51 +281,71 @@ class IORstInstruction(IOInstruction):
         return struct.pack(">H", packed_data)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True, repr=False, eq=False)
 class ManagementInstruction(Instruction):
+    """HLT."""
+
     opcode: Literal[Opcode.HLT]
 
     def pack(self) -> bytes:
         return struct.pack(">H", self.opcode.value << 12)
 
 
-def unpack(data: bytes) -> Instruction:
+# what the ALU computes for every arithmetic opcode
+ALU_OPERATIONS: dict[Opcode, Callable[[int, int], int]] = {
+    Opcode.ADD: operator.add,
+    Opcode.SUB: operator.sub,
+    Opcode.MUL: operator.mul,
+    Opcode.DIV: operator.floordiv,
+}
+
+
+def instruction_ticks(instr: Instruction) -> int:
+    if isinstance(instr, CallInstruction):
+        return 2
+    if isinstance(instr, IORstInstruction):
+        return 3
+    if isinstance(instr, ManagementInstruction):
+        return 0
+    return 1
+
+
+def decode_word(word: int) -> Instruction:
     # fukin' mypy cannot narrow literal using 'in {...}' syntax, 
     # so we end up with type ignores
-    unpacked_data: int = struct.unpack(">H", data)[0]
-    opcode = Opcode((unpacked_data >> 12) & 0x000F)
+    opcode = Opcode((word >> 12) & 0x000F)
     if opcode in {Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV}:
-        arg_type = ArgType((unpacked_data >> 11) & 0x0001)
-        dest = Registers((unpacked_data >> 10) & 0x0001)
+        arg_type = ArgType((word >> 11) & 0x0001)
+        dest = Registers((word >> 10) & 0x0001)
         if arg_type == ArgType.REG:
-            src_reg = Registers((unpacked_data >> 9) & 0x0001)
+            src_reg = Registers((word >> 9) & 0x0001)
             return ArithmeticInstructionReg(opcode, dest, src_reg)  # type: ignore
         else:
-            src_imm = unpacked_data & 0x03FF
+            src_imm = word & 0x03FF
             return ArithmeticInstructionImm(opcode, dest, src_imm)  # type: ignore
     elif opcode == Opcode.CALL:
-        addr = unpacked_data & 0x03FF
+        addr = word & 0x03FF
         return CallInstruction(opcode, addr)
     elif opcode == Opcode.RET:
         return RetInstruction(opcode)
     elif opcode == Opcode.JMP:
-        addr = unpacked_data & 0x03FF
+        addr = word & 0x03FF
         return JumpInstruction(opcode, addr)
     elif opcode == Opcode.JE:
-        src = Registers((unpacked_data >> 11) & 0x0001)
-        addr = unpacked_data & 0x03FF
+        src = Registers((word >> 11) & 0x0001)
+        addr = word & 0x03FF
         return JumpEqInstruction(opcode, src, addr)
     elif opcode in {Opcode.LD, Opcode.ST}: 
-        arg_type = ArgType((unpacked_data >> 11) & 0x0001)
-        dest = Registers((unpacked_data >> 10) & 0x0001)
+        arg_type = ArgType((word >> 11) & 0x0001)
+        dest = Registers((word >> 10) & 0x0001)
         if arg_type == ArgType.REG:
-            src_reg = Registers((unpacked_data >> 9) & 0x0001)
+            src_reg = Registers((word >> 9) & 0x0001)
             return IOMemoryInstructionReg(opcode, dest, src_reg)  # type: ignore
         else:
-            src_imm = unpacked_data & 0x03FF
+            src_imm = word & 0x03FF
             return IOMemoryInstructionImm(opcode, dest, src_imm)  # type: ignore
     elif opcode == Opcode.OUT:
-        src = Registers((unpacked_data >> 11) & 0x0001)
+        src = Registers((word >> 11) & 0x0001)
         return IOOutInstruction(opcode, src)
     elif opcode == Opcode.RST:
         return IORstInstruction(opcode)
@@ -265,25 +355,388 @@ def unpack(data: bytes) -> Instruction:
         raise ValueError(f"Unknown opcode: {opcode}")
 
 
-@dataclass
+def unpack(data: bytes) -> Instruction:
+    return decode_word(struct.unpack(">H", data)[0])
+
+
+def encode_word(instr: Instruction) -> int:
+    word = instr.opcode.value << 12  # type: ignore
+    if isinstance(instr, (ArithmeticInstruction, IOMemoryInstruction)):
+        word |= instr.arg_type.value << 11
+        word |= instr.dest.value << 10
+        if isinstance(instr.src, Registers):
+            word |= instr.src.value << 9
+        else:
+            word |= instr.src & 0x3FF
+    elif isinstance(instr, JumpEqInstruction):
+        word |= instr.src.value << 11
+        word |= instr.addr & 0x3FF
+    elif isinstance(instr, (JumpInstruction, CallInstruction)):
+        word |= instr.addr & 0x3FF
+    elif isinstance(instr, IOOutInstruction):
+        word |= instr.src.value << 11
+    return word
+
+
+def words_from_bytes(data: bytes | memoryview) -> array[int]:
+    if len(data) % 2:
+        raise ValueError("Program image must consist of 16-bit words")
+    words = array("H")
+    words.frombytes(data)
+    if sys.byteorder == "little":
+        words.byteswap()
+    return words
+
+
+def words_to_bytes(words: array[int]) -> bytes:
+    if sys.byteorder == "little":
+        words = array("H", words)
+        words.byteswap()
+    return words.tobytes()
+
+
+@dataclass(slots=True)
+class InstructionColumns:
+    # raw bit fields of every word, bit 11 is the argument type for
+    # arithmetic and LD/ST, and the source register for JE and OUT
+    opcode: Sequence[int]
+    arg_type: Sequence[int]
+    dest: Sequence[int]
+    src: Sequence[int]
+    imm: Sequence[int]
+
+
+def decode_columns(
+    data: bytes | memoryview, use_numpy: bool | None = None
+) -> InstructionColumns:
+    numpy = _numpy()
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if use_numpy:
+        if numpy is None:
+            raise ImportError(
+                "numpy is not installed, it comes with the array extra")
+        if len(data) % 2:
+            raise ValueError("Program image must consist of 16-bit words")
+        raw = numpy.frombuffer(data, dtype=">u2").astype(numpy.uint16)
+        return InstructionColumns(
+            opcode=(raw >> 12).astype(numpy.uint8),
+            arg_type=((raw >> 11) & 1).astype(numpy.uint8),
+            dest=((raw >> 10) & 1).astype(numpy.uint8),
+            src=((raw >> 9) & 1).astype(numpy.uint8),
+            imm=raw & 0x3FF,
+        )
+
+    return ColumnarInstructions.from_words(words_from_bytes(data)).columns
+
+
+# Process-wide decode table, one slot per 16-bit word, filled on the first
+# decode of each word. Words that differ only in bits an instruction
+# ignores share one frozen instruction, so at most 16413 distinct objects
+# back the 65536 slots. decode_table() fills every slot, from a persisted
+# copy when one is given.
+WORD_COUNT = 1 << 16
+# bump whenever decode_word or encode_word change which bits they read
+DECODE_TABLE_VERSION = 3
+# persisted table: magic, version, the opcodes and instruction layouts it
+# was built for, then the canonical word of every slot as little-endian
+# uint16, the word itself when its opcode is unknown, and a CRC-32 of
+# those words
+DECODE_TABLE_MAGIC = b"ASDT"
+_decode_table: list[Instruction | None] = [None] * WORD_COUNT
+_interned: dict[Instruction, Instruction] = {}
+
+
+def shared_instruction(word: int) -> Instruction:
+    # flyweight: the returned instruction is shared and frozen
+    instr = _decode_table[word]
+    if instr is None:
+        decoded = decode_word(word)
+        instr = _decode_table[word] = _interned.setdefault(decoded, decoded)
+    return instr
+
+
+def decode_words(words: Sequence[int]) -> list[Instruction]:
+    # a table lookup per word once the table is warm
+    table = _decode_table
+    return [table[w] or shared_instruction(w) for w in words]
+
+
+def _table_header() -> bytes:
+    # a persisted table is only valid for the opcodes and instruction
+    # fields it was built with
+    opcodes = ",".join(f"{opcode.name}={opcode.value}" for opcode in Opcode)
+    layouts = ",".join(
+        f"{cls.__name__}({' '.join(cls.__slots__)})" for cls in (
+            ArithmeticInstructionReg, ArithmeticInstructionImm,
+            CallInstruction, RetInstruction, JumpEqInstruction,
+            JumpInstruction, IOMemoryInstructionReg, IOMemoryInstructionImm,
+            IOOutInstruction, IORstInstruction, ManagementInstruction,
+        ))
+    return (DECODE_TABLE_MAGIC + struct.pack("<H", DECODE_TABLE_VERSION)
+            + f"{opcodes};{layouts}".encode("ascii") + b"\n")
+
+
+def _load_table(path: Path) -> array[int] | None:
+    # None for a missing, truncated or corrupt file, or one written for
+    # another ISA
+    import zlib
+
+    header = _table_header()
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return None
+    end = len(header) + 2 * WORD_COUNT
+    if not data.startswith(header) or len(data) != end + 4:
+        return None
+    payload = memoryview(data)[len(header):end]
+    if zlib.crc32(payload) != struct.unpack_from("<I", data, end)[0]:
+        return None
+    canonical = array("H")
+    canonical.frombytes(payload)
+    if sys.byteorder == "big":
+        canonical.byteswap()
+    # a slot points at a word of its own opcode that points at itself
+    for word, base in enumerate(canonical):
+        if base >> 12 != word >> 12 or canonical[base] != base:
+            return None
+    return canonical
+
+
+def _fill_table(canonical: array[int]) -> bool:
+    # decodes each distinct canonical word once, False when one of them is
+    # not canonical for this decoder and the table has to be rebuilt
+    table = _decode_table
+    bases = {base for base in canonical if base >> 12 in VALID_OPCODES}
+    for base in bases:
+        instr = table[base] or shared_instruction(base)
+        if instr.pack() != base.to_bytes(2, "big"):
+            return False
+    for word, base in enumerate(canonical):
+        if table[word] is None and base in bases:
+            table[word] = table[base]
+    return True
+
+
+def _store_table(path: Path) -> None:
+    import zlib
+
+    # encode each distinct instruction once
+    words = {id(instr): encode_word(instr) for instr in _interned.values()}
+    canonical = array("H", (
+        word if instr is None else words[id(instr)]
+        for word, instr in enumerate(_decode_table)
+    ))
+    if sys.byteorder == "big":
+        canonical.byteswap()
+    payload = canonical.tobytes()
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(_table_header() + payload
+                    + struct.pack("<I", zlib.crc32(payload)))
+    os.replace(tmp, path)
+
+
+def decode_table(path: Path | None = None) -> Sequence[Instruction | None]:
+    # every word decoded, None for words with an unknown opcode. With a
+    # path the table is loaded from it, decoding each distinct instruction
+    # once, or built and written there when the file is missing or stale.
+    canonical = _load_table(path) if path is not None else None
+    if canonical is not None and _fill_table(canonical):
+        return _decode_table
+    for word in range(WORD_COUNT):
+        if _decode_table[word] is None and word >> 12 in VALID_OPCODES:
+            shared_instruction(word)
+    if path is not None:
+        _store_table(path)
+    return _decode_table
+
+
+class InstructionSequence(Sequence[Instruction]):
+    # read-only view over packed instructions, compatible with the
+    # list[Instruction] built by the compiler
+
+    @abstractmethod
+    def word(self, index: int) -> int: ...
+
+    @overload
+    def __getitem__(self, index: int) -> Instruction: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Instruction]: ...
+
+    def __getitem__(
+        self, index: int | slice
+    ) -> Instruction | list[Instruction]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return shared_instruction(self.word(index))
+
+    def words(self) -> array[int]:
+        return array("H", [self.word(i) for i in range(len(self))])
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            a == b for a, b in zip(self, other, strict=True))
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
+class LazyInstructions(InstructionSequence):
+    # instructions are decoded from the packed words on access
+    _words: array[int]
+
+    def __init__(self, words: array[int]) -> None:
+        self._words = words
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def word(self, index: int) -> int:
+        return self._words[index]
+
+    def words(self) -> array[int]:
+        return self._words
+
+    def __iter__(self) -> Iterator[Instruction]:
+        return iter(decode_words(self._words))
+
+
+_BIG_ENDIAN_WORD = struct.Struct(">H")
+
+
+class MappedInstructions(InstructionSequence):
+    # words are read straight from a mapped program image, nothing is
+    # copied up front and every PC is decoded on its first fetch
+    _image: mmap.mmap | bytes
+    _offset: int
+    _size: int
+    _decoded: dict[int, Instruction]
+
+    def __init__(self, image: mmap.mmap | bytes, offset: int = 2) -> None:
+        if (len(image) - offset) % 2:
+            raise ValueError("Program image must consist of 16-bit words")
+        self._image = image
+        self._offset = offset
+        self._size = (len(image) - offset) // 2
+        self._decoded = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def word(self, index: int) -> int:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("instruction index out of range")
+        return _BIG_ENDIAN_WORD.unpack_from(
+            self._image, self._offset + 2 * index)[0]
+
+    @overload
+    def __getitem__(self, index: int) -> Instruction: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Instruction]: ...
+
+    def __getitem__(
+        self, index: int | slice
+    ) -> Instruction | list[Instruction]:
+        if isinstance(index, slice):
+            return super().__getitem__(index)
+        instr = self._decoded.get(index)
+        if instr is None:
+            word = self.word(index)
+            # unpack_program checks the whole image, here only what runs
+            if word >> 12 not in VALID_OPCODES:
+                raise ValueError(f"Unknown opcode: {word >> 12}")
+            instr = self._decoded[index] = shared_instruction(word)
+        return instr
+
+    @property
+    def decoded(self) -> int:
+        return len(self._decoded)
+
+
+class ColumnarInstructions(InstructionSequence):
+    # struct-of-arrays backing, one byte per field and two for the
+    # immediate instead of one object per instruction
+    columns: InstructionColumns
+
+    def __init__(self, columns: InstructionColumns) -> None:
+        self.columns = columns
+
+    @classmethod
+    def from_words(cls, words: Sequence[int]) -> ColumnarInstructions:
+        return cls(InstructionColumns(
+            opcode=array("B", bytes(w >> 12 for w in words)),
+            arg_type=array("B", bytes(w >> 11 & 1 for w in words)),
+            dest=array("B", bytes(w >> 10 & 1 for w in words)),
+            src=array("B", bytes(w >> 9 & 1 for w in words)),
+            imm=array("H", [w & 0x3FF for w in words]),
+        ))
+
+    @classmethod
+    def from_instructions(
+        cls, instructions: Sequence[Instruction]
+    ) -> ColumnarInstructions:
+        return cls.from_words([encode_word(i) for i in instructions])
+
+    def __len__(self) -> int:
+        return len(self.columns.opcode)
+
+    def word(self, index: int) -> int:
+        # bit 9 is both the source register and the top immediate bit
+        c = self.columns
+        return (c.opcode[index] << 12 | c.arg_type[index] << 11
+                | c.dest[index] << 10 | c.imm[index])
+
+
+@dataclass(slots=True)
 class Program:
     entry: int  # start 16-bit address
-    instructions: list[Instruction]
+    instructions: Sequence[Instruction]
 
 
 def pack_program(program: Program) -> bytes:
     # entry should be two bytes
     entry = struct.pack(">H", program.entry)
     instr = program.instructions
-    return entry + b''.join(instr.pack() for instr in instr)
+    if isinstance(instr, InstructionSequence):
+        words = instr.words()
+    else:
+        words = array("H", [encode_word(i) for i in instr])
+    return entry + words_to_bytes(words)
+
+
+VALID_OPCODES = frozenset(opcode.value for opcode in Opcode)
 
 
 def unpack_program(data: bytes) -> Program:
     entry = struct.unpack(">H", data[:2])[0]
-    instructions = []
-    i = 2
-    while i < len(data):
-        instr = unpack(data[i:i + 2])
-        instructions.append(instr)
-        i += 2
-    return Program(entry, instructions)
+    words = words_from_bytes(memoryview(data)[2:])
+    invalid = set(w >> 12 for w in words) - VALID_OPCODES
+    if invalid:
+        raise ValueError(f"Unknown opcode: {min(invalid)}")
+    return Program(entry, LazyInstructions(words))
+
+
+def map_program(path: Path) -> Program:
+    # the image stays mapped for as long as the program is referenced
+    with path.open("rb") as f:
+        if path.stat().st_size < 2:
+            raise ValueError("Program image has no entry point")
+        image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    entry = _BIG_ENDIAN_WORD.unpack_from(image)[0]
+    return Program(entry, MappedInstructions(image))
+
+
+def compact_program(program: Program) -> Program:
+    instructions = program.instructions
+    if isinstance(instructions, InstructionSequence):
+        columnar = ColumnarInstructions.from_words(instructions.words())
+    else:
+        columnar = ColumnarInstructions.from_instructions(instructions)
+    return Program(program.entry, columnar)
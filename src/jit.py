@@ -0,0 +1,317 @@
+from collections.abc import Callable
+from typing import NamedTuple
+
+from src.control_unit import ControlUnit
+from src.datapath import DataPath
+from src.fast_engine import Handler
+from src.isa import (
+    ArithmeticInstructionImm,
+    ArithmeticInstructionReg,
+    CallInstruction,
+    Instruction,
+    IOMemoryInstructionImm,
+    IOMemoryInstructionReg,
+    IOOutInstruction,
+    IORstInstruction,
+    JumpEqInstruction,
+    JumpInstruction,
+    ManagementInstruction,
+    Opcode,
+    Program,
+    Registers,
+    RetInstruction,
+    instruction_ticks,
+)
+from src.machine_config import DEFAULT_CONFIG, MachineConfig
+from src.profiler import Profiler
+
+ALU_SOURCE = {
+    Opcode.ADD: "+",
+    Opcode.SUB: "-",
+    Opcode.MUL: "*",
+    Opcode.DIV: "//",
+}
+
+TERMINATORS = (
+    JumpInstruction,
+    JumpEqInstruction,
+    CallInstruction,
+    RetInstruction,
+    IORstInstruction,
+)
+
+
+class Block(NamedTuple):
+    run: Callable[[ControlUnit, DataPath], None]
+    length: int
+    # ticks spent before the last instruction starts, an interrupt request
+    # is only sampled at instruction starts
+    lead_ticks: int
+    source: str
+
+
+def _reg(reg: Registers) -> str:
+    return "r1" if reg == Registers.R1 else "r2"
+
+
+_PUSH = [
+    "if sp == 0:",
+    "    raise ValueError('Stack overflow')",
+    "mem[sp] = alu_out",
+    "sp -= 1",
+]
+
+# marks a tick taken inside an instruction, after it has set pc, only
+# read to attribute a fault to the right tick
+_TICK = "# tick"
+
+_POP = [
+    "if sp == dp.stack_base:",
+    "    raise ValueError('Stack underflow')",
+    "sp += 1",
+    "data_out = mem[sp]",
+]
+
+
+def _alu_source(
+    instr: ArithmeticInstructionReg | ArithmeticInstructionImm,
+    config: MachineConfig,
+) -> list[str]:
+    return [
+        f"alu_out = alu_l {ALU_SOURCE[instr.opcode]} alu_r",
+        f"if not {config.word_min} <= alu_out <= {config.word_max}:",
+        "    alu_out = wrap(alu_out)",
+        f"{_reg(instr.dest)} = alu_out",
+    ]
+
+
+def _pass_source(reg: str, config: MachineConfig) -> list[str]:
+    # ST, OUT and the return address of RET and RST go through the ALU as
+    # reg + 0
+    return [
+        f"alu_l = {reg}",
+        "alu_r = 0",
+        "alu_out = alu_l",
+        f"if not {config.word_min} <= alu_out <= {config.word_max}:",
+        "    alu_out = wrap(alu_out)",
+    ]
+
+
+def _instruction_source(
+    instr: Instruction, pc: int, config: MachineConfig = DEFAULT_CONFIG
+) -> list[str]:
+    # mirrors fast_engine, with the DataPath registers held in locals
+    if isinstance(instr, ArithmeticInstructionReg):
+        return [
+            "alu_l = r1",
+            f"alu_r = {_reg(instr.src)}",
+            *_alu_source(instr, config),
+        ]
+    if isinstance(instr, ArithmeticInstructionImm):
+        return [
+            f"alu_r = {instr.src}",
+            f"alu_l = {_reg(instr.dest)}",
+            *_alu_source(instr, config),
+        ]
+    if isinstance(instr, (IOMemoryInstructionImm, IOMemoryInstructionReg)):
+        if isinstance(instr, IOMemoryInstructionImm):
+            addr = str(instr.src)
+        else:
+            addr = _reg(instr.src)
+        if instr.opcode == Opcode.LD:
+            return [
+                f"data_out = mem[{addr}]",
+                f"{_reg(instr.dest)} = data_out",
+            ]
+        return [
+            *_pass_source(_reg(instr.dest), config),
+            f"mem[{addr}] = alu_out",
+        ]
+    if isinstance(instr, IOOutInstruction):
+        return [
+            *_pass_source(_reg(instr.src), config),
+            "out(alu_out)",
+        ]
+    if isinstance(instr, JumpInstruction):
+        return [f"pc = {instr.addr}"]
+    if isinstance(instr, JumpEqInstruction):
+        return [f"pc = {instr.addr} if {_reg(instr.src)} == 0 else {pc + 1}"]
+    if isinstance(instr, CallInstruction):
+        return [
+            f"alu_l = alu_out = {pc}",
+            "alu_r = 0",
+            *_PUSH,
+            f"pc = {instr.addr}",
+        ]
+    if isinstance(instr, RetInstruction):
+        return [
+            *_POP,
+            "r1 = data_out",
+            *_pass_source("r1", config),
+            "pc = alu_out",
+        ]
+    if isinstance(instr, IORstInstruction):
+        return [
+            *_POP,
+            *_POP,
+            "r1 = data_out",
+            *_pass_source("r1", config),
+            "pc = alu_out",
+            _TICK,
+            *_POP,
+            "r2 = data_out",
+            _TICK,
+            *_POP,
+            "r1 = data_out",
+        ]
+    raise ValueError(f"Cannot compile instruction {instr}")
+
+
+def block_instructions(program: Program, entry: int) -> list[Instruction]:
+    # straight-line run from entry up to and including the first control
+    # transfer, HLT is left to the interpreter
+    instructions = program.instructions
+    block: list[Instruction] = []
+    pc = entry
+    while pc < len(instructions):
+        instr = instructions[pc]
+        if isinstance(instr, ManagementInstruction):
+            break
+        block.append(instr)
+        if isinstance(instr, TERMINATORS):
+            break
+        pc += 1
+    return block
+
+
+def compile_block(
+    program: Program, entry: int, config: MachineConfig = DEFAULT_CONFIG
+) -> Block | None:
+    instructions = block_instructions(program, entry)
+    if not instructions:
+        return None
+
+    prologue = [
+        "r1 = dp.r1",
+        "r2 = dp.r2",
+        "alu_l = dp.alu_l",
+        "alu_r = dp.alu_r",
+        "alu_out = dp.alu_out",
+        "data_out = dp.data_out",
+        "sp = dp.stack_pointer",
+        "mem = dp.data_memory",
+        "out = cu.controller.output_buffer.append",
+        f"pc = {entry + len(instructions)}",
+        "try:",
+    ]
+    # source line -> PC and ticks spent in the block when it runs, a fault
+    # leaves the state the interpreter would stop in. pc is None once the
+    # instruction has set the local pc itself.
+    faults: dict[int, tuple[int | None, int]] = {}
+    body: list[str] = []
+    ticks = [instruction_ticks(instr) for instr in instructions]
+    spent = 0
+    for pc, instr in enumerate(instructions, start=entry):
+        body.append(f"# {pc}: {instr}")
+        at: int | None = pc
+        offset = spent
+        for line in _instruction_source(instr, pc, config):
+            if line == _TICK:
+                at, offset = None, offset + 1
+                continue
+            body.append(line)
+            faults[len(prologue) + len(body) + 1] = (at, offset)
+        spent += ticks[pc - entry]
+    write_back = [
+        "dp.r1 = r1",
+        "dp.r2 = r2",
+        "dp.alu_l = alu_l",
+        "dp.alu_r = alu_r",
+        "dp.alu_out = alu_out",
+        "dp.data_out = data_out",
+        "dp.stack_pointer = sp",
+    ]
+    source = "".join([
+        f"def block_{entry}(cu, dp):\n",
+        *(f"    {line}\n" for line in prologue),
+        *(f"        {line}\n" for line in body),
+        "    except BaseException as e:\n",
+        "        at, ticks = faults[e.__traceback__.tb_lineno]\n",
+        *(f"        {line}\n" for line in write_back),
+        "        cu._tick += ticks\n",
+        "        cu.program_counter = pc if at is None else at\n",
+        "        raise\n",
+        *(f"    {line}\n" for line in write_back),
+        f"    cu._tick += {spent}\n",
+        "    cu.program_counter = pc\n",
+    ])
+    namespace: dict[str, object] = {"wrap": config.wrap, "faults": faults}
+    exec(compile(source, f"<block {entry}>", "exec"), namespace)
+    return Block(
+        namespace[f"block_{entry}"],  # type: ignore
+        len(instructions),
+        sum(ticks[:-1]),
+        source,
+    )
+
+
+class BlockCompiler:
+    program: Program
+    config: MachineConfig
+    blocks: dict[int, Block | None]
+
+    def __init__(
+        self, program: Program, config: MachineConfig = DEFAULT_CONFIG
+    ) -> None:
+        self.program = program
+        self.config = config
+        self.blocks = {}
+
+    def block_at(self, pc: int) -> Block | None:
+        if pc in self.blocks:
+            return self.blocks[pc]
+        block = self.blocks[pc] = compile_block(self.program, pc, self.config)
+        return block
+
+    def run(
+        self,
+        cu: ControlUnit,
+        handlers: list[Handler],
+        limit: int,
+        profiler: Profiler | None = None,
+    ) -> None:
+        # same contract as Machine.simulate: raises StopIteration on HLT
+        # or when limit instructions have been executed. A profiler is told
+        # about every block and every instruction run on its own.
+        dp = cu.data_path
+        controller = cu.controller
+        next_interrupt = controller.next_interrupt_tick
+        count = 0
+        while count < limit:
+            pc = cu.program_counter
+            block = self.block_at(pc)
+            if (block is not None
+                    and not controller.interruption_flag
+                    and count + block.length <= limit
+                    and cu._tick + block.lead_ticks < next_interrupt):
+                # no instruction of the block can start at or after the
+                # next input, so no interrupt lands inside it
+                if profiler is not None:
+                    profiler.enter_block(pc, block.length, cu._tick)
+                block.run(cu, dp)
+                count += block.length
+                continue
+
+            count += 1
+            if cu._tick >= next_interrupt:
+                controller.interruption_flag = True
+            if profiler is not None:
+                profiler.enter(pc, cu._tick)
+            handlers[pc](cu, dp)
+            if controller.interruption_flag:
+                if profiler is not None:
+                    profiler.interrupt(cu._tick)
+                cu.check_int_request()
+                next_interrupt = controller.next_interrupt_tick
+
+        raise StopIteration("limit")
@@ -1,11 +1,51 @@
+import argparse
+import contextlib
 import logging
 import sys
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, replace
+from enum import Enum
 from pathlib import Path
+from typing import Literal, TextIO
 
+from src.cache import CacheConfig
 from src.control_unit import ControlUnit
-from src.datapath import DataPath
+from src.datapath import DataPath, Memory, dump_memory, map_memory
+from src.fast_engine import Handler, predecode, predecode_lazily
+from src.fusion import FusionTable
 from src.io_controller import IOController
-from src.isa import Program, unpack_program
+from src.io_ports import StreamOutput, iter_input_events, output_value
+from src.isa import MappedInstructions, Program, map_program, unpack_program
+from src.jit import BlockCompiler
+from src.machine_config import MachineConfig, WordWidth
+from src.profiler import Profiler, read_labels
+from src.trace import NullTraceSink, TextTraceSink, TraceSink
+from src.trace_columns import ColumnarTraceSink
+
+# "signal" drives the DataPath through ControlUnit signals,
+# "fast" runs the handler table built by fast_engine.predecode with common
+# sequences fused into superinstructions,
+# "jit" runs compiled basic blocks whenever nothing is being traced
+Engine = Literal["signal", "fast", "jit"]
+
+
+class StopReason(Enum):
+    HALT = "halt"
+    LIMIT = "limit"
+    BREAKPOINT = "breakpoint"
+    WATCHPOINT = "watchpoint"
+    TICK = "tick"
+    CONDITION = "condition"
+
+
+@dataclass(frozen=True)
+class RunResult:
+    reason: StopReason
+    instructions: int
+    tick: int
+    pc: int
+    # (address, old value, new value) of the watched cell that changed
+    watch: tuple[int, int, int] | None = None
 
 
 class Machine:
@@ -13,79 +53,368 @@ class Machine:
     datapath: DataPath
     io_controller: IOController
     program: Program
+    engine: Engine
+    handlers: list[Handler] | None
+    jit: BlockCompiler | None
+    fusion: FusionTable | None
+    profiler: Profiler | None
+    memory: Memory | None
+    config: MachineConfig
+    breakpoints: set[int]
+    watchpoints: set[int]
 
-    def __init__(self) -> None:
-        self.data_memory_size = 256
-        self.datapath = DataPath(self.data_memory_size)
-        self.io_controller = IOController()
+    def __init__(
+        self,
+        cache: CacheConfig | None = None,
+        profiler: Profiler | None = None,
+        memory: Memory | None = None,
+        config: MachineConfig | None = None,
+    ) -> None:
+        # memory is kept across resets, it is the image the machine runs on
+        config = config or MachineConfig()
+        if memory is not None and len(memory) != config.data_memory_size:
+            config = replace(config, data_memory_size=len(memory))
+        self.config = config
+        self.memory = memory
+        self.cache_config = cache
         self.program = Program(entry=0, instructions=[])
-        self.cu = ControlUnit(self.program, self.datapath, self.io_controller)
+        self.engine = "signal"
+        self.handlers = None
+        self.jit = None
+        self.fusion = None
+        self.profiler = profiler
+        # run_until() and step() stop before a breakpoint PC and after an
+        # instruction that changes a watched memory cell
+        self.breakpoints = set()
+        self.watchpoints = set()
+        self.reset()
+
+    def reset(self) -> None:
+        # back to the power-on state, the loaded program and its
+        # predecoded handlers survive so the machine can be reused
+        self.datapath = DataPath(
+            self.config.data_memory_size, self.cache_config, self.memory,
+            self.config)
+        self.io_controller = IOController()
+        self.cu = ControlUnit(self.program, self.datapath, self.io_controller,
+                              self.profiler)
     
-    def load_program(self, program: Program) -> None:
+    def load_program(self, program: Program, engine: Engine = "signal") -> None:
+        if program is self.program and engine == self.engine:
+            return
         self.program = program
+        self.engine = engine
         self.cu.program = program
+        cached = self.datapath.cache is not None
+        # a mapped image is only decoded where it runs
+        decode = (predecode_lazily
+                  if isinstance(program.instructions, MappedInstructions)
+                  else predecode)
+        self.handlers = (
+            decode(program, cached, self.config) if engine != "signal" else None
+        )
+        # compiled blocks access memory directly, so a cache keeps the
+        # jit engine on the predecoded handlers
+        self.jit = (
+            BlockCompiler(program, self.config)
+            if engine == "jit" and not cached else None
+        )
+        # fusion scans every instruction, a mapped image stays lazy
+        self.fusion = (
+            FusionTable(program, cached, self.config)
+            if engine == "fast" and decode is predecode else None
+        )
 
-    def simulate(self, 
-        input_buffer: list[tuple[int, int]], 
-        program: Program, data_memory_size: int = 100, 
-        limit: int = 100000
+    def resize_data_memory(self, data_memory_size: int) -> None:
+        # a fresh data path of the new size, handlers only depend on the
+        # word width so the loaded program keeps them
+        if self.memory is not None:
+            raise ValueError("Cannot resize memory the machine was given")
+        self.config = replace(self.config, data_memory_size=data_memory_size)
+        self.datapath = DataPath(
+            data_memory_size, self.cache_config, None, self.config)
+        self.cu.data_path = self.datapath
+
+    def executor(self) -> Callable[[], None]:
+        cu, handlers = self.cu, self.handlers
+        if handlers is None:
+            instructions = self.program.instructions
+            return lambda: cu.decode_and_execute_instruction(
+                instructions[cu.program_counter])
+        dp = self.datapath
+        return lambda: handlers[cu.program_counter](cu, dp)
+
+    def prepare(
+        self,
+        input_buffer: Iterable[tuple[int, int]],
+        program: Program,
+        data_memory_size: int | None = None,
+        engine: Engine = "signal",
     ) -> None:
-        self.load_program(program)
-        self.io_controller.input_buffer = input_buffer
-        self.datapath.data_memory_size = data_memory_size
+        # everything simulate does before the first instruction, step() and
+        # run_until() continue from here
+        if (data_memory_size is not None
+                and data_memory_size != self.config.data_memory_size):
+            self.resize_data_memory(data_memory_size)
+        self.load_program(program, engine)
+        self.io_controller.load_input(input_buffer)
         self.cu.program_counter = program.entry
 
+    def simulate(self, 
+        input_buffer: Iterable[tuple[int, int]], 
+        program: Program, data_memory_size: int | None = None,
+        limit: int = 100000,
+        engine: Engine = "signal",
+        trace: TraceSink | None = None,
+    ) -> None:
+        self.prepare(input_buffer, program, data_memory_size, engine)
+
+        trace = trace or TextTraceSink()
+
         logging.info("Starting simulation")
-        logging.info(self.cu)
-        logging.info("")
+        if trace.enabled:
+            trace.record(self.cu)
+
+        self.run(limit, trace)
+
+    def run(self, limit: int = 100000, trace: TraceSink | None = None) -> None:
+        # continues from the current state, raises StopIteration on HLT
+        # and StopIteration("limit") after limit instructions
+        trace = trace or TextTraceSink()
+        tracing = trace.enabled
+        cu = self.cu
+        profiler = cu.profiler
+
+        if (self.jit is not None and self.handlers is not None
+                and not tracing):
+            try:
+                self.jit.run(cu, self.handlers, limit, profiler)
+            finally:
+                if profiler is not None:
+                    profiler.close(cu._tick)
+        if (self.fusion is not None and self.handlers is not None
+                and not tracing):
+            try:
+                self.fusion.run(cu, self.handlers, limit, profiler)
+            finally:
+                if profiler is not None:
+                    profiler.close(cu._tick)
 
         count = 0
-        controller_in_buffer = self.io_controller.input_buffer
+        controller = self.io_controller
+        next_interrupt = controller.next_interrupt_tick
+        execute = self.executor()
 
         while count < limit:
             count += 1
-            if (len(controller_in_buffer) > 0 and 
-                self.cu._tick >= controller_in_buffer[0][0]):
-                self.io_controller.interruption_flag = True
-            
-            instr = program.instructions[self.cu.program_counter]
-            self.cu.decode_and_execute_instruction(instr)
+            if cu._tick >= next_interrupt:
+                controller.interruption_flag = True
+            if profiler is not None:
+                profiler.enter(cu.program_counter, cu._tick)
+
+            execute()
 
-            logging.info(self.cu)
-            logging.info("")
+            if tracing:
+                trace.record(cu)
             
-            self.cu.check_int_request()
-        
-        raise StopIteration()
+            if controller.interruption_flag:
+                if profiler is not None:
+                    profiler.interrupt(cu._tick)
+                cu.check_int_request()
+                next_interrupt = controller.next_interrupt_tick
 
+        if profiler is not None:
+            profiler.close(cu._tick)
+        raise StopIteration("limit")
 
-def main(code_file: Path, input_file: Path) -> None:
-    # read code_file and decode each instruction using unpack
-    with code_file.open("rb") as f:
-        source = f.read()
+    def step(self, n: int = 1, trace: TraceSink | None = None) -> RunResult:
+        return self.run_until(limit=n, trace=trace)
 
-    program = unpack_program(source)
+    def run_until(
+        self,
+        pc: int | None = None,
+        tick: int | None = None,
+        predicate: Callable[["Machine"], bool] | None = None,
+        limit: int = 100000,
+        trace: TraceSink | None = None,
+    ) -> RunResult:
+        # stops before the instruction at pc or at a breakpoint, at the first
+        # instruction start at or after tick, or after an instruction that
+        # changes a watched cell or makes predicate true. The instruction
+        # the run starts at never stops it, so a stopped run can continue.
+        # Nothing is recorded unless a trace is given, and stretches where
+        # no stop can happen run as compiled blocks.
+        cu, dp, controller = self.cu, self.datapath, self.io_controller
+        stops = self.breakpoints if pc is None else self.breakpoints | {pc}
+        trace = trace or NullTraceSink()
+        tracing = trace.enabled
+        profiler = cu.profiler
+        # watched cells are read through any data cache, as a load would
+        watched = sorted(self.watchpoints)
+        read = (dp.data_memory.__getitem__ if dp.cache is None
+                else dp.cache.peek)
+        values = [read(addr) for addr in watched]
+        jit = self.jit if (
+            self.handlers is not None and not tracing
+            and predicate is None and not watched) else None
+        # block entry -> no breakpoint after the first instruction
+        clear: dict[int, bool] = {}
+        next_interrupt = controller.next_interrupt_tick
+        execute = self.executor()
+        count = 0
 
-    with open(input_file) as file:
-        data = eval(file.read())
+        def stop(
+            reason: StopReason, watch: tuple[int, int, int] | None = None
+        ) -> RunResult:
+            if profiler is not None:
+                profiler.close(cu._tick)
+            return RunResult(reason, count, cu._tick, cu.program_counter,
+                             watch)
 
-    converted_data = [(int(x[0]), ord(x[1])) for x in data]
-    
-    machine = Machine()
-    try:
-        machine.simulate(converted_data, program)
-    except StopIteration:
-        logging.info("Simulation finished")
-        logging.info("Output buffer:")
-        print([
-            chr(c)
-            for c in machine.io_controller.output_buffer
-        ])
+        while count < limit:
+            at = cu.program_counter
+            if count and at in stops:
+                return stop(StopReason.BREAKPOINT)
+            if tick is not None and cu._tick >= tick:
+                return stop(StopReason.TICK)
+
+            if jit is not None and not controller.interruption_flag:
+                block = jit.block_at(at)
+                if (block is not None
+                        and count + block.length <= limit
+                        and cu._tick + block.lead_ticks < next_interrupt
+                        and (tick is None
+                             or cu._tick + block.lead_ticks < tick)):
+                    runnable = clear.get(at)
+                    if runnable is None:
+                        runnable = clear[at] = stops.isdisjoint(
+                            range(at + 1, at + block.length))
+                    if runnable:
+                        if profiler is not None:
+                            profiler.enter_block(at, block.length, cu._tick)
+                        block.run(cu, dp)
+                        count += block.length
+                        continue
+
+            count += 1
+            if cu._tick >= next_interrupt:
+                controller.interruption_flag = True
+            if profiler is not None:
+                profiler.enter(at, cu._tick)
+            try:
+                execute()
+            except StopIteration:
+                return stop(StopReason.HALT)
+            if tracing:
+                trace.record(cu)
+            if controller.interruption_flag:
+                if profiler is not None:
+                    profiler.interrupt(cu._tick)
+                cu.check_int_request()
+                next_interrupt = controller.next_interrupt_tick
+
+            for i, addr in enumerate(watched):
+                value = read(addr)
+                if value != values[i]:
+                    return stop(StopReason.WATCHPOINT,
+                                (addr, values[i], value))
+            if predicate is not None and predicate(self):
+                return stop(StopReason.CONDITION)
+        return stop(StopReason.LIMIT)
+
+
+def main(
+    code_file: Path,
+    input_file: Path,
+    engine: Engine = "signal",
+    cache: CacheConfig | None = None,
+    output: TextIO | None = None,
+    profile: Path | None = None,
+    labels: Path | None = None,
+    mapped: bool = False,
+    memory_image: Path | None = None,
+    memory_dump: Path | None = None,
+    config: MachineConfig | None = None,
+    columnar_trace: Path | None = None,
+) -> None:
+    # read code_file and decode each instruction using unpack, or map it
+    # and decode every PC on its first fetch
+    program = (map_program(code_file) if mapped
+               else unpack_program(code_file.read_bytes()))
+
+    profiler = None
+    if profile is not None:
+        profiler = Profiler(
+            program, read_labels(labels) if labels is not None else None)
+    config = config or MachineConfig()
+    memory = (map_memory(memory_image, config.data_memory_size)
+              if memory_image is not None else None)
+    machine = Machine(cache, profiler, memory, config)
+    if output is not None:
+        machine.io_controller.output_buffer = StreamOutput(output)
+    trace = (ColumnarTraceSink(columnar_trace)
+             if columnar_trace is not None else None)
+
+    # input events are parsed lazily while the machine runs, "-" is stdin
+    with (contextlib.nullcontext(sys.stdin) if str(input_file) == "-"
+          else input_file.open()) as file:
+        try:
+            machine.simulate(iter_input_events(file), program, engine=engine,
+                             trace=trace)
+        except StopIteration:
+            logging.info("Simulation finished")
+            output_buffer = machine.io_controller.output_buffer
+            if isinstance(output_buffer, StreamOutput):
+                output_buffer.flush()
+            else:
+                logging.info("Output buffer:")
+                print([output_value(c) for c in output_buffer])
+            if machine.datapath.cache is not None:
+                machine.datapath.cache.flush()
+                logging.info(f"Cache stats: {machine.datapath.cache.stats}")
+            if machine.fusion is not None:
+                logging.info(f"Fusion stats: {machine.fusion.stats()}")
+            if profiler is not None and profile is not None:
+                profiler.write(profile)
+            if memory_dump is not None:
+                dump_memory(machine.datapath.data_memory, memory_dump)
+        finally:
+            if trace is not None:
+                trace.close()
 
         
 if __name__ == "__main__":
-    assert len(sys.argv) == 3, "Usage: python machine.py <compiled.bin> <input.txt>"
+    parser = argparse.ArgumentParser(description="Run a compiled program")
+    parser.add_argument("code_file", type=Path)
+    parser.add_argument("input_file", type=Path, help="input stream, - for stdin")
+    parser.add_argument("engine", nargs="?", default="signal",
+                        choices=["signal", "fast", "jit"])
+    parser.add_argument("--stream", action="store_true",
+                        help="write output to stdout while running")
+    parser.add_argument("--profile", type=Path, default=None,
+                        help="write a profile: *.json, *.folded or flat text")
+    parser.add_argument("--labels", type=Path, default=None,
+                        help="label map written by the compiler")
+    parser.add_argument("--mmap", action="store_true",
+                        help="map the program and decode it on first fetch")
+    parser.add_argument("--memory-image", type=Path, default=None,
+                        help="initialize data memory from a mapped file")
+    parser.add_argument("--dump-memory", type=Path, default=None,
+                        help="write data memory to a file when finished")
+    parser.add_argument("--memory-size", type=int, default=256,
+                        help="data memory cells")
+    parser.add_argument("--word-width", type=int, default=64,
+                        choices=[16, 32, 64])
+    parser.add_argument("--stack-base", type=int, default=None,
+                        help="first stack cell, the last one by default")
+    parser.add_argument("--columnar-trace", type=Path, default=None,
+                        help="write a columnar trace to this directory")
+    args = parser.parse_args()
+    word_width: WordWidth = args.word_width
     logging.basicConfig(level=logging.INFO)
-    compiled_path = Path(sys.argv[1])
-    input_path = Path(sys.argv[2])
-    main(compiled_path, input_path)
+    main(args.code_file, args.input_file, args.engine,
+         output=sys.stdout if args.stream else None,
+         profile=args.profile, labels=args.labels, mapped=args.mmap,
+         memory_image=args.memory_image, memory_dump=args.dump_memory,
+         config=MachineConfig(args.memory_size, word_width, args.stack_base),
+         columnar_trace=args.columnar_trace)
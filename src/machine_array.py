@@ -0,0 +1,387 @@
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.isa import ArgType, Opcode, Program, Registers, decode_columns, pack_program
+from src.machine import Machine
+from src.machine_config import DEFAULT_CONFIG, MachineConfig
+from src.trace import NullTraceSink
+
+# tick of the input after the last one of a lane
+_NEVER = np.iinfo(np.int64).max
+
+_R1 = Registers.R1.value
+_IMM = ArgType.IMM.value
+
+
+@dataclass
+class LaneResult:
+    # exit_reason as in batch: "halt", "limit" or "error: <type>: <message>"
+    exit_reason: str
+    ticks: int
+    instructions: int
+    output: list[int]
+
+
+class MachineArray:
+    # N machines running one program in lockstep, every step executes one
+    # instruction on each running lane. Lanes are grouped by the opcode at
+    # their PC and every group is applied as array operations, a lane that
+    # branches, halts or takes an interrupt only changes its own row. The
+    # latch sequence of every instruction matches fast_engine, so each lane
+    # ends in the state a scalar Machine reaches on the same input.
+    config: MachineConfig
+    lanes: int
+    program_size: int
+    opcode: np.ndarray
+    arg_type: np.ndarray
+    dest: np.ndarray
+    src: np.ndarray
+    imm: np.ndarray
+    pc: np.ndarray
+    tick: np.ndarray
+    r1: np.ndarray
+    r2: np.ndarray
+    alu_l: np.ndarray
+    alu_r: np.ndarray
+    alu_out: np.ndarray
+    data_out: np.ndarray
+    sp: np.ndarray
+    memory: np.ndarray
+    interrupt: np.ndarray
+    running: np.ndarray
+    instructions: np.ndarray
+    event_ticks: np.ndarray
+    event_values: np.ndarray
+    next_event: np.ndarray
+    outputs: list[list[int]]
+    exit_reasons: list[str | None]
+    _execute: dict[int, Callable[[np.ndarray, np.ndarray], None]]
+
+    def __init__(
+        self,
+        program: Program,
+        input_streams: Sequence[Iterable[tuple[int, int]]],
+        config: MachineConfig = DEFAULT_CONFIG,
+    ) -> None:
+        self.config = config
+        n = self.lanes = len(input_streams)
+        columns = decode_columns(pack_program(program)[2:], use_numpy=True)
+        self.program_size = len(program.instructions)
+        self.opcode = np.asarray(columns.opcode, dtype=np.int64)
+        self.arg_type = np.asarray(columns.arg_type, dtype=np.int64)
+        self.dest = np.asarray(columns.dest, dtype=np.int64)
+        self.src = np.asarray(columns.src, dtype=np.int64)
+        self.imm = np.asarray(columns.imm, dtype=np.int64)
+
+        def registers(value: int = 0) -> np.ndarray:
+            return np.full(n, value, dtype=np.int64)
+
+        self.pc = registers(program.entry)
+        self.tick = registers()
+        self.r1, self.r2 = registers(), registers()
+        self.alu_l, self.alu_r, self.alu_out = (
+            registers(), registers(), registers())
+        self.data_out = registers()
+        self.sp = registers(config.initial_stack_pointer)
+        self.memory = np.zeros((n, config.data_memory_size), dtype=np.int64)
+        self.interrupt = np.zeros(n, dtype=bool)
+        self.running = np.ones(n, dtype=bool)
+        self.instructions = registers()
+
+        events = [list(stream) for stream in input_streams]
+        width = max((len(e) for e in events), default=0) + 1
+        self.event_ticks = np.full((n, width), _NEVER, dtype=np.int64)
+        self.event_values = np.zeros((n, width), dtype=np.int64)
+        for lane, lane_events in enumerate(events):
+            for i, (tick, value) in enumerate(lane_events):
+                self.event_ticks[lane, i] = tick
+                self.event_values[lane, i] = value
+        self.next_event = registers()
+
+        self.outputs = [[] for _ in range(n)]
+        self.exit_reasons = [None] * n
+        self._execute = {
+            Opcode.ADD.value: self._arithmetic(np.add),
+            Opcode.SUB.value: self._arithmetic(np.subtract),
+            Opcode.MUL.value: self._arithmetic(np.multiply),
+            Opcode.DIV.value: self._arithmetic(np.floor_divide),
+            Opcode.LD.value: self._load,
+            Opcode.ST.value: self._store,
+            Opcode.OUT.value: self._out,
+            Opcode.JMP.value: self._jump,
+            Opcode.JE.value: self._jump_eq,
+            Opcode.CALL.value: self._call,
+            Opcode.RET.value: self._ret,
+            Opcode.RST.value: self._rst,
+            Opcode.HLT.value: self._halt,
+        }
+
+    def _stop(self, lanes: np.ndarray, reason: str) -> None:
+        self.running[lanes] = False
+        for lane in lanes.tolist():
+            self.exit_reasons[lane] = reason
+
+    def _wrap(self, values: np.ndarray) -> np.ndarray:
+        # int64 arithmetic already wraps like a 64-bit word
+        width = self.config.word_width
+        if width == 64:
+            return values
+        half = 1 << (width - 1)
+        return ((values + half) & ((half << 1) - 1)) - half
+
+    def _register(self, lanes: np.ndarray, select: np.ndarray) -> np.ndarray:
+        return np.where(select == _R1, self.r1[lanes], self.r2[lanes])
+
+    def _latch(
+        self, lanes: np.ndarray, select: np.ndarray, values: np.ndarray
+    ) -> None:
+        to_r1 = select == _R1
+        self.r1[lanes[to_r1]] = values[to_r1]
+        self.r2[lanes[~to_r1]] = values[~to_r1]
+
+    def _advance(self, lanes: np.ndarray, ticks: int = 1) -> None:
+        self.tick[lanes] += ticks
+        self.pc[lanes] += 1
+
+    def _arithmetic(
+        self, op: Callable[[np.ndarray, np.ndarray], np.ndarray]
+    ) -> Callable[[np.ndarray, np.ndarray], None]:
+        def execute(lanes: np.ndarray, pcs: np.ndarray) -> None:
+            immediate = self.arg_type[pcs] == _IMM
+            dest = self.dest[pcs]
+            # the left ALU input of register forms is always R1
+            left = np.where(immediate, self._register(lanes, dest),
+                            self.r1[lanes])
+            right = np.where(immediate, self.imm[pcs],
+                             self._register(lanes, self.src[pcs]))
+            if op is np.floor_divide:
+                zero = right == 0
+                if zero.any():
+                    self._stop(lanes[zero], "error: ZeroDivisionError:"
+                               " integer division or modulo by zero")
+                    keep = ~zero
+                    lanes, dest = lanes[keep], dest[keep]
+                    left, right = left[keep], right[keep]
+            with np.errstate(over="ignore"):
+                result = self._wrap(op(left, right))
+            self.alu_l[lanes] = left
+            self.alu_r[lanes] = right
+            self.alu_out[lanes] = result
+            self._latch(lanes, dest, result)
+            self._advance(lanes)
+        return execute
+
+    def _address(
+        self, lanes: np.ndarray, pcs: np.ndarray, message: str
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # negative addresses index from the end like the scalar list does
+        addr = np.where(self.arg_type[pcs] == _IMM, self.imm[pcs],
+                        self._register(lanes, self.src[pcs]))
+        size = self.config.data_memory_size
+        bad = (addr < -size) | (addr >= size)
+        if bad.any():
+            self._stop(lanes[bad], f"error: IndexError: {message}")
+            keep = ~bad
+            lanes, pcs, addr = lanes[keep], pcs[keep], addr[keep]
+        return lanes, pcs, addr % size
+
+    def _load(self, lanes: np.ndarray, pcs: np.ndarray) -> None:
+        lanes, pcs, addr = self._address(
+            lanes, pcs, "list index out of range")
+        values = self.memory[lanes, addr]
+        self.data_out[lanes] = values
+        self._latch(lanes, self.dest[pcs], values)
+        self._advance(lanes)
+
+    def _store(self, lanes: np.ndarray, pcs: np.ndarray) -> None:
+        lanes, pcs, addr = self._address(
+            lanes, pcs, "list assignment index out of range")
+        # the value goes through the ALU as value + 0, which wraps an input
+        # that R2 holds as it came
+        values = self._register(lanes, self.dest[pcs])
+        self.alu_l[lanes] = values
+        self.alu_r[lanes] = 0
+        self.alu_out[lanes] = values = self._wrap(values)
+        self.memory[lanes, addr] = values
+        self._advance(lanes)
+
+    def _out(self, lanes: np.ndarray, pcs: np.ndarray) -> None:
+        # bit 11 selects the register of OUT and JE
+        values = self._register(lanes, self.arg_type[pcs])
+        self.alu_l[lanes] = values
+        self.alu_r[lanes] = 0
+        self.alu_out[lanes] = values = self._wrap(values)
+        for lane, value in zip(lanes.tolist(), values.tolist(), strict=True):
+            self.outputs[lane].append(value)
+        self._advance(lanes)
+
+    def _jump(self, lanes: np.ndarray, pcs: np.ndarray) -> None:
+        self.pc[lanes] = self.imm[pcs]
+        self.tick[lanes] += 1
+
+    def _jump_eq(self, lanes: np.ndarray, pcs: np.ndarray) -> None:
+        taken = self._register(lanes, self.arg_type[pcs]) == 0
+        self.pc[lanes] = np.where(taken, self.imm[pcs], pcs + 1)
+        self.tick[lanes] += 1
+
+    def _push(
+        self, lanes: np.ndarray, values: list[np.ndarray]
+    ) -> np.ndarray:
+        # pushes values in order and returns the mask of lanes that had
+        # room for all of them, the others overflow
+        sp = self.sp[lanes]
+        kept = sp >= len(values)
+        self._stop(lanes[~kept], "error: ValueError: Stack overflow")
+        lanes, sp = lanes[kept], sp[kept]
+        for i, value in enumerate(values):
+            self.memory[lanes, sp - i] = value[kept]
+        self.sp[lanes] = sp - len(values)
+        return kept
+
+    def _pop(self, lanes: np.ndarray, count: int) -> tuple[np.ndarray, list]:
+        sp = self.sp[lanes]
+        # the scalar pops one cell at a time and stops at the stack base
+        underflow = sp + count > self.config.initial_stack_pointer
+        self._stop(lanes[underflow], "error: ValueError: Stack underflow")
+        lanes, sp = lanes[~underflow], sp[~underflow]
+        values = [self.memory[lanes, sp + i] for i in range(1, count + 1)]
+        self.sp[lanes] = sp + count
+        return lanes, values
+
+    def _call(self, lanes: np.ndarray, pcs: np.ndarray) -> None:
+        kept = self._push(lanes, [pcs])
+        lanes, pcs = lanes[kept], pcs[kept]
+        self.alu_l[lanes] = self.alu_out[lanes] = pcs
+        self.alu_r[lanes] = 0
+        self.pc[lanes] = self.imm[pcs]
+        self.tick[lanes] += 2
+
+    def _ret(self, lanes: np.ndarray, pcs: np.ndarray) -> None:
+        lanes, (address,) = self._pop(lanes, 1)
+        self.data_out[lanes] = self.r1[lanes] = self.alu_l[lanes] = address
+        self.alu_r[lanes] = 0
+        self.alu_out[lanes] = self.pc[lanes] = self._wrap(address)
+        self.tick[lanes] += 1
+
+    def _rst(self, lanes: np.ndarray, pcs: np.ndarray) -> None:
+        # drops the address pushed by CALL INT, then restores PC, R2, R1
+        lanes, (_, address, r2, r1) = self._pop(lanes, 4)
+        self.alu_l[lanes] = address
+        self.alu_r[lanes] = 0
+        self.alu_out[lanes] = self.pc[lanes] = self._wrap(address)
+        self.r2[lanes] = r2
+        self.r1[lanes] = self.data_out[lanes] = r1
+        self.tick[lanes] += 3
+
+    def _halt(self, lanes: np.ndarray, pcs: np.ndarray) -> None:
+        self._stop(lanes, "halt")
+
+    def _service_interrupts(self, lanes: np.ndarray) -> None:
+        # pushes R1, R2 and PC, jumps to the CALL INT at 0 with the input
+        # in R2, four ticks like ControlUnit.check_int_request. The
+        # registers are pushed through the ALU, which wraps them.
+        pcs = self.pc[lanes]
+        kept = self._push(lanes, [self._wrap(self.r1[lanes]),
+                                  self._wrap(self.r2[lanes]), pcs])
+        lanes, pcs = lanes[kept], pcs[kept]
+        self.alu_l[lanes] = self.alu_out[lanes] = pcs
+        self.alu_r[lanes] = 0
+        self.pc[lanes] = 0
+        self.r2[lanes] = self.event_values[lanes, self.next_event[lanes]]
+        self.next_event[lanes] += 1
+        self.interrupt[lanes] = False
+        self.tick[lanes] += 4
+
+    def step(self) -> None:
+        lanes = np.flatnonzero(self.running)
+        if not lanes.size:
+            return
+        pcs = self.pc[lanes]
+        outside = (pcs < 0) | (pcs >= self.program_size)
+        if outside.any():
+            self._stop(lanes[outside],
+                       "error: IndexError: list index out of range")
+            lanes, pcs = lanes[~outside], pcs[~outside]
+
+        self.instructions[lanes] += 1
+        next_tick = self.event_ticks[lanes, self.next_event[lanes]]
+        self.interrupt[lanes] |= self.tick[lanes] >= next_tick
+
+        opcodes = self.opcode[pcs]
+        for opcode in np.unique(opcodes).tolist():
+            group = opcodes == opcode
+            self._execute[opcode](lanes[group], pcs[group])
+
+        serve = lanes[self.running[lanes] & self.interrupt[lanes]]
+        if serve.size:
+            self._service_interrupts(serve)
+
+    def run(self, limit: int = 100000) -> list[LaneResult]:
+        for _ in range(limit):
+            if not self.running.any():
+                break
+            self.step()
+        self._stop(np.flatnonzero(self.running), "limit")
+        return [self.result(lane) for lane in range(self.lanes)]
+
+    def result(self, lane: int) -> LaneResult:
+        return LaneResult(
+            self.exit_reasons[lane] or "running",
+            int(self.tick[lane]),
+            int(self.instructions[lane]),
+            self.outputs[lane],
+        )
+
+    def lane_state(self, lane: int) -> tuple:
+        return (
+            int(self.tick[lane]), int(self.pc[lane]),
+            int(self.r1[lane]), int(self.r2[lane]), int(self.sp[lane]),
+            int(self.alu_l[lane]), int(self.alu_r[lane]),
+            int(self.alu_out[lane]), int(self.data_out[lane]),
+            self.memory[lane].tolist(), self.outputs[lane],
+        )
+
+
+def scalar_lane(
+    program: Program,
+    input_events: Iterable[tuple[int, int]],
+    limit: int = 100000,
+    config: MachineConfig = DEFAULT_CONFIG,
+) -> tuple[str, tuple]:
+    # the same input on a signal-level Machine, the reference for a lane
+    machine = Machine(config=config)
+    reason = "limit"
+    try:
+        machine.simulate(list(input_events), program, limit=limit,
+                         trace=NullTraceSink())
+    except StopIteration as e:
+        reason = "limit" if e.value == "limit" else "halt"
+    except (ValueError, IndexError, ZeroDivisionError) as e:
+        reason = f"error: {type(e).__name__}: {e}"
+    dp, cu = machine.datapath, machine.cu
+    return reason, (
+        cu._tick, cu.program_counter, dp.r1, dp.r2, dp.stack_pointer,
+        dp.alu_l, dp.alu_r, dp.alu_out, dp.data_out,
+        list(dp.data_memory), list(machine.io_controller.output_buffer),
+    )
+
+
+def mismatched_lanes(
+    array: MachineArray,
+    program: Program,
+    input_streams: Sequence[Iterable[tuple[int, int]]],
+    limit: int = 100000,
+) -> list[int]:
+    # lanes whose exit reason or final state differ from a scalar run,
+    # the state of a lane that failed is not compared
+    mismatched = []
+    for lane, events in enumerate(input_streams):
+        reason, state = scalar_lane(program, events, limit, array.config)
+        failed = reason.startswith("error")
+        if (reason != array.exit_reasons[lane]
+                or not failed and state != array.lane_state(lane)):
+            mismatched.append(lane)
+    return mismatched
+
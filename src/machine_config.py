@@ -0,0 +1,48 @@
+from dataclasses import dataclass
+from typing import Literal
+
+WordWidth = Literal[16, 32, 64]
+
+
+@dataclass(frozen=True)
+class MachineConfig:
+    data_memory_size: int = 256
+    # registers, the ALU and memory cells hold signed words of this width,
+    # arithmetic wraps around like two's complement hardware
+    word_width: WordWidth = 64
+    # the first push lands here, None is the last memory cell
+    stack_base: int | None = None
+
+    def __post_init__(self) -> None:
+        if self.word_width not in (16, 32, 64):
+            raise ValueError(
+                f"Word width must be 16, 32 or 64, got {self.word_width}")
+        if self.data_memory_size < 1:
+            raise ValueError("Data memory needs at least one cell")
+        if (self.stack_base is not None
+                and not 0 <= self.stack_base < self.data_memory_size):
+            raise ValueError(
+                f"Stack base {self.stack_base} is outside data memory")
+
+    @property
+    def initial_stack_pointer(self) -> int:
+        if self.stack_base is None:
+            return self.data_memory_size - 1
+        return self.stack_base
+
+    @property
+    def word_min(self) -> int:
+        return -(1 << (self.word_width - 1))
+
+    @property
+    def word_max(self) -> int:
+        return (1 << (self.word_width - 1)) - 1
+
+    def wrap(self, value: int) -> int:
+        # only called once a result left [word_min, word_max], so the hot
+        # paths pay for a range check instead of masking every result
+        half = 1 << (self.word_width - 1)
+        return ((value + half) & ((half << 1) - 1)) - half
+
+
+DEFAULT_CONFIG = MachineConfig()
@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import contextlib
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING
+
+from src.isa import (
+    ALU_OPERATIONS,
+    ArithmeticInstructionImm,
+    ArithmeticInstructionReg,
+    CallInstruction,
+    Instruction,
+    IOMemoryInstructionImm,
+    IOMemoryInstructionReg,
+    IORstInstruction,
+    JumpEqInstruction,
+    JumpInstruction,
+    ManagementInstruction,
+    Opcode,
+    Program,
+    Registers,
+    RetInstruction,
+    instruction_ticks,
+)
+
+if TYPE_CHECKING:
+    from src.machine import Engine
+
+JUMPS = (JumpInstruction, JumpEqInstruction, CallInstruction)
+
+
+@dataclass
+class IRProgram:
+    # the compiled program before packing, jump targets and labels are
+    # instruction indices
+    instructions: list[Instruction]
+    labels: dict[str, int]
+    entry: int
+
+    @classmethod
+    def from_program(
+        cls, program: Program, labels: dict[str, int] | None = None
+    ) -> IRProgram:
+        return cls(list(program.instructions), dict(labels or {}),
+                   program.entry)
+
+    def to_program(self) -> Program:
+        return Program(self.entry, self.instructions)
+
+    def targets(self) -> set[int]:
+        return {
+            instr.addr for instr in self.instructions
+            if isinstance(instr, JUMPS)
+        } | {0, self.entry}
+
+    def remove(self, removed: Iterable[int]) -> IRProgram:
+        # an address that pointed at a removed instruction now points at the
+        # next one kept, which is where execution would have fallen through
+        dropped = set(removed)
+        # PC 0 is where the machine jumps on every interrupt
+        assert 0 not in dropped, "PC 0 holds CALL INT and cannot be removed"
+        new_address = []
+        kept = 0
+        for pc in range(len(self.instructions) + 1):
+            new_address.append(kept)
+            if pc not in dropped:
+                kept += 1
+
+        instructions = []
+        for pc, instr in enumerate(self.instructions):
+            if pc in dropped:
+                continue
+            if isinstance(instr, JUMPS):
+                instr = replace(instr, addr=new_address[instr.addr])
+            instructions.append(instr)
+        return IRProgram(
+            instructions,
+            {label: new_address[addr] for label, addr in self.labels.items()},
+            new_address[self.entry],
+        )
+
+
+Pass = Callable[[IRProgram], IRProgram]
+
+
+def _is_identity(instr: Instruction) -> bool:
+    if not isinstance(instr, ArithmeticInstructionImm):
+        return False
+    if instr.opcode in (Opcode.ADD, Opcode.SUB):
+        return instr.src == 0
+    return instr.src == 1
+
+
+def _writes_r2(instr: Instruction) -> bool:
+    if isinstance(instr, (IOMemoryInstructionImm, IOMemoryInstructionReg)):
+        return instr.opcode == Opcode.LD and instr.dest == Registers.R2
+    return (isinstance(instr, (ArithmeticInstructionImm,
+                               ArithmeticInstructionReg))
+            and instr.dest == Registers.R2)
+
+
+def _raw_input_pcs(ir: IRProgram) -> set[int]:
+    # an interrupt enters at PC 0 with the input in R2 as it was read, which
+    # may not fit a narrow word. These are the PCs that can run before R2 is
+    # written, everything else only ever holds values the ALU has wrapped.
+    raw: set[int] = set()
+    pending = [0]
+    while pending:
+        pc = pending.pop()
+        if pc in raw or pc >= len(ir.instructions):
+            continue
+        raw.add(pc)
+        if not _writes_r2(ir.instructions[pc]):
+            pending.extend(_successors(pc, ir.instructions[pc]))
+    return raw
+
+
+def remove_identities(ir: IRProgram) -> IRProgram:
+    # ADD/SUB Rx, 0 and MUL/DIV Rx, 1 leave a register that fits the word as
+    # it was, but wrap a raw input. A jump to the next instruction goes
+    # there anyway.
+    raw = _raw_input_pcs(ir)
+    return ir.remove(
+        pc for pc, instr in enumerate(ir.instructions)
+        if (_is_identity(instr)
+            and not (pc in raw and instr.dest == Registers.R2))  # type: ignore
+        or (isinstance(instr, (JumpInstruction, JumpEqInstruction))
+            and instr.addr == pc + 1)
+    )
+
+
+def _known_result(
+    instr: Instruction, known: dict[Registers, int]
+) -> int | None:
+    if isinstance(instr, ArithmeticInstructionImm):
+        left = known.get(instr.dest)
+        right: int | None = instr.src
+    elif isinstance(instr, ArithmeticInstructionReg):
+        # the left ALU input is always R1
+        left = known.get(Registers.R1)
+        right = known.get(instr.src)
+        if instr.opcode == Opcode.SUB and instr.src == Registers.R1:
+            return 0
+        if instr.opcode == Opcode.MUL and 0 in (left, right):
+            return 0
+    else:
+        return None
+    if left is None or right is None:
+        return None
+    if instr.opcode == Opcode.DIV and right == 0:
+        return None
+    value = ALU_OPERATIONS[instr.opcode](left, right)
+    # only values that fit the narrowest word are folded, they are the
+    # same whatever word width the program runs with
+    if not -(1 << 15) <= value < 1 << 15:
+        return None
+    return value
+
+
+def remove_redundant_writes(ir: IRProgram) -> IRProgram:
+    # tracks register values that are provable inside a basic block, e.g.
+    # R1 after SUB R1, R1, and drops arithmetic that writes the value the
+    # register already holds. Interrupts restore R1 and R2 on RST, so only
+    # jump targets and returns forget what is known.
+    targets = ir.targets()
+    known: dict[Registers, int] = {}
+    removed = []
+    for pc, instr in enumerate(ir.instructions):
+        if pc in targets:
+            known = {}
+        if isinstance(instr, (ArithmeticInstructionImm,
+                              ArithmeticInstructionReg)):
+            value = _known_result(instr, known)
+            if value is not None and known.get(instr.dest) == value:
+                removed.append(pc)
+            elif value is None:
+                known.pop(instr.dest, None)
+            else:
+                known[instr.dest] = value
+        elif (isinstance(instr, (IOMemoryInstructionImm,
+                                 IOMemoryInstructionReg))
+              and instr.opcode == Opcode.LD):
+            known.pop(instr.dest, None)
+        elif isinstance(instr, (CallInstruction, RetInstruction,
+                                IORstInstruction)):
+            # RET loads the return address into R1
+            known = {}
+    return ir.remove(removed)
+
+
+def thread_jumps(ir: IRProgram) -> IRProgram:
+    # JMP/JE/CALL to a JMP go straight to where that JMP leads
+    instructions = ir.instructions
+
+    def final_target(addr: int) -> int:
+        seen = set()
+        while (addr < len(instructions) and addr not in seen
+               and isinstance(instructions[addr], JumpInstruction)):
+            seen.add(addr)
+            addr = instructions[addr].addr  # type: ignore
+        return addr
+
+    threaded: list[Instruction] = []
+    for instr in instructions:
+        if isinstance(instr, JUMPS):
+            instr = replace(instr, addr=final_target(instr.addr))
+        threaded.append(instr)
+    return IRProgram(threaded, dict(ir.labels), ir.entry)
+
+
+def _successors(pc: int, instr: Instruction) -> list[int]:
+    if isinstance(instr, JumpInstruction):
+        return [instr.addr]
+    if isinstance(instr, (JumpEqInstruction, CallInstruction)):
+        return [instr.addr, pc + 1]
+    if isinstance(instr, (ManagementInstruction, RetInstruction,
+                          IORstInstruction)):
+        # RET and RST go back to addresses that are reachable already
+        return []
+    return [pc + 1]
+
+
+def remove_dead_code(ir: IRProgram) -> IRProgram:
+    # anything not reachable from PC 0 (interrupts) or the entry point
+    reachable: set[int] = set()
+    pending = [0, ir.entry]
+    while pending:
+        pc = pending.pop()
+        if pc in reachable or pc >= len(ir.instructions):
+            continue
+        reachable.add(pc)
+        pending.extend(_successors(pc, ir.instructions[pc]))
+    return ir.remove(
+        pc for pc in range(len(ir.instructions)) if pc not in reachable)
+
+
+DEFAULT_PASSES: list[Pass] = [
+    thread_jumps,
+    remove_dead_code,
+    remove_identities,
+    remove_redundant_writes,
+]
+
+
+@dataclass
+class PassReport:
+    name: str
+    instructions_removed: int
+    static_ticks_saved: int
+
+
+@dataclass
+class OptimizationReport:
+    passes: dict[str, PassReport] = field(default_factory=dict)
+
+    def add(self, name: str, before: IRProgram, after: IRProgram) -> None:
+        report = self.passes.setdefault(name, PassReport(name, 0, 0))
+        report.instructions_removed += (
+            len(before.instructions) - len(after.instructions))
+        report.static_ticks_saved += (
+            static_ticks(before.instructions)
+            - static_ticks(after.instructions))
+
+    @property
+    def instructions_removed(self) -> int:
+        return sum(p.instructions_removed for p in self.passes.values())
+
+    @property
+    def static_ticks_saved(self) -> int:
+        return sum(p.static_ticks_saved for p in self.passes.values())
+
+
+def static_ticks(instructions: Iterable[Instruction]) -> int:
+    # ticks of running every instruction once
+    return sum(instruction_ticks(instr) for instr in instructions)
+
+
+def run_ticks(
+    program: Program,
+    input_events: Iterable[tuple[int, int]],
+    limit: int = 100000,
+    engine: Engine = "fast",
+) -> tuple[int, list[int]]:
+    # imported here, the compiler loads this module and should not pull in
+    # the simulator
+    from src.machine import Machine
+    from src.trace import NullTraceSink
+
+    machine = Machine()
+    with contextlib.suppress(StopIteration):
+        machine.simulate(list(input_events), program, limit=limit,
+                         engine=engine, trace=NullTraceSink())
+    return machine.cu._tick, list(machine.io_controller.output_buffer)
+
+
+def dynamic_ticks_saved(
+    baseline: Program,
+    optimized: Program,
+    input_events: Iterable[tuple[int, int]],
+    limit: int = 100000,
+) -> int:
+    # ticks the optimizer saves on one input, both programs have to print
+    # the same output
+    events = list(input_events)
+    baseline_ticks, baseline_output = run_ticks(baseline, events, limit)
+    optimized_ticks, optimized_output = run_ticks(optimized, events, limit)
+    if baseline_output != optimized_output:
+        raise ValueError("Optimized program prints a different output")
+    return baseline_ticks - optimized_ticks
+
+
+def optimize(
+    program: Program,
+    labels: dict[str, int] | None = None,
+    passes: Iterable[Pass] = DEFAULT_PASSES,
+    max_rounds: int = 4,
+) -> tuple[Program, dict[str, int], OptimizationReport]:
+    # runs the passes in order until nothing changes. Removing instructions
+    # changes timing, so input events land at other points of the program.
+    ir = IRProgram.from_program(program, labels)
+    report = OptimizationReport()
+    passes = list(passes)
+    for _ in range(max_rounds):
+        changed = False
+        for optimization in passes:
+            before = ir
+            ir = optimization(ir)
+            if ir.instructions != before.instructions:
+                changed = True
+            report.add(optimization.__name__, before, ir)
+        if not changed:
+            break
+    return ir.to_program(), ir.labels, report
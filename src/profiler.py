@@ -0,0 +1,322 @@
+import bisect
+import json
+from collections import Counter
+from collections.abc import Callable
+from pathlib import Path
+
+from src.isa import (
+    CallInstruction,
+    InstructionSequence,
+    IORstInstruction,
+    Opcode,
+    Program,
+    RetInstruction,
+    instruction_ticks,
+)
+
+# pseudo PC that the ticks of interrupt servicing are attributed to
+INTERRUPT = -1
+
+_PLAIN, _CALL, _RETURN = 0, 1, 2
+
+
+def _control_kinds(program: Program) -> tuple[list[int], list[int]]:
+    # how every PC changes the call stack and the callee of every CALL,
+    # a packed image is classified from its words without decoding it
+    instructions = program.instructions
+    size = len(instructions)
+    kinds, targets = [_PLAIN] * size, [0] * size
+    if isinstance(instructions, InstructionSequence):
+        for pc, word in enumerate(instructions.words()):
+            opcode = word >> 12
+            if opcode == Opcode.CALL.value:
+                kinds[pc], targets[pc] = _CALL, word & 0x03FF
+            elif opcode in (Opcode.RET.value, Opcode.RST.value):
+                kinds[pc] = _RETURN
+        return kinds, targets
+    for pc, instr in enumerate(instructions):
+        if isinstance(instr, CallInstruction):
+            kinds[pc], targets[pc] = _CALL, instr.addr
+        elif isinstance(instr, (RetInstruction, IORstInstruction)):
+            kinds[pc] = _RETURN
+    return kinds, targets
+
+
+class Profiler:
+    # Machine.run calls enter() before every instruction it interprets,
+    # enter_block() before every compiled block and interrupt() before
+    # servicing an input. A slice's ticks are only known once the next one
+    # starts, so every call closes the previous slice. The hot path bumps
+    # a per-PC or per-block counter, call-stack ticks are added up while
+    # the stack stays the same. Blocks are expanded into their instructions
+    # and labels and opcodes are folded in when a report is built.
+    program: Program
+    labels: dict[str, int]
+    interrupts: int
+    interrupt_ticks: int
+    calls: Counter[tuple[int, int]]
+    _stack_ticks: Counter[tuple[int, ...]]
+    _counts: list[int]
+    _ticks: list[int]
+    # entries and length of every block entered at a PC
+    _block_counts: Counter[int]
+    _block_lengths: dict[int, int]
+    _kinds: list[int]
+    _targets: list[int]
+    _pc: int | None
+    # PC of the last instruction of the open slice, None for a single one
+    _last: int | None
+    _tick: int
+    _stack: tuple[int, ...]
+    # ticks spent in _stack that are not in _stack_ticks yet
+    _pending: int
+
+    def __init__(
+        self, program: Program, labels: dict[str, int] | None = None
+    ) -> None:
+        self.program = program
+        self.labels = labels or {}
+        size = len(program.instructions)
+        self._counts = [0] * size
+        self._ticks = [0] * size
+        self._block_counts = Counter()
+        self._block_lengths = {}
+        self.interrupts = 0
+        self.interrupt_ticks = 0
+        self.calls = Counter()
+        self._stack_ticks = Counter()
+        self._kinds, self._targets = _control_kinds(program)
+        self._pc = None
+        self._last = None
+        self._tick = 0
+        self._stack = (program.entry,)
+        self._pending = 0
+
+    def _set_stack(self, stack: tuple[int, ...]) -> None:
+        if self._pending:
+            self._stack_ticks[self._stack] += self._pending
+            self._pending = 0
+        self._stack = stack
+
+    def _close(self, tick: int) -> None:
+        pc = self._pc
+        if pc is None:
+            return
+        delta = tick - self._tick
+        if pc == INTERRUPT:
+            self.interrupt_ticks += delta
+            self._stack_ticks[self._stack + (INTERRUPT,)] += delta
+            return
+        self._pending += delta
+        last = self._last
+        if last is None:
+            self._ticks[pc] += delta
+            last = pc
+        kind = self._kinds[last]
+        if kind == _CALL:
+            callee = self._targets[last]
+            self.calls[self._stack[-1], callee] += 1
+            self._set_stack(self._stack + (callee,))
+        elif kind == _RETURN and len(self._stack) > 1:
+            self._set_stack(self._stack[:-1])
+
+    def enter(self, pc: int, tick: int) -> None:
+        self._close(tick)
+        self._counts[pc] += 1
+        self._pc = pc
+        self._last = None
+        self._tick = tick
+
+    def enter_block(self, pc: int, length: int, tick: int) -> None:
+        # a compiled block runs its instructions in order with no
+        # interrupt or stall, so their ticks are known from the ISA
+        self._close(tick)
+        self._block_counts[pc] += 1
+        self._block_lengths[pc] = length
+        self._pc = pc
+        self._last = pc + length - 1
+        self._tick = tick
+
+    def interrupt(self, tick: int) -> None:
+        self._close(tick)
+        self.interrupts += 1
+        self._pc = INTERRUPT
+        self._tick = tick
+
+    def close(self, tick: int) -> None:
+        # attributes the ticks of the last slice when a run stops
+        self._close(tick)
+        self._set_stack(self._stack)
+        self._pc = None
+
+    def _expanded(self) -> tuple[list[int], list[int]]:
+        counts, ticks = list(self._counts), list(self._ticks)
+        instructions = self.program.instructions
+        for entry, n in self._block_counts.items():
+            for pc in range(entry, entry + self._block_lengths[entry]):
+                counts[pc] += n
+                ticks[pc] += n * instruction_ticks(instructions[pc])
+        return counts, ticks
+
+    @property
+    def counts(self) -> list[int]:
+        # executions per PC
+        return self._expanded()[0]
+
+    @property
+    def ticks(self) -> list[int]:
+        # ticks per PC, interrupt servicing is in interrupt_ticks
+        return self._expanded()[1]
+
+    @property
+    def stack_ticks(self) -> Counter[tuple[int, ...]]:
+        stack_ticks = Counter(self._stack_ticks)
+        stack_ticks[self._stack] += self._pending
+        return stack_ticks
+
+    def _labeler(self) -> Callable[[int], str]:
+        # pc -> the closest label at or before it, the first label wins
+        # when several share an address
+        first: dict[int, str] = {}
+        for label, addr in self.labels.items():
+            first.setdefault(addr, label)
+        addrs = sorted(first)
+        names = [first[addr] for addr in addrs]
+
+        def label_of(pc: int) -> str:
+            if pc == INTERRUPT:
+                return "[interrupt]"
+            i = bisect.bisect_right(addrs, pc) - 1
+            return names[i] if i >= 0 else f"@{pc}"
+        return label_of
+
+    def label_of(self, pc: int) -> str:
+        return self._labeler()(pc)
+
+    def _frame_name(self, addr: int) -> str:
+        if addr == INTERRUPT:
+            return "[interrupt]"
+        for label, label_addr in self.labels.items():
+            if label_addr == addr:
+                return label
+        return f"@{addr}"
+
+    @staticmethod
+    def _totals(
+        counts: list[int], ticks: list[int], key: Callable[[int], str]
+    ) -> dict[str, tuple[int, int]]:
+        # (count, ticks) summed per key of every PC that ran
+        totals: dict[str, tuple[int, int]] = {}
+        for pc, (count, pc_ticks) in enumerate(zip(counts, ticks, strict=True)):
+            if not count:
+                continue
+            name = key(pc)
+            c, t = totals.get(name, (0, 0))
+            totals[name] = (c + count, t + pc_ticks)
+        return totals
+
+    def _opcode_of(self, pc: int) -> str:
+        return self.program.instructions[pc].opcode.name
+
+    def by_label(self) -> dict[str, tuple[int, int]]:
+        return self._totals(*self._expanded(), self._labeler())
+
+    def by_opcode(self) -> dict[str, tuple[int, int]]:
+        return self._totals(*self._expanded(), self._opcode_of)
+
+    @property
+    def total_ticks(self) -> int:
+        return sum(self._expanded()[1]) + self.interrupt_ticks
+
+    def to_dict(self) -> dict:
+        # every section is built from one expansion of the block counts
+        instructions = self.program.instructions
+        counts, ticks = self._expanded()
+        label_of = self._labeler()
+        return {
+            "total_ticks": sum(ticks) + self.interrupt_ticks,
+            "instructions": sum(counts),
+            "interrupts": {
+                "count": self.interrupts, "ticks": self.interrupt_ticks,
+            },
+            "pcs": [
+                {
+                    "pc": pc,
+                    "instruction": str(instructions[pc]),
+                    "label": label_of(pc),
+                    "count": count,
+                    "ticks": pc_ticks,
+                }
+                for pc, (count, pc_ticks) in enumerate(
+                    zip(counts, ticks, strict=True))
+                if count
+            ],
+            "labels": {
+                label: {"count": count, "ticks": label_ticks}
+                for label, (count, label_ticks) in self._totals(
+                    counts, ticks, label_of).items()
+            },
+            "opcodes": {
+                name: {"count": count, "ticks": opcode_ticks}
+                for name, (count, opcode_ticks) in self._totals(
+                    counts, ticks, self._opcode_of).items()
+            },
+            "calls": [
+                {
+                    "caller": self._frame_name(caller),
+                    "callee": self._frame_name(callee),
+                    "count": count,
+                }
+                for (caller, callee), count in self.calls.most_common()
+            ],
+        }
+
+    def format_flat(self) -> str:
+        instructions = self.program.instructions
+        counts, ticks = self._expanded()
+        label_of = self._labeler()
+        total = sum(ticks) + self.interrupt_ticks or 1
+        rows = sorted((pc for pc, count in enumerate(counts) if count),
+                      key=lambda pc: -ticks[pc])
+        lines = [
+            f"{'ticks':>10} {'%':>6} {'count':>10}  {'pc':<4} {'label':<16}"
+            " instruction"
+        ]
+        for pc in rows:
+            lines.append(
+                f"{ticks[pc]:>10} {100 * ticks[pc] / total:>6.2f}"
+                f" {counts[pc]:>10}  {pc:<4} {label_of(pc):<16}"
+                f" {instructions[pc]}"
+            )
+        if self.interrupts:
+            lines.append(
+                f"{self.interrupt_ticks:>10}"
+                f" {100 * self.interrupt_ticks / total:>6.2f}"
+                f" {self.interrupts:>10}  {'-':<4} [interrupt]"
+            )
+        return "\n".join(lines) + "\n"
+
+    def collapsed(self) -> str:
+        # "START;INT 42" per stack, the folded format flamegraph.pl and
+        # speedscope read
+        lines = []
+        for stack, ticks in sorted(self.stack_ticks.items()):
+            if not ticks:
+                continue
+            names = ";".join(self._frame_name(addr) for addr in stack)
+            lines.append(f"{names} {ticks}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> None:
+        # format follows the suffix: .json, .folded or plain text
+        if path.suffix == ".json":
+            path.write_text(json.dumps(self.to_dict(), indent=2) + "\n")
+        elif path.suffix == ".folded":
+            path.write_text(self.collapsed())
+        else:
+            path.write_text(self.format_flat())
+
+
+def read_labels(labels_path: Path) -> dict[str, int]:
+    # the label map compiler.py writes next to the binary
+    return json.loads(labels_path.read_text())
@@ -0,0 +1,435 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.queues import Queue
+from pathlib import Path
+from typing import Any
+
+from src.io_ports import iter_input_events
+from src.isa import unpack_program
+from src.machine import Engine, Machine, StopReason
+
+# One JSON object per line in both directions. A request carries a program
+# as base64 of the compiled binary and its input either as [[tick, value],
+# ...] or as text in the .input format:
+#
+#   {"id": 1, "program": "...", "input": [[0, 99]], "engine": "fast",
+#    "limit": 100000, "max_ticks": null, "timeout": 10}
+#
+# The server answers with output messages while the job runs and one
+# result message when it ends, jobs of one connection run concurrently:
+#
+#   {"id": 1, "type": "output", "values": [99]}
+#   {"id": 1, "type": "result", "exit_reason": "halt", "ticks": 46,
+#    "instructions": 19}
+#
+# exit_reason is "halt", "limit", "ticks", "timeout" or "error: <message>".
+# limit and timeout above the server maximums are lowered to them.
+ENGINES = ("signal", "fast", "jit")
+DEFAULT_LIMIT = 100000
+DEFAULT_TIMEOUT = 10.0
+# larger limits and timeouts are clamped, a server can be configured with
+# other maximums
+MAX_LIMIT = 100 * DEFAULT_LIMIT
+MAX_TIMEOUT = 6 * DEFAULT_TIMEOUT
+# instructions between two deadline checks and output flushes
+SLICE_INSTRUCTIONS = 10000
+# predecoded programs each worker keeps
+WARM_MACHINES = 16
+# longest request line, a program travels inside it
+MAX_REQUEST_BYTES = 16 << 20
+
+
+@dataclass
+class Job:
+    key: int
+    code: bytes
+    events: list[tuple[int, int]]
+    engine: Engine = "fast"
+    limit: int = DEFAULT_LIMIT
+    max_ticks: int | None = None
+    timeout: float = DEFAULT_TIMEOUT
+    slice_instructions: int = SLICE_INSTRUCTIONS
+
+
+def _positive(
+    request: dict[str, Any], name: str, default: float, zero: bool = False
+) -> float:
+    # JSON numbers only, true and "5" are not numbers
+    value = request.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number")
+    if zero and value == 0:
+        return value
+    if not 0 < value < float("inf"):
+        raise ValueError(
+            f"{name} must be {'non-negative' if zero else 'positive'}")
+    return value
+
+
+def _count(
+    request: dict[str, Any], name: str, default: int, zero: bool = False
+) -> int:
+    value = _positive(request, name, default, zero)
+    if not isinstance(value, int):
+        raise ValueError(f"{name} must be an integer")
+    return value
+
+
+def parse_job(
+    key: int,
+    request: dict[str, Any],
+    max_limit: int = MAX_LIMIT,
+    max_timeout: float = MAX_TIMEOUT,
+) -> Job:
+    # raises ValueError for anything a client can get wrong, limit and
+    # timeout are clamped to the server maximums
+    if not isinstance(request.get("program"), str):
+        raise ValueError("program must be a base64 string")
+    code = base64.b64decode(request["program"], validate=True)
+    raw_input = request.get("input", [])
+    if isinstance(raw_input, str):
+        events = list(iter_input_events(io.StringIO(raw_input)))
+    else:
+        events = [(int(tick), int(value)) for tick, value in raw_input]
+    engine = request.get("engine", "fast")
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(ENGINES)}")
+    limit = _count(request, "limit", DEFAULT_LIMIT)
+    timeout = float(_positive(request, "timeout", DEFAULT_TIMEOUT))
+    # null means no tick limit
+    max_ticks = None
+    if request.get("max_ticks") is not None:
+        max_ticks = _count(request, "max_ticks", 0, zero=True)
+    return Job(key, code, events, engine, min(limit, max_limit), max_ticks,
+               min(timeout, max_timeout))
+
+
+# (job key, "output" or "result", payload) from a worker to the server
+Message = tuple[int, str, object]
+
+# set in every worker process by _init_worker
+_messages: Queue[Message | None] | None = None
+_machines: OrderedDict[tuple[str, str], Machine] = OrderedDict()
+
+
+def _init_worker(messages: Queue[Message | None]) -> None:
+    global _messages
+    _messages = messages
+
+
+def _warm_machine(code: bytes, engine: Engine) -> Machine:
+    key = (hashlib.sha256(code).hexdigest(), engine)
+    machine = _machines.get(key)
+    if machine is None:
+        machine = Machine()
+        machine.load_program(unpack_program(code), engine)
+        _machines[key] = machine
+        if len(_machines) > WARM_MACHINES:
+            _machines.popitem(last=False)
+    _machines.move_to_end(key)
+    machine.reset()
+    return machine
+
+
+def run_job(job: Job) -> None:
+    # runs in a worker: the job advances a slice at a time, new output is
+    # sent after every slice and the deadline is checked between them, so
+    # a runaway program holds its worker for at most one slice past it
+    deadline = time.monotonic() + job.timeout
+    executed = sent = 0
+    machine = None
+    assert _messages is not None
+    try:
+        machine = _warm_machine(job.code, job.engine)
+        machine.prepare(job.events, machine.program, engine=job.engine)
+        output = machine.io_controller.output_buffer
+        while True:
+            result = machine.run_until(
+                tick=job.max_ticks,
+                limit=min(job.slice_instructions, job.limit - executed))
+            executed += result.instructions
+            if len(output) > sent:
+                _messages.put((job.key, "output", list(output[sent:])))
+                sent = len(output)
+            if result.reason is StopReason.HALT:
+                reason = "halt"
+                break
+            if result.reason is StopReason.TICK:
+                reason = "ticks"
+                break
+            if executed >= job.limit:
+                reason = "limit"
+                break
+            if time.monotonic() >= deadline:
+                reason = "timeout"
+                break
+    except Exception as e:
+        reason = f"error: {type(e).__name__}: {e}"
+    ticks = machine.cu._tick if machine is not None else 0
+    _messages.put((job.key, "result", {
+        "exit_reason": reason, "ticks": ticks, "instructions": executed,
+    }))
+
+
+class SimulationServer:
+    workers: int
+    max_limit: int
+    max_timeout: float
+    executor: ProcessPoolExecutor | None
+    servers: list[asyncio.AbstractServer]
+    _messages: Queue[Message | None]
+    _jobs: dict[int, asyncio.Queue[tuple[str, Any]]]
+    _keys: itertools.count
+    _reader: threading.Thread | None
+    _loop: asyncio.AbstractEventLoop | None
+    # open connections and the job tasks of each
+    _connections: dict[asyncio.StreamWriter, set[asyncio.Task[None]]]
+    _handlers: set[asyncio.Task[None]]
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        max_limit: int = MAX_LIMIT,
+        max_timeout: float = MAX_TIMEOUT,
+    ) -> None:
+        if max_limit < 1 or max_timeout <= 0:
+            raise ValueError("max_limit and max_timeout must be positive")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_limit = max_limit
+        self.max_timeout = max_timeout
+        self.executor = None
+        self.servers = []
+        self._jobs = {}
+        self._keys = itertools.count()
+        self._reader = None
+        self._loop = None
+        self._connections = {}
+        self._handlers = set()
+
+    async def start(self) -> None:
+        # workers are spawned up front so the first job pays no startup
+        self._loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context("spawn")
+        self._messages = context.Queue()
+        self.executor = ProcessPoolExecutor(
+            self.workers, context, _init_worker, (self._messages,))
+        await asyncio.gather(*(
+            self._loop.run_in_executor(self.executor, time.sleep, 0)
+            for _ in range(self.workers)))
+        self._reader = threading.Thread(target=self._read_messages,
+                                        daemon=True)
+        self._reader.start()
+
+    def _read_messages(self) -> None:
+        # worker messages arrive on one process queue, each is handed to
+        # the event loop and routed to the job it belongs to
+        assert self._loop is not None
+        while (message := self._messages.get()) is not None:
+            self._loop.call_soon_threadsafe(self._dispatch, *message)
+
+    def _dispatch(self, key: int, kind: str, payload: object) -> None:
+        queue = self._jobs.get(key)
+        if queue is not None:
+            queue.put_nowait((kind, payload))
+
+    async def listen_unix(self, path: Path) -> asyncio.AbstractServer:
+        server = await asyncio.start_unix_server(
+            self._serve, path, limit=MAX_REQUEST_BYTES)
+        self.servers.append(server)
+        return server
+
+    async def listen_tcp(
+        self, host: str = "127.0.0.1", port: int = 0
+    ) -> asyncio.AbstractServer:
+        server = await asyncio.start_server(
+            self._serve, host, port, limit=MAX_REQUEST_BYTES)
+        self.servers.append(server)
+        return server
+
+    async def close(self) -> None:
+        # running jobs are abandoned, a worker stops its job at the deadline
+        for server in self.servers:
+            server.close()
+        for writer, tasks in self._connections.items():
+            for task in tasks:
+                task.cancel()
+            writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        for server in self.servers:
+            await server.wait_closed()
+        if self.executor is not None:
+            await asyncio.to_thread(
+                self.executor.shutdown, cancel_futures=True)
+        if self._reader is not None:
+            self._messages.put(None)
+            self._reader.join()
+
+    async def __aenter__(self) -> SimulationServer:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        await self.close()
+
+    async def run(self, job: Job) -> AsyncIterator[tuple[str, Any]]:
+        # yields ("output", values) while the job runs, then
+        # ("result", {...}) once
+        assert self.executor is not None and self._loop is not None
+        queue: asyncio.Queue[tuple[str, Any]] = asyncio.Queue()
+        self._jobs[job.key] = queue
+
+        def worker_failed(future: asyncio.Future[None]) -> None:
+            # a worker that dies never reports, its result is the error
+            if not future.cancelled() and (e := future.exception()):
+                queue.put_nowait(("result", {
+                    "exit_reason": f"error: {type(e).__name__}: {e}",
+                    "ticks": 0, "instructions": 0,
+                }))
+
+        future = self._loop.run_in_executor(self.executor, run_job, job)
+        future.add_done_callback(worker_failed)
+        try:
+            while True:
+                kind, payload = await queue.get()
+                yield kind, payload
+                if kind == "result":
+                    return
+        finally:
+            self._jobs.pop(job.key, None)
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        lock = asyncio.Lock()
+        tasks: set[asyncio.Task[None]] = set()
+        handler = asyncio.current_task()
+        assert handler is not None
+        self._handlers.add(handler)
+        self._connections[writer] = tasks
+
+        async def send(message: dict[str, Any]) -> None:
+            # a client that hung up just misses the rest of its messages
+            async with lock:
+                if writer.is_closing():
+                    return
+                writer.write(json.dumps(message).encode() + b"\n")
+                with contextlib.suppress(ConnectionError):
+                    await writer.drain()
+
+        async def handle(request: dict[str, Any]) -> None:
+            request_id = request.get("id")
+            try:
+                job = parse_job(next(self._keys), request, self.max_limit,
+                                self.max_timeout)
+            except (ValueError, TypeError, KeyError) as e:
+                await send({"id": request_id, "type": "error",
+                            "message": str(e)})
+                return
+            async for kind, payload in self.run(job):
+                if kind == "output":
+                    await send({"id": request_id, "type": "output",
+                                "values": payload})
+                else:
+                    await send({"id": request_id, "type": "result",
+                                **payload})
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be an object")
+                except ValueError as e:
+                    await send({"id": None, "type": "error",
+                                "message": f"invalid request: {e}"})
+                    continue
+                task = asyncio.create_task(handle(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ValueError, ConnectionError) as e:
+            # a line over MAX_REQUEST_BYTES or a reset connection
+            await send({"id": None, "type": "error",
+                        "message": f"invalid request: {e}"})
+        finally:
+            # jobs sent before the client stopped writing still answer
+            await asyncio.gather(*tasks, return_exceptions=True)
+            del self._connections[writer]
+            self._handlers.discard(handler)
+            writer.close()
+
+
+async def submit(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    requests: list[dict[str, Any]],
+) -> AsyncIterator[dict[str, Any]]:
+    # sends every request, then yields messages until each has a result,
+    # errors about lines that were not a request are yielded too
+    for request in requests:
+        writer.write(json.dumps(request).encode() + b"\n")
+    await writer.drain()
+    pending = [request.get("id") for request in requests]
+    while pending:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        message = json.loads(line)
+        if (message["type"] in ("result", "error")
+                and message["id"] in pending):
+            pending.remove(message["id"])
+        yield message
+
+
+def encode_program(code: bytes) -> str:
+    return base64.b64encode(code).decode()
+
+
+async def serve(
+    unix: Path | None,
+    host: str,
+    port: int,
+    workers: int | None,
+    max_limit: int = MAX_LIMIT,
+    max_timeout: float = MAX_TIMEOUT,
+) -> None:
+    async with SimulationServer(workers, max_limit, max_timeout) as server:
+        if unix is not None:
+            listener = await server.listen_unix(unix)
+        else:
+            listener = await server.listen_tcp(host, port)
+        print("listening on", ", ".join(
+            str(sock.getsockname()) for sock in listener.sockets), flush=True)
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve simulation jobs over a socket, JSON per line")
+    parser.add_argument("--unix", type=Path, default=None,
+                        help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7425)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-limit", type=int, default=MAX_LIMIT,
+                        help="largest instruction limit a job gets")
+    parser.add_argument("--max-timeout", type=float, default=MAX_TIMEOUT,
+                        help="longest timeout a job gets, in seconds")
+    args = parser.parse_args()
+    asyncio.run(serve(args.unix, args.host, args.port, args.workers,
+                      args.max_limit, args.max_timeout))
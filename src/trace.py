@@ -0,0 +1,128 @@
+import logging
+import struct
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from typing import BinaryIO, NamedTuple
+
+from src.control_unit import ControlUnit
+
+# TextTraceSink.record -> TextTraceSink.emit -> Logger.log, so the log record
+# points at the simulator line that asked for the trace
+_CALLER_STACKLEVEL = 3
+
+
+class TraceSink(ABC):
+    every: int
+    pc_range: tuple[int, int] | None
+    _next_tick: int
+
+    def __init__(
+        self, every: int = 1, pc_range: tuple[int, int] | None = None
+    ) -> None:
+        if every < 1:
+            raise ValueError(f"Sampling period must be positive, got {every}")
+        self.every = every
+        self.pc_range = pc_range
+        self._next_tick = 0
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    def record(self, cu: ControlUnit) -> None:
+        # every N-th tick: one state per window of N ticks
+        if self.every > 1:
+            if cu._tick < self._next_tick:
+                return
+            self._next_tick = (cu._tick // self.every + 1) * self.every
+        if self.pc_range is not None:
+            low, high = self.pc_range
+            if not low <= cu.program_counter < high:
+                return
+        self.emit(cu)
+
+    @abstractmethod
+    def emit(self, cu: ControlUnit) -> None: ...
+
+
+class NullTraceSink(TraceSink):
+    @property
+    def enabled(self) -> bool:
+        return False
+
+    def emit(self, cu: ControlUnit) -> None:
+        pass
+
+
+class TextTraceSink(TraceSink):
+    logger: logging.Logger
+    level: int
+
+    def __init__(
+        self,
+        logger: logging.Logger | None = None,
+        level: int = logging.INFO,
+        every: int = 1,
+        pc_range: tuple[int, int] | None = None,
+    ) -> None:
+        super().__init__(every, pc_range)
+        self.logger = logger or logging.getLogger()
+        self.level = level
+
+    @property
+    def enabled(self) -> bool:
+        return self.logger.isEnabledFor(self.level)
+
+    def emit(self, cu: ControlUnit) -> None:
+        # the ControlUnit itself is the message, so it is only rendered
+        # when a handler actually formats the record
+        self.logger.log(self.level, cu, stacklevel=_CALLER_STACKLEVEL)
+        self.logger.log(self.level, "", stacklevel=_CALLER_STACKLEVEL)
+
+
+class TraceRecord(NamedTuple):
+    tick: int
+    pc: int
+    r1: int
+    r2: int
+    sp: int
+    alu_l: int
+    alu_r: int
+    alu_out: int
+    interrupted: bool
+
+
+BINARY_TRACE_MAGIC = b"ASTRTRC1"
+_RECORD = struct.Struct("<QIqqIqqq?")
+
+
+class BinaryTraceSink(TraceSink):
+    stream: BinaryIO
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        every: int = 1,
+        pc_range: tuple[int, int] | None = None,
+    ) -> None:
+        super().__init__(every, pc_range)
+        self.stream = stream
+        self.stream.write(BINARY_TRACE_MAGIC)
+
+    def emit(self, cu: ControlUnit) -> None:
+        dp = cu.data_path
+        self.stream.write(_RECORD.pack(
+            cu._tick, cu.program_counter,
+            dp.r1, dp.r2, dp.stack_pointer,
+            dp.alu_l, dp.alu_r, dp.alu_out,
+            cu.controller.interruption_flag,
+        ))
+
+
+def read_binary_trace(stream: BinaryIO) -> Iterator[TraceRecord]:
+    if stream.read(len(BINARY_TRACE_MAGIC)) != BINARY_TRACE_MAGIC:
+        raise ValueError("Not a binary trace")
+    while chunk := stream.read(_RECORD.size):
+        if len(chunk) != _RECORD.size:
+            raise ValueError("Truncated binary trace")
+        yield TraceRecord._make(_RECORD.unpack(chunk))
@@ -0,0 +1,419 @@
+import argparse
+import json
+import operator
+import re
+import sys
+from array import array
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import NamedTuple
+
+from src.control_unit import ControlUnit
+from src.datapath import MEMORY_TYPECODE, Memory
+from src.isa import (
+    IOMemoryInstructionImm,
+    IOMemoryInstructionReg,
+    Opcode,
+    Program,
+    Registers,
+    unpack_program,
+)
+from src.trace import TraceSink
+
+# A columnar trace is a directory with index.json, memory.bin holding data
+# memory as the first record saw it, and chunk files. A chunk stores every
+# record column as one contiguous fixed-width array, followed by the memory
+# writes made since the record before. The index keeps the tick and PC
+# bounds of every chunk, so a query only reads the chunks and columns it
+# needs.
+TRACE_VERSION = 1
+INDEX_FILE = "index.json"
+MEMORY_FILE = "memory.bin"
+
+COLUMNS: dict[str, str] = {
+    "tick": "q",
+    "pc": "q",
+    # of the instruction at pc, -1 past the end of the program
+    "opcode": "b",
+    "r1": "q",
+    "r2": "q",
+    "sp": "q",
+    "alu_l": "q",
+    "alu_r": "q",
+    "alu_out": "q",
+    "interrupted": "B",
+    # the input the state dump of an interrupted record shows, -1 if none
+    "pending": "q",
+}
+WRITE_COLUMNS: dict[str, str] = {
+    # index in the chunk of the first record that sees the write
+    "record": "q",
+    "addr": "q",
+    "value": "q",
+}
+
+
+class TraceRow(NamedTuple):
+    tick: int
+    pc: int
+    opcode: int
+    r1: int
+    r2: int
+    sp: int
+    alu_l: int
+    alu_r: int
+    alu_out: int
+    interrupted: int
+    pending: int
+
+
+class ChunkInfo(NamedTuple):
+    file: str
+    records: int
+    writes: int
+    ticks: tuple[int, int]
+    pcs: tuple[int, int]
+
+
+def _new_columns(typecodes: dict[str, str]) -> dict[str, array]:
+    return {name: array(code) for name, code in typecodes.items()}
+
+
+class ColumnarTraceSink(TraceSink):
+    directory: Path
+    chunk_records: int
+    chunks: list[ChunkInfo]
+    _columns: dict[str, array]
+    _writes: dict[str, array]
+    # memory as the last record saw it
+    _shadow: list[int] | None
+    # sp, pc and interrupted of the last record
+    _last: tuple[int, int, int] | None
+
+    def __init__(
+        self,
+        directory: Path,
+        chunk_records: int = 1 << 16,
+        every: int = 1,
+        pc_range: tuple[int, int] | None = None,
+    ) -> None:
+        super().__init__(every, pc_range)
+        if chunk_records < 1:
+            raise ValueError(
+                f"Chunks need at least one record, got {chunk_records}")
+        self.directory = directory
+        self.chunk_records = chunk_records
+        self.chunks = []
+        self._columns = _new_columns(COLUMNS)
+        self._writes = _new_columns(WRITE_COLUMNS)
+        self._shadow = None
+        self._last = None
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self) -> "ColumnarTraceSink":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def _written_cells(
+        self, cu: ControlUnit, shadow: list[int], memory: Memory
+    ) -> list[int]:
+        if self._last is None or self.every > 1 or self.pc_range is not None:
+            # records are not adjacent
+            return [cell for cell, (old, new)
+                    in enumerate(zip(shadow, memory, strict=True))
+                    if old != new]
+        # since the last record an interrupt pushed at most three cells and
+        # one instruction pushed or stored one more
+        sp, pc, interrupted = self._last
+        cells = set(range(max(0, sp - 3), sp + 1))
+        instr = cu.program.instructions[0 if interrupted else pc]
+        if instr.opcode == Opcode.ST:
+            dp = cu.data_path
+            if isinstance(instr, IOMemoryInstructionImm):
+                cells.add(instr.src % len(memory))
+            elif isinstance(instr, IOMemoryInstructionReg):
+                addr = dp.r1 if instr.src == Registers.R1 else dp.r2
+                cells.add(addr % len(memory))
+        return sorted(cell for cell in cells if shadow[cell] != memory[cell])
+
+    def emit(self, cu: ControlUnit) -> None:
+        dp, controller = cu.data_path, cu.controller
+        # behind a cache stores are recorded when they happen, not when
+        # the line is written back
+        memory = dp.data_memory if dp.cache is None else dp.memory_cells()
+        if self._shadow is None:
+            self._shadow = list(memory)
+            with (self.directory / MEMORY_FILE).open("wb") as f:
+                array(MEMORY_TYPECODE, self._shadow).tofile(f)
+        else:
+            shadow, writes = self._shadow, self._writes
+            record = len(self._columns["tick"])
+            for cell in self._written_cells(cu, shadow, memory):
+                shadow[cell] = memory[cell]
+                writes["record"].append(record)
+                writes["addr"].append(cell)
+                writes["value"].append(memory[cell])
+
+        pc = cu.program_counter
+        instructions = cu.program.instructions
+        interrupted = controller.interruption_flag
+        pending = -1
+        if interrupted and len(controller.input_buffer) > 1:
+            pending = controller.input_buffer[0][1]
+        columns = self._columns
+        columns["tick"].append(cu._tick)
+        columns["pc"].append(pc)
+        columns["opcode"].append(
+            instructions[pc].opcode.value if 0 <= pc < len(instructions)
+            else -1)
+        columns["r1"].append(dp.r1)
+        columns["r2"].append(dp.r2)
+        columns["sp"].append(dp.stack_pointer)
+        columns["alu_l"].append(dp.alu_l)
+        columns["alu_r"].append(dp.alu_r)
+        columns["alu_out"].append(dp.alu_out)
+        columns["interrupted"].append(interrupted)
+        columns["pending"].append(pending)
+        self._last = (dp.stack_pointer, pc, interrupted)
+        if len(columns["tick"]) >= self.chunk_records:
+            self.flush()
+
+    def flush(self) -> None:
+        columns, writes = self._columns, self._writes
+        if not columns["tick"]:
+            return
+        name = f"chunk-{len(self.chunks):06d}.bin"
+        with (self.directory / name).open("wb") as f:
+            for column in (*columns.values(), *writes.values()):
+                column.tofile(f)
+        self.chunks.append(ChunkInfo(
+            name, len(columns["tick"]), len(writes["addr"]),
+            (columns["tick"][0], columns["tick"][-1]),
+            (min(columns["pc"]), max(columns["pc"])),
+        ))
+        self._columns = _new_columns(COLUMNS)
+        self._writes = _new_columns(WRITE_COLUMNS)
+        self._write_index()
+
+    def _write_index(self) -> None:
+        index = {
+            "version": TRACE_VERSION,
+            "columns": COLUMNS,
+            "write_columns": WRITE_COLUMNS,
+            "chunks": [chunk._asdict() for chunk in self.chunks],
+        }
+        (self.directory / INDEX_FILE).write_text(json.dumps(index))
+
+    def close(self) -> None:
+        self.flush()
+        self._write_index()
+
+
+CONDITION_OPERATORS: dict[str, Callable[[int, int], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+_CONDITION = re.compile(r"\s*(\w+)\s*(==|!=|<=|>=|<|>)\s*(-?\d+)\s*$")
+
+
+class Condition(NamedTuple):
+    column: str
+    op: Callable[[int, int], bool]
+    value: int
+
+    @classmethod
+    def parse(cls, text: str) -> "Condition":
+        # "r1 == 5", "sp < 250", any record column against an integer
+        match = _CONDITION.match(text)
+        if match is None or match.group(1) not in COLUMNS:
+            raise ValueError(f"Invalid condition {text!r}")
+        column, op, value = match.groups()
+        return cls(column, CONDITION_OPERATORS[op], int(value))
+
+
+class TraceState(NamedTuple):
+    row: TraceRow
+    # data memory after every write the record has seen
+    memory: list[int]
+
+
+class ColumnarTrace:
+    directory: Path
+    chunks: list[ChunkInfo]
+
+    def __init__(self, directory: Path) -> None:
+        index = json.loads((directory / INDEX_FILE).read_text())
+        if index.get("version") != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version {index.get('version')}")
+        self.directory = directory
+        self.chunks = [
+            ChunkInfo(c["file"], c["records"], c["writes"],
+                      tuple(c["ticks"]), tuple(c["pcs"]))  # type: ignore
+            for c in index["chunks"]
+        ]
+
+    def __len__(self) -> int:
+        return sum(chunk.records for chunk in self.chunks)
+
+    def read(self, chunk: ChunkInfo, names: list[str]) -> dict[str, array]:
+        # seeks to each requested column, the others are never read
+        layout = [(name, code, chunk.records) for name, code in COLUMNS.items()]
+        layout += [(name, code, chunk.writes)
+                   for name, code in WRITE_COLUMNS.items()]
+        result = {}
+        offset = 0
+        with (self.directory / chunk.file).open("rb") as f:
+            for name, code, count in layout:
+                column = array(code)
+                if name in names:
+                    f.seek(offset)
+                    column.fromfile(f, count)
+                    result[name] = column
+                offset += column.itemsize * count
+        return result
+
+    def initial_memory(self) -> list[int]:
+        memory = array(MEMORY_TYPECODE)
+        memory.frombytes((self.directory / MEMORY_FILE).read_bytes())
+        return memory.tolist()
+
+    def _selected(
+        self,
+        chunk: ChunkInfo,
+        pcs: tuple[int, int] | None,
+        ticks: tuple[int, int] | None,
+    ) -> bool:
+        # ranges are half-open like TraceSink.pc_range
+        if pcs is not None and (chunk.pcs[1] < pcs[0]
+                                or chunk.pcs[0] >= pcs[1]):
+            return False
+        return ticks is None or not (chunk.ticks[1] < ticks[0]
+                                     or chunk.ticks[0] >= ticks[1])
+
+    def _matches(
+        self,
+        columns: dict[str, array],
+        pcs: tuple[int, int] | None,
+        ticks: tuple[int, int] | None,
+        where: list[Condition],
+    ) -> Iterator[int]:
+        for i in range(len(columns["tick"])):
+            if pcs is not None and not pcs[0] <= columns["pc"][i] < pcs[1]:
+                continue
+            if ticks is not None and not (
+                    ticks[0] <= columns["tick"][i] < ticks[1]):
+                continue
+            if all(c.op(columns[c.column][i], c.value) for c in where):
+                yield i
+
+    def rows(
+        self,
+        pcs: tuple[int, int] | None = None,
+        ticks: tuple[int, int] | None = None,
+        where: list[Condition] | None = None,
+    ) -> Iterator[TraceRow]:
+        where = where or []
+        for chunk in self.chunks:
+            if not self._selected(chunk, pcs, ticks):
+                continue
+            columns = self.read(chunk, list(COLUMNS))
+            for i in self._matches(columns, pcs, ticks, where):
+                yield TraceRow(*(columns[name][i] for name in COLUMNS))
+
+    def states(
+        self,
+        pcs: tuple[int, int] | None = None,
+        ticks: tuple[int, int] | None = None,
+        where: list[Condition] | None = None,
+    ) -> Iterator[TraceState]:
+        # memory is replayed from the write columns of every chunk up to
+        # the window, the record columns of skipped chunks are not read
+        where = where or []
+        memory = self.initial_memory()
+        for chunk in self.chunks:
+            if not self._selected(chunk, pcs, ticks):
+                writes = self.read(chunk, ["addr", "value"])
+                for addr, value in zip(writes["addr"], writes["value"],
+                                       strict=True):
+                    memory[addr] = value
+                continue
+            columns = self.read(chunk, [*COLUMNS, *WRITE_COLUMNS])
+            write, writes = 0, len(columns["addr"])
+            selected = set(self._matches(columns, pcs, ticks, where))
+            for i in range(chunk.records):
+                while write < writes and columns["record"][write] <= i:
+                    memory[columns["addr"][write]] = columns["value"][write]
+                    write += 1
+                if i in selected:
+                    row = TraceRow(*(columns[name][i] for name in COLUMNS))
+                    yield TraceState(row, list(memory))
+
+
+def format_state(state: TraceState, program: Program) -> str:
+    # the text ControlUnit.__repr__ renders for the same state
+    row, memory = state
+    datapath_repr = f"R1: {row.r1}\tR2: {row.r2}\tSP: {row.sp}"
+    cu_repr = f"TICK: {row.tick}\tPC: {row.pc}"
+    mem_repr = f"MEMORY: {memory[:10]}"
+    stack_repr = f"STACK: {memory[row.sp + 1:]}"
+    alu_repr = (f"ALU_L: {row.alu_l}\tALU_R: {row.alu_r}"
+                f"\tALU_OUT: {row.alu_out}")
+    body = (cu_repr + "\n" + alu_repr + "\n" + datapath_repr + "\n"
+            + stack_repr + "\n" + mem_repr + "\n")
+    if row.interrupted:
+        pending = "" if row.pending < 0 else "with input: " + chr(row.pending)
+        return "Current State:Interrupted " + pending + "\n" + body
+    instr = program.instructions[row.pc]
+    return "Current State:" + body + "Instruction to execute:\n" + str(instr)
+
+
+def _range(text: str) -> tuple[int, int]:
+    # "LO:HI", either side may be left out
+    low, _, high = text.partition(":")
+    return (int(low) if low else 0,
+            int(high) if high else sys.maxsize)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Query a columnar execution trace")
+    parser.add_argument("trace", type=Path, help="trace directory")
+    parser.add_argument("--pc", type=_range, default=None,
+                        help="PC range LO:HI, HI excluded")
+    parser.add_argument("--ticks", type=_range, default=None,
+                        help="tick window LO:HI, HI excluded")
+    parser.add_argument("--where", type=Condition.parse, action="append",
+                        default=[], help='register condition like "r1 == 5"')
+    parser.add_argument("--text", type=Path, default=None, metavar="CODE_FILE",
+                        help="print states in the golden log format")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="stop after this many records")
+    args = parser.parse_args(argv)
+
+    trace = ColumnarTrace(args.trace)
+    shown = 0
+    if args.text is not None:
+        program = unpack_program(args.text.read_bytes())
+        for state in trace.states(args.pc, args.ticks, args.where):
+            if args.limit is not None and shown >= args.limit:
+                break
+            print(format_state(state, program))
+            print()
+            shown += 1
+        return
+    print("\t".join(COLUMNS))
+    for row in trace.rows(args.pc, args.ticks, args.where):
+        if args.limit is not None and shown >= args.limit:
+            break
+        print("\t".join(map(str, row)))
+        shown += 1
+
+
+if __name__ == "__main__":
+    main()
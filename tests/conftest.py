@@ -0,0 +1,67 @@
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+import pytest
+
+from src.compiler import compile
+from src.io_ports import read_input_events
+from src.isa import Program
+from src.machine import Engine, Machine
+from src.machine_config import MachineConfig
+from src.trace import NullTraceSink
+
+Events = list[tuple[int, int]]
+Example = Callable[[str], tuple[Program, Events]]
+Simulate = Callable[..., Machine]
+State = Callable[[Machine], tuple]
+
+
+@pytest.fixture(scope="session")
+def examples() -> Path:
+    return Path(__file__).parent.parent / "examples"
+
+
+@pytest.fixture(scope="session")
+def example(examples: Path) -> Example:
+    # an example compiled from its source, with no events when it has no
+    # .input file
+    def load(name: str) -> tuple[Program, Events]:
+        program = compile((examples / f"{name}.asm").read_text())
+        input_path = examples / f"{name}.input"
+        events = (list(read_input_events(input_path))
+                  if input_path.exists() else [])
+        return program, events
+    return load
+
+
+@pytest.fixture(scope="session")
+def simulate() -> Simulate:
+    # runs until HLT or limit with nothing traced
+    def run(
+        program: Program,
+        events: Iterable[tuple[int, int]] = (),
+        engine: Engine = "signal",
+        limit: int = 100000,
+        machine: Machine | None = None,
+        config: MachineConfig | None = None,
+    ) -> Machine:
+        machine = machine or Machine(config=config)
+        with pytest.raises(StopIteration):
+            machine.simulate(list(events), program, limit=limit,
+                             engine=engine, trace=NullTraceSink())
+        return machine
+    return run
+
+
+@pytest.fixture(scope="session")
+def state() -> State:
+    # everything an engine can change
+    def snapshot(machine: Machine) -> tuple:
+        dp, cu = machine.datapath, machine.cu
+        return (
+            cu._tick, cu.program_counter,
+            dp.r1, dp.r2, dp.stack_pointer,
+            dp.alu_l, dp.alu_r, dp.alu_out, dp.data_out,
+            dp.memory_cells(), list(machine.io_controller.output_buffer),
+        )
+    return snapshot
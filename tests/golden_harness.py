@@ -0,0 +1,101 @@
+import hashlib
+import logging
+from collections.abc import Generator
+from contextlib import contextmanager
+from pathlib import Path
+
+from src.build_cache import BuildCache
+
+# the format caplog.text uses, the golden logs were recorded with it
+LOG_FORMAT = "%(levelname)-8s %(name)s:%(filename)s:%(lineno)d %(message)s"
+
+SRC = Path(__file__).parent.parent / "src"
+# a change to any of these can change the binary of a golden source
+COMPILER_SOURCES = ["compiler.py", "isa.py", "optimizer.py"]
+
+
+def compiler_fingerprint() -> str:
+    digest = hashlib.sha256()
+    for name in COMPILER_SOURCES:
+        digest.update((SRC / name).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def golden_build_cache(root: Path) -> BuildCache:
+    # binaries are keyed by source hash, and the directory by the compiler
+    # sources, so editing the compiler never serves a stale binary. Entries
+    # are written atomically, xdist workers share the directory safely.
+    return BuildCache(root / compiler_fingerprint())
+
+
+class LogDivergence(AssertionError):
+    pass
+
+
+class StreamingLogComparator(logging.Handler):
+    # compares every record against the expected log as it is emitted and
+    # raises at the first one that differs, which aborts the simulation.
+    # Without an expected log the records are collected instead, that is
+    # what --update-goldens needs.
+    expected: str | None
+    position: int
+    records: int
+    chunks: list[str]
+
+    def __init__(self, expected: str | None) -> None:
+        super().__init__(logging.INFO)
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.expected = expected
+        self.position = 0
+        self.records = 0
+        self.chunks = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        chunk = self.format(record) + "\n"
+        if self.expected is None:
+            self.chunks.append(chunk)
+        elif not self.expected.startswith(chunk, self.position):
+            raise LogDivergence(self._divergence(chunk))
+        self.position += len(chunk)
+        self.records += 1
+
+    def _line(self) -> int:
+        assert self.expected is not None
+        return self.expected.count("\n", 0, self.position) + 1
+
+    def _divergence(self, chunk: str) -> str:
+        assert self.expected is not None
+        lines = chunk.count("\n")
+        expected = self.expected[self.position:].split("\n")[:lines]
+        return (
+            f"log diverges at line {self._line()}"
+            f" (record {self.records + 1})\n"
+            "--- expected\n" + "\n".join(expected) + "\n"
+            "+++ actual\n" + chunk
+        )
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def finish(self) -> None:
+        if self.expected is not None and self.position != len(self.expected):
+            raise LogDivergence(
+                f"log ends at line {self._line()}, expected continues with\n"
+                + self.expected[self.position:].split("\n", 1)[0])
+
+
+@contextmanager
+def streaming_log(
+    expected: str | None,
+) -> Generator[StreamingLogComparator, None, None]:
+    root = logging.getLogger()
+    comparator = StreamingLogComparator(expected)
+    level = root.level
+    root.setLevel(logging.INFO)
+    root.addHandler(comparator)
+    try:
+        yield comparator
+    finally:
+        root.removeHandler(comparator)
+        root.setLevel(level)
@@ -0,0 +1,92 @@
+import csv
+import json
+from pathlib import Path
+
+import pytest
+
+from src import batch
+from src.batch import read_manifest, run_batch, run_chunk, write_report
+
+
+@pytest.fixture
+def manifest(tmp_path: Path, examples: Path) -> Path:
+    (tmp_path / "empty.input").write_text("[]")
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text("\n".join([
+        json.dumps({
+            "program": str(examples / "cat.bin"),
+            "inputs": [str(examples / "cat.input"), "empty.input"],
+        }),
+        json.dumps({
+            "program": str(examples / "prob1.bin"),
+            "input": "empty.input",
+        }),
+    ]))
+    return manifest
+
+
+def test_run_batch(manifest: Path) -> None:
+    jobs = read_manifest(manifest)
+    assert [len(job.inputs) for job in jobs] == [2, 1]
+
+    results = run_batch(jobs, workers=2, chunk_size=1)
+
+    assert [(r.exit_reason, r.output_text) for r in results] == [
+        ("halt", "cat\0"),
+        ("halt", ""),
+        ("halt", chr(233168)),
+    ]
+    assert results[0].ticks == 46
+
+
+def test_write_report(tmp_path: Path, manifest: Path) -> None:
+    jobs = read_manifest(manifest)
+    results = run_batch(jobs, workers=1, limit=1000)
+
+    write_report(results, tmp_path / "report.jsonl")
+    lines = (tmp_path / "report.jsonl").read_text().splitlines()
+    assert json.loads(lines[0])["output_text"] == "cat\0"
+    assert json.loads(lines[2])["exit_reason"] == "limit"
+    assert json.loads(lines[2])["ticks"] == 1000
+
+    write_report(results, tmp_path / "report.csv")
+    with (tmp_path / "report.csv").open() as f:
+        rows = list(csv.DictReader(f))
+    assert [row["exit_reason"] for row in rows] == ["halt", "halt", "limit"]
+
+
+def test_unloadable_program_fails_only_its_jobs(
+    tmp_path: Path, manifest: Path
+) -> None:
+    (tmp_path / "broken.bin").write_bytes(b"\xff")
+    with manifest.open("a") as f:
+        f.write("\n" + json.dumps({"program": "missing.bin",
+                                   "input": "empty.input"}))
+        f.write("\n" + json.dumps({"program": "broken.bin",
+                                   "input": "empty.input"}))
+
+    results = run_batch(read_manifest(manifest), workers=1)
+
+    assert [r.exit_reason for r in results[:3]] == ["halt"] * 3
+    assert results[3].exit_reason.startswith("error: FileNotFoundError")
+    assert results[4].exit_reason.startswith("error: ")
+    assert (results[4].ticks, results[4].output) == (0, [])
+
+
+def test_rewritten_program_is_reloaded(
+    tmp_path: Path, examples: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(batch, "_machines", type(batch._machines)())
+    monkeypatch.setattr(batch, "WARM_MACHINES", 1)
+    program = tmp_path / "program.bin"
+    empty = tmp_path / "empty.input"
+    empty.write_text("[]")
+
+    program.write_bytes((examples / "hello.bin").read_bytes())
+    hello = run_chunk(program, [empty], "fast", 100000)[0].output_text
+    program.write_bytes((examples / "prob1.bin").read_bytes())
+    assert run_chunk(program, [empty], "fast", 100000)[0].output_text == (
+        chr(233168))
+    assert len(batch._machines) == 1
+    program.write_bytes((examples / "hello.bin").read_bytes())
+    assert run_chunk(program, [empty], "fast", 100000)[0].output_text == hello
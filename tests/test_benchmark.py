@@ -0,0 +1,48 @@
+from src.benchmark import (
+    bench_simulator,
+    compare,
+    executed_instructions,
+    run_suite,
+    synthetic_source,
+)
+from src.compiler import compile
+
+
+def test_synthetic_program_runs_to_the_limit() -> None:
+    program = compile(synthetic_source(64))
+    assert executed_instructions(program, [], 1000) == 1000
+
+
+def test_run_suite() -> None:
+    results = run_suite(scale=200, repeat=1)
+    metrics = results["metrics"]
+
+    assert metrics["compile/prob1"]["unit"] == "lines/s"
+    assert metrics["decode/synthetic_200"]["unit"] == "words/s"
+    assert metrics["simulate/cat/jit/ticks"]["unit"] == "ticks/s"
+    assert all(m["value"] > 0 for m in metrics.values())
+
+
+def test_simulator_ticks_follow_the_model() -> None:
+    # cat runs 19 instructions in 46 ticks
+    metrics = {m.name: m.value for m in bench_simulator(200, 1, ["fast"])}
+    ratio = (metrics["simulate/cat/fast/ticks"]
+             / metrics["simulate/cat/fast/instructions"])
+    assert round(ratio, 6) == round(46 / 19, 6)
+
+
+def test_compare_flags_regressions() -> None:
+    def results(**values: float) -> dict:
+        return {"metrics": {
+            name: {"name": name, "value": value, "unit": "lines/s"}
+            for name, value in values.items()
+        }}
+
+    baseline = results(a=100.0, b=100.0, c=100.0, gone=1.0)
+    current = results(a=95.0, b=80.0, c=150.0, new=1.0)
+
+    compared, regressions = compare(baseline, current, threshold=0.1)
+
+    assert [c.name for c in compared] == ["a", "b", "c"]
+    assert [c.name for c in regressions] == ["b"]
+    assert regressions[0].ratio == 0.8
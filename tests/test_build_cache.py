@@ -0,0 +1,48 @@
+from pathlib import Path
+
+from src.build_cache import BuildCache, IncrementalCompiler, source_key
+from src.compiler import compile_with_labels
+
+
+def test_rebuild_comes_from_cache(tmp_path: Path, examples: Path) -> None:
+    source = (examples / "hello_user.asm").read_text()
+    cache = BuildCache(tmp_path)
+
+    first = cache.build(source)
+    second = BuildCache(tmp_path).build(source)
+
+    assert cache.stats.misses == 1
+    assert first == second == compile_with_labels(source)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        f"{source_key(source)}.bin", f"{source_key(source)}.labels.json"]
+
+
+def test_key_covers_optimization_and_source(examples: Path) -> None:
+    source = (examples / "cat.asm").read_text()
+    assert source_key(source) != source_key(source, optimize=True)
+    assert source_key(source) != source_key(source + "\n")
+
+
+def test_incremental_reparse_reuses_unchanged_lines(examples: Path) -> None:
+    source = (examples / "prob1.asm").read_text()
+    compiler = IncrementalCompiler()
+    compiler.compile(source)
+    parsed = compiler.parsed
+
+    # one new line in the loop moves every label after it
+    edited = source.replace("JMP LOOP\n", "ADD R1, 0\n        JMP LOOP\n", 1)
+    assert compiler.compile(edited) == compile_with_labels(edited)
+    assert compiler.parsed - parsed < 5
+    assert compiler.reused > parsed
+
+
+def test_parsed_lines_are_bounded(examples: Path) -> None:
+    compiler = IncrementalCompiler(max_lines=8)
+    for name in ("prob1", "cat", "hello_user"):
+        source = (examples / f"{name}.asm").read_text()
+        assert compiler.compile(source) == compile_with_labels(source)
+        assert len(compiler.lines) <= 8
+
+    # only lines of the last compile are still kept
+    last = (examples / "hello_user.asm").read_text().splitlines()
+    assert set(compiler.lines) <= set(last)
@@ -0,0 +1,147 @@
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from src.cache import Cache, CacheConfig, Replacement, WritePolicy
+from src.compiler import compile
+from src.datapath import Memory, map_memory, typed_memory
+from src.machine import Engine, Machine
+from src.trace_columns import ColumnarTrace, ColumnarTraceSink
+from tests.conftest import Example, Simulate
+
+
+def make_cache(**kwargs: object) -> Cache:
+    return Cache(CacheConfig(**kwargs), list(range(64)))  # type: ignore
+
+
+def test_direct_mapped_conflicts() -> None:
+    cache = make_cache(sets=2, ways=1, line_size=4)
+    assert cache.read(1) == 1
+    assert cache.read(2) == 2
+    # block 2 maps to the same set as block 0
+    assert cache.read(9) == 9
+    assert cache.read(0) == 0
+
+    assert (cache.stats.hits, cache.stats.misses) == (1, 3)
+    assert cache.stats.evictions == 2
+    assert cache.take_stall() == 3 * 9
+
+
+@pytest.mark.parametrize(
+    argnames=("replacement", "expected_misses"),
+    argvalues=[(Replacement.LRU, 3), (Replacement.FIFO, 4)],
+)
+def test_replacement_order(
+    replacement: Replacement, expected_misses: int
+) -> None:
+    cache = make_cache(sets=1, ways=2, line_size=1, replacement=replacement)
+    for addr in [0, 1, 0, 2, 0]:
+        cache.read(addr)
+    assert cache.stats.misses == expected_misses
+
+
+def test_random_replacement_is_seeded() -> None:
+    def misses(seed: int) -> int:
+        cache = make_cache(sets=1, ways=4, line_size=1,
+                           replacement=Replacement.RANDOM, seed=seed)
+        for addr in list(range(8)) * 4:
+            cache.read(addr)
+        return cache.stats.misses
+
+    assert misses(1) == misses(1)
+
+
+def test_write_back_defers_memory_writes() -> None:
+    cache = make_cache(sets=1, ways=1, line_size=2)
+    cache.write(0, 100)
+    assert cache.memory[0] == 0
+    assert cache.read(1) == 1
+
+    cache.read(2)
+    assert cache.memory[0] == 100
+    assert cache.stats.writebacks == 1
+    assert cache.take_stall() == 9 + 0 + 9 + 10
+
+
+@pytest.mark.parametrize("kind", ["typed", "mapped"])
+def test_write_back_over_typed_memory(tmp_path: Path, kind: str) -> None:
+    memory: Memory = typed_memory(8)
+    if kind == "mapped":
+        path = tmp_path / "memory.bin"
+        path.write_bytes(bytes(memory))
+        memory = map_memory(path, write_through=True)
+    cache = Cache(CacheConfig(sets=1, ways=1, line_size=2), memory)
+    cache.write(0, 100)
+    # the line is a copy, the store stays in the cache until eviction
+    assert memory[0] == 0
+    assert cache.read(0) == 100
+
+    cache.read(2)
+    assert list(memory) == [100, 0, 0, 0, 0, 0, 0, 0]
+    assert cache.stats.writebacks == 1
+
+
+def test_write_through_does_not_allocate() -> None:
+    cache = make_cache(sets=1, ways=1, line_size=2,
+                       write_policy=WritePolicy.WRITE_THROUGH)
+    cache.write(0, 100)
+    assert cache.memory[0] == 100
+    assert cache.stats.misses == 1
+    assert cache.read(0) == 100
+    assert cache.stats.misses == 2
+    cache.flush()
+    assert cache.stats.writebacks == 0
+
+
+@pytest.mark.parametrize("engine", ["signal", "fast"])
+def test_cached_run_keeps_results_and_adds_stalls(
+    engine: Engine, example: Example, simulate: Simulate
+) -> None:
+    program, _ = example("prob1")
+    plain = simulate(program, [], engine, 10**6)
+    cached = simulate(program, [], engine, 10**6, machine=Machine(
+        CacheConfig.direct_mapped(4, line_size=2)))
+    cache = cached.datapath.cache
+    assert cache is not None
+    cache.flush()
+
+    assert cached.io_controller.output_buffer == [233168]
+    assert cached.datapath.data_memory == plain.datapath.data_memory
+    assert cached.cu._tick == plain.cu._tick + cache.stats.stall_ticks
+    assert cache.stats.hits > cache.stats.misses > 0
+
+
+def test_cached_engines_agree(example: Example, simulate: Simulate) -> None:
+    program, _ = example("prob1")
+    config = CacheConfig.fully_associative(2, line_size=1,
+                                           replacement=Replacement.FIFO)
+    signal = simulate(program, [], "signal", 10**6, machine=Machine(config))
+    fast = simulate(program, [], "fast", 10**6, machine=Machine(config))
+    assert signal.cu._tick == fast.cu._tick
+    assert signal.datapath.cache.stats == fast.datapath.cache.stats  # type: ignore
+
+
+def test_state_dumps_see_dirty_lines(tmp_path: Path) -> None:
+    program = compile("""
+    INT: RST
+    START:
+        ADD R1, 7
+        ST R1, 3
+        HLT
+    """)
+    machine = Machine(CacheConfig.direct_mapped(4, line_size=2))
+    with (ColumnarTraceSink(tmp_path) as sink,
+          pytest.raises(StopIteration)):
+        machine.simulate([], program, engine="signal", trace=sink)
+    dp = machine.datapath
+    assert dp.cache is not None
+    stats = replace(dp.cache.stats)
+
+    assert dp.data_memory[3] == 0
+    assert dp.cache.peek(3) == 7
+    assert dp.memory_cells(2, 5) == [0, 7, 0]
+    assert "MEMORY: [0, 0, 0, 7, 0" in repr(machine.cu)
+    assert dp.cache.stats == stats
+    last = list(ColumnarTrace(tmp_path).states())[-1]
+    assert last.memory[3] == 7
@@ -0,0 +1,137 @@
+import io
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from src.cache import CacheConfig
+from src.checkpoint import (
+    load_checkpoint,
+    loads,
+    run_with_checkpoints,
+    save_checkpoint,
+)
+from src.io_ports import StreamOutput, read_input_events
+from src.isa import unpack_program
+from src.machine import Engine, Machine
+from src.trace import NullTraceSink
+from tests.conftest import State
+
+Start = Callable[[str, int, Engine], Machine]
+Finish = Callable[[Machine], tuple]
+
+
+@pytest.fixture
+def start(examples: Path) -> Start:
+    # an example binary stopped after limit instructions
+    def started(name: str, limit: int, engine: Engine) -> Machine:
+        machine = Machine()
+        with pytest.raises(StopIteration, match="limit"):
+            machine.simulate(
+                read_input_events(examples / f"{name}.input"),
+                unpack_program((examples / f"{name}.bin").read_bytes()),
+                limit=limit, engine=engine, trace=NullTraceSink(),
+            )
+        return machine
+    return started
+
+
+@pytest.fixture
+def finish(state: State) -> Finish:
+    def finished(machine: Machine) -> tuple:
+        with pytest.raises(StopIteration) as e:
+            machine.run(100000, NullTraceSink())
+        assert e.value.value is None
+        return state(machine)
+    return finished
+
+
+@pytest.mark.parametrize("engine", ["signal", "fast", "jit"])
+@pytest.mark.parametrize(("name", "split"), [("prob1", 500), ("hello_user", 25)])
+def test_resume_matches_uninterrupted_run(
+    tmp_path: Path, name: str, split: int, engine: Engine,
+    start: Start, finish: Finish,
+) -> None:
+    expected = finish(start(name, 1, engine))
+
+    path = tmp_path / "machine.ckpt"
+    save_checkpoint(start(name, split, engine), path)
+    resumed = load_checkpoint(path)
+
+    assert resumed.engine == engine
+    assert finish(resumed) == expected
+
+
+def test_forks_are_independent(
+    tmp_path: Path, start: Start, finish: Finish, state: State
+) -> None:
+    path = tmp_path / "machine.ckpt"
+    save_checkpoint(start("hello_user", 25, "fast"), path)
+    data = path.read_bytes()
+
+    first, second = loads(data), loads(data)
+    expected = finish(first)
+    assert state(second) != expected
+    assert finish(second) == expected
+
+
+def test_streamed_input_is_skipped_on_resume(
+    tmp_path: Path, examples: Path, start: Start, finish: Finish
+) -> None:
+    events = read_input_events(examples / "hello_user.input")
+    program = unpack_program((examples / "hello_user.bin").read_bytes())
+    expected = finish(start("hello_user", 1, "fast"))
+
+    machine = Machine()
+    with pytest.raises(StopIteration, match="limit"):
+        machine.simulate(iter(events), program, limit=15, engine="fast",
+                         trace=NullTraceSink())
+    assert machine.io_controller.streaming
+    path = tmp_path / "machine.ckpt"
+    save_checkpoint(machine, path)
+
+    with pytest.raises(ValueError, match="input events"):
+        load_checkpoint(path)
+    resumed = load_checkpoint(path, iter(events))
+    assert finish(resumed) == expected
+
+
+def test_streamed_output_continues(
+    tmp_path: Path, examples: Path, start: Start, finish: Finish
+) -> None:
+    output = finish(start("hello_user", 1, "fast"))[-1]
+    before, after = io.StringIO(), io.StringIO()
+    machine = Machine()
+    machine.io_controller.output_buffer = StreamOutput(before)
+    with pytest.raises(StopIteration, match="limit"):
+        machine.simulate(
+            read_input_events(examples / "hello_user.input"),
+            unpack_program((examples / "hello_user.bin").read_bytes()),
+            limit=60, engine="fast", trace=NullTraceSink(),
+        )
+    machine.io_controller.output_buffer.flush()
+    path = tmp_path / "machine.ckpt"
+    save_checkpoint(machine, path)
+
+    resumed = load_checkpoint(path, output=after)
+    with pytest.raises(StopIteration):
+        resumed.run(100000, NullTraceSink())
+    resumed.io_controller.output_buffer.flush()
+    assert len(resumed.io_controller.output_buffer) == len(output)
+    assert before.getvalue() + after.getvalue() == "".join(map(chr, output))
+
+
+def test_periodic_checkpoints(
+    tmp_path: Path, start: Start, state: State
+) -> None:
+    path = tmp_path / "machine.ckpt"
+    machine = start("prob1", 1, "fast")
+    with pytest.raises(StopIteration, match="limit"):
+        run_with_checkpoints(machine, path, every=100, limit=1000)
+    assert state(load_checkpoint(path)) == state(machine)
+
+
+def test_cached_machine_is_rejected(tmp_path: Path) -> None:
+    machine = Machine(CacheConfig())
+    with pytest.raises(ValueError, match="cache"):
+        save_checkpoint(machine, tmp_path / "machine.ckpt")
@@ -1,6 +1,10 @@
+import subprocess
+import sys
+from pathlib import Path
+
 import pytest
 
-from src.compiler import compile
+from src.compiler import CompileError, Token, compile, tokenize
 from src.isa import (
     ArithmeticInstructionImm,
     ArithmeticInstructionReg,
@@ -151,3 +155,57 @@ test_compile_cases = [
 )
 def test_compile(code: str, expected: Program) -> None:
     assert compile(code) == expected
+
+
+def test_compile_collects_every_error() -> None:
+    source = "\n".join([
+        "INT: RST",
+        "START:",
+        "    ADD R3, 1",
+        "    LD R1",
+        "    JMP NOWHERE",
+        "    PUSH R1 ; not an instruction",
+        "START: HLT",
+        "    ADD R3, 1",
+        "    JMP NOWHERE",
+    ])
+    with pytest.raises(CompileError) as e:
+        compile(source)
+    assert [str(d) for d in e.value.diagnostics] == [
+        "3:9: Expected register R1 or R2, got 'R3'",
+        "4:10: LD takes 2 operand(s), got 1",
+        "5:9: Unknown label NOWHERE",
+        "6:5: Unknown instruction 'PUSH'",
+        "7:1: Label START already defined",
+        # repeated lines are parsed once but reported on every line
+        "8:9: Expected register R1 or R2, got 'R3'",
+        "9:9: Unknown label NOWHERE",
+    ]
+    assert isinstance(e.value, ValueError)
+
+
+def test_compile_requires_int_and_start() -> None:
+    with pytest.raises(CompileError, match="INT and START labels are required"):
+        compile("START: HLT")
+
+
+def test_tokenize_positions() -> None:
+    assert list(tokenize("LOOP: JE R1,END ; done\n  HLT")) == [
+        Token("LOOP:", 1, 1),
+        Token("JE", 1, 7),
+        Token("R1", 1, 10),
+        Token("END", 1, 13),
+        Token("HLT", 2, 3),
+    ]
+
+
+def test_compiler_does_not_import_the_machine() -> None:
+    script = """
+import sys
+import src.compiler
+print(sorted(name for name in sys.modules if name.startswith("src.")))
+"""
+    out = subprocess.run([sys.executable, "-c", script], check=True,
+                         capture_output=True, text=True,
+                         cwd=Path(__file__).parent.parent).stdout
+    assert out.strip() == str(["src.compiler", "src.isa", "src.optimizer"])
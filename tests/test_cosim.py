@@ -0,0 +1,138 @@
+import contextlib
+import io
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src import fast_engine, fusion
+from src.control_unit import ControlUnit
+from src.cosim import DEFAULT_EVERY, assert_cosim, cosimulate, main
+from src.datapath import DataPath
+from src.fast_engine import Handler
+from src.fusion import Superinstruction
+from src.isa import (
+    Instruction,
+    IOMemoryInstructionImm,
+    Opcode,
+    Program,
+)
+from src.machine_config import DEFAULT_CONFIG, MachineConfig
+from tests.conftest import Example
+
+
+@pytest.fixture
+def store_bug(monkeypatch: pytest.MonkeyPatch) -> None:
+    # every predecoded ST to a fixed address writes one more than it should
+    original = fast_engine.predecode_instruction
+
+    def predecode_instruction(
+        instr: Instruction,
+        cached: bool = False,
+        config: MachineConfig = DEFAULT_CONFIG,
+    ) -> Handler:
+        handler = original(instr, cached, config)
+        if not (isinstance(instr, IOMemoryInstructionImm)
+                and instr.opcode == Opcode.ST):
+            return handler
+        addr = instr.src
+
+        def off_by_one(cu: ControlUnit, dp: DataPath) -> None:
+            handler(cu, dp)
+            dp.data_memory[addr] += 1
+        return off_by_one
+
+    monkeypatch.setattr(fast_engine, "predecode_instruction",
+                        predecode_instruction)
+
+
+@pytest.fixture
+def fused_bug(monkeypatch: pytest.MonkeyPatch) -> None:
+    # every superinstruction leaves R1 one higher than the unfused sequence
+    original = fusion.fuse_at
+
+    def fuse_at(
+        program: Program,
+        pc: int,
+        cached: bool = False,
+        config: MachineConfig = DEFAULT_CONFIG,
+    ) -> Superinstruction | None:
+        superinstruction = original(program, pc, cached, config)
+        if superinstruction is None:
+            return None
+        handler = superinstruction.run
+
+        def off_by_one(cu: ControlUnit, dp: DataPath) -> None:
+            handler(cu, dp)
+            dp.r1 += 1
+        return superinstruction._replace(run=off_by_one)
+
+    monkeypatch.setattr(fusion, "fuse_at", fuse_at)
+
+
+@pytest.mark.parametrize("every", [1, 13, DEFAULT_EVERY])
+@pytest.mark.parametrize("name", ["cat", "hello", "hello_user", "prob1"])
+def test_engines_agree_on_examples(
+    name: str, every: int, example: Example
+) -> None:
+    program, events = example(name)
+    for width in (16, 64):
+        results = assert_cosim(program, events, every=every,
+                               config=MachineConfig(word_width=width))
+        assert [result.status for result in results] == ["halt", "halt"]
+
+
+def test_first_divergence_is_narrowed(
+    store_bug: None, example: Example
+) -> None:
+    program, events = example("cat")
+    stepped = cosimulate(program, events, "fast", every=1)
+    strided = cosimulate(program, events, "fast", every=50)
+    assert stepped == strided
+    divergence = stepped.divergence
+    assert divergence is not None and stepped.status == "diverged"
+    # the first ST runs in the first interrupt handler
+    assert divergence.diff() == [("mem[0]", 99, 100)]
+    assert divergence.reference.tick == divergence.candidate.tick
+    assert str(divergence).splitlines() == [
+        f"fast diverges from signal at tick {divergence.reference.tick} "
+        f"after {divergence.instructions} instructions",
+        "  mem[0]: 99 != 100",
+    ]
+    with pytest.raises(AssertionError, match="mem\\[0\\]"):
+        assert_cosim(program, events, engines=["fast"])
+
+
+def test_fused_handlers_are_checked_by_default(
+    fused_bug: None, example: Example
+) -> None:
+    program, events = example("prob1")
+    # a superinstruction never fits in a stride of one instruction
+    assert cosimulate(program, events, "fast", every=1).ok
+    result = cosimulate(program, events, "fast")
+    divergence = result.divergence
+    assert divergence is not None and result.status == "diverged"
+    # narrowed to the end of the first superinstruction
+    [(name, ref, cand)] = divergence.diff()
+    assert name == "r1" and cand == ref + 1  # type: ignore
+    with pytest.raises(AssertionError, match="r1: "):
+        assert_cosim(program, events, engines=["fast"])
+
+
+def test_cli_over_corpus(
+    tmp_path: Path, examples: Path, store_bug: None
+) -> None:
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for suffix in (".bin", ".input"):
+        shutil.copy(examples / f"cat{suffix}", corpus / f"cat{suffix}")
+
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        assert main([str(tmp_path), "--engine", "fast", "--every", "8"]) == 1
+    assert "mem[0]: 99 != 100" in out.getvalue()
+
+    shutil.copy(examples / "hello.bin", corpus / "hello.bin")
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        assert main([str(corpus / "hello.bin"), "--engine", "jit"]) == 0
+    assert out.getvalue() == (
+        f"{corpus / 'hello.bin'}: jit ok, halt after 40 instructions\n")
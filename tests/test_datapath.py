@@ -1,7 +1,9 @@
+from array import array
+from pathlib import Path
 
 import pytest
 
-from src.datapath import DataPath
+from src.datapath import DataPath, dump_memory, map_memory, typed_memory
 from src.isa import Opcode, Registers
 from src.machine_signals import Signals
 
@@ -109,3 +111,41 @@ def test_zero_flag(data_path: DataPath) -> None:
 
     data_path.r2 = 1
     assert not data_path.zero_flag(Registers.R2)
+
+
+def test_typed_memory_backs_the_data_path() -> None:
+    data_path = DataPath(0, memory=typed_memory(16))
+    assert data_path.data_memory_size == 16
+    assert data_path.stack_pointer == 15
+
+    data_path.alu_out = -7
+    data_path.signal_write(Signals.SP_DEC)
+    data_path.signal_read(Signals.SP_INC)
+    assert data_path.data_out == -7
+    assert isinstance(data_path.data_memory, array)
+
+
+def test_map_memory_copy_on_write(tmp_path: Path) -> None:
+    path = tmp_path / "memory.img"
+    dump_memory([1, 2, 3, 4], path)
+
+    memory = map_memory(path)
+    assert list(memory) == [1, 2, 3, 4]
+    memory[0] = 42
+    assert list(map_memory(path)) == [1, 2, 3, 4]
+
+    # a short image is padded with zeros
+    assert list(map_memory(path, 6)) == [1, 2, 3, 4, 0, 0]
+
+    dump_memory(memory, path)
+    assert list(map_memory(path)) == [42, 2, 3, 4]
+
+
+def test_map_memory_write_through(tmp_path: Path) -> None:
+    path = tmp_path / "memory.img"
+    memory = map_memory(path, 8, write_through=True)
+    assert list(memory) == [0] * 8
+
+    memory[3] = 5
+    memory.release()
+    assert list(map_memory(path)) == [0, 0, 0, 5, 0, 0, 0, 0]
@@ -0,0 +1,76 @@
+from pathlib import Path
+
+import pytest
+
+from src.datapath import typed_memory
+from src.fast_engine import predecode
+from src.isa import (
+    ArithmeticInstructionReg,
+    IOMemoryInstructionReg,
+    ManagementInstruction,
+    Opcode,
+    Program,
+    Registers,
+    compact_program,
+    map_program,
+    pack_program,
+)
+from src.machine import Engine, Machine
+from tests.conftest import Example, Simulate, State
+
+
+@pytest.mark.parametrize("name", ["prob1", "cat", "hello", "hello_user"])
+def test_fast_engine_matches_signal_engine(
+    name: str, example: Example, simulate: Simulate, state: State
+) -> None:
+    program, events = example(name)
+    assert state(simulate(program, events, "fast")) == \
+        state(simulate(program, events, "signal"))
+
+
+def test_arithmetic_reg_latches_r1_as_left_operand() -> None:
+    program = Program(0, [
+        ArithmeticInstructionReg(Opcode.SUB, Registers.R2, Registers.R2),
+        IOMemoryInstructionReg(Opcode.LD, Registers.R1, Registers.R1),
+        ManagementInstruction(Opcode.HLT),
+    ])
+    machine = Machine()
+    machine.datapath.r1 = 7
+    machine.datapath.r2 = 3
+    machine.datapath.data_memory[7] = 11
+    handlers = predecode(program)
+    handlers[0](machine.cu, machine.datapath)
+    handlers[1](machine.cu, machine.datapath)
+
+    assert machine.datapath.r2 == 4
+    assert machine.datapath.r1 == 11
+    assert machine.cu._tick == 2
+    with pytest.raises(StopIteration):
+        handlers[2](machine.cu, machine.datapath)
+
+
+@pytest.mark.parametrize("engine", ["signal", "fast"])
+def test_compact_program_runs_like_list_program(
+    engine: Engine, example: Example, simulate: Simulate, state: State
+) -> None:
+    program, _ = example("prob1")
+    assert state(simulate(compact_program(program), [], engine)) == \
+        state(simulate(program, [], engine))
+
+
+@pytest.mark.parametrize("engine", ["signal", "fast", "jit"])
+def test_mapped_program_and_typed_memory(
+    tmp_path: Path, engine: Engine,
+    example: Example, simulate: Simulate, state: State,
+) -> None:
+    program, _ = example("hello_user")
+    events = [(1, ord("A")), (11, ord("l")), (21, 0)]
+    path = tmp_path / "hello_user.bin"
+    path.write_bytes(pack_program(program))
+
+    mapped = map_program(path)
+    machine = Machine(memory=typed_memory(256))
+    assert (state(simulate(mapped, events, engine, machine=machine))
+            == state(simulate(program, events, engine)))
+    # only what ran was decoded
+    assert 0 < mapped.instructions.decoded < len(program.instructions)  # type: ignore
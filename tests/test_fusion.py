@@ -0,0 +1,149 @@
+import pytest
+
+from src.compiler import compile
+from src.fusion import PATTERNS, FusionTable, fuse_at
+from src.machine import Machine
+from src.machine_config import MachineConfig
+from src.trace import NullTraceSink
+from tests.conftest import Example, Simulate, State
+
+# every pattern once, inputs rewrite the accumulated cell so interrupts
+# keep landing inside fused sequences
+FUSIBLE = """
+INT:
+    LD R1, 1
+    SUB R1, R2
+    ST R1, 1
+    RST
+
+START:
+    SUB R1, R1
+    ADD R1, 7
+    LD R1, 1
+    MUL R1, R2
+    ST R1, 1
+    SUB R1, R1
+    ADD R1, R2
+    LD R1, 1
+    DIV R1, 3
+    MUL R1, 3
+    SUB R1, R2
+    JMP START
+"""
+
+
+def test_patterns_found_in_prob1(example: Example) -> None:
+    program, _ = example("prob1")
+    found = {
+        pc: fused.name
+        for pc in range(len(program.instructions))
+        if (fused := fuse_at(program, pc)) is not None
+    }
+    assert found == {
+        6: "clear_copy", 8: "modulo_test",
+        12: "clear_copy", 14: "modulo_test",
+        19: "accumulate",
+    }
+    # a data cache keeps memory accesses on the unfused path
+    assert fuse_at(program, 19, cached=True) is None
+
+
+@pytest.mark.parametrize("width", [16, 64])
+@pytest.mark.parametrize("limit", [5, 17, 200, 2000])
+def test_fused_matches_signal_engine(
+    width: int, limit: int, simulate: Simulate, state: State
+) -> None:
+    config = MachineConfig(word_width=width)  # type: ignore
+    events = [(tick, 300 + tick) for tick in range(3, 400, 7)]
+    program = compile(FUSIBLE)
+    assert (state(simulate(program, events, "fast", limit, config=config))
+            == state(simulate(program, events, "signal", limit,
+                              config=config)))
+
+
+def test_modulo_test_wraps_like_unfused_multiply(
+    simulate: Simulate, state: State
+) -> None:
+    # floor(-32768 / 3) * 3 is below the 16-bit range
+    source = """
+    INT: RST
+    START:
+        SUB R1, 1
+        MUL R1, 32767
+        SUB R1, 1
+        DIV R1, 3
+        MUL R1, 3
+        SUB R1, R2
+        HLT
+    """
+    config = MachineConfig(word_width=16)
+    fused = state(simulate(compile(source), [], "fast", config=config))
+    assert fused == state(simulate(compile(source), [], "signal",
+                                   config=config))
+    assert fused[2] == 32767
+
+
+def test_negative_divisor_is_not_fused(
+    simulate: Simulate, state: State
+) -> None:
+    # floor(32767 / -3) * -3 is above the 16-bit range
+    source = """
+    INT: RST
+    START:
+        ADD R1, 32767
+        DIV R1, -3
+        MUL R1, -3
+        SUB R1, R2
+        HLT
+    """
+    program = compile(source)
+    assert fuse_at(program, program.entry + 1) is None
+    config = MachineConfig(word_width=16)
+    unfused = state(simulate(program, [], "fast", config=config))
+    assert unfused == state(simulate(program, [], "signal", config=config))
+    assert unfused[5] == -32767
+
+
+# a 16-bit word cannot hold the input, so every result that depends on
+# it wraps
+WRAPPING = {
+    "clear_copy": ["SUB R1, R1", "ADD R1, R2"],
+    "clear_set": ["SUB R1, R1", "ADD R1, 1023"],
+    "accumulate": ["ST R2, 1", "LD R1, 1", "ADD R1, R2", "ST R1, 1"],
+    "modulo_test": ["SUB R1, R1", "SUB R1, 32767", "DIV R1, 3", "MUL R1, 3",
+                    "SUB R1, R2"],
+}
+
+
+@pytest.mark.parametrize("name", list(PATTERNS))
+def test_superinstructions_wrap_like_unfused(
+    name: str, simulate: Simulate, state: State
+) -> None:
+    # R2 holds the input until RST restores it, the handler keeps R1
+    lines = ["INT:", *WRAPPING[name], "ST R1, 2", "RST",
+             "START:", "LD R1, 2", "JE R1, START", "HLT"]
+    program = compile("\n".join(lines))
+    config = MachineConfig(word_width=16)
+    events = [(0, 0x1F600)]
+    machine = simulate(program, events, "fast", config=config)
+    fusion = machine.fusion
+    assert isinstance(fusion, FusionTable)
+    assert fusion.stats()[name]["executed"] == 1
+    assert state(machine) == state(simulate(program, events, "signal",
+                                            config=config))
+
+
+def test_interrupt_inside_sequence_falls_back() -> None:
+    program = compile(FUSIBLE)
+    machine = Machine()
+    # START is at 4, the input arrives while its clear_set runs
+    with pytest.raises(StopIteration):
+        machine.simulate([(1, 5)], program, limit=40, engine="fast",
+                         trace=NullTraceSink())
+    fusion = machine.fusion
+    assert isinstance(fusion, FusionTable)
+    stats = fusion.stats()
+    assert stats["clear_set"]["fallbacks"] == 1
+    assert stats["clear_set"]["executed"] >= 1
+    assert stats["modulo_test"]["instructions"] == (
+        3 * stats["modulo_test"]["executed"])
@@ -1,38 +1,72 @@
 import contextlib
 import io
 import logging
-import os
-import tempfile
 from pathlib import Path
 
 import pytest
 
 from src import machine
-from src.compiler import main as compile
+from src.build_cache import BuildCache
+from src.isa import pack_program
+from tests.golden_harness import (
+    LogDivergence,
+    golden_build_cache,
+    streaming_log,
+)
+
+
+@pytest.fixture(scope="session")
+def build_cache(request: pytest.FixtureRequest,
+                tmp_path_factory: pytest.TempPathFactory) -> BuildCache:
+    cache = getattr(request.config, "cache", None)
+    root = (cache.mkdir("asstrok-build") if cache is not None
+            else tmp_path_factory.mktemp("asstrok-build"))
+    return golden_build_cache(root)
 
 
 @pytest.mark.golden_test("../golden/*.yml")
-def test_machine_with_golden(golden, caplog) -> None:  # noqa: ANN001
-    caplog.set_level(logging.INFO)
-
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        source = os.path.join(tmpdirname, "source.asm")
-        input_stream = os.path.join(tmpdirname, "input.txt")
-        target = os.path.join(tmpdirname, "target.bin")
-
-        with open(source, "w", encoding="utf-8") as file:
-            file.write(golden["in_source"])
-        with open(input_stream, "w", encoding="utf-8") as file:
-            file.write(golden["in_stdin"])
-        
-        with contextlib.redirect_stdout(io.StringIO()) as stdout:
-            compile(Path(source), Path(target))
-            print("============================================================")
-            machine.main(Path(target), Path(input_stream))
-        
-        with open(target, 'rb') as file:
-            code = file.read()
-
-        assert code == golden.out["out_code"]
-        assert stdout.getvalue() == golden.out["out_stdout"]
-        assert caplog.text == golden.out["out_log"] 
\ No newline at end of file
+def test_machine_with_golden(golden, build_cache: BuildCache,  # noqa: ANN001
+                             tmp_path: Path) -> None:
+    program, _ = build_cache.build(golden["in_source"])
+    code = pack_program(program)
+    assert code == golden.out["out_code"]
+
+    target = tmp_path / "target.bin"
+    input_stream = tmp_path / "input.txt"
+    target.write_bytes(code)
+    input_stream.write_text(golden["in_stdin"], encoding="utf-8")
+
+    expected_log = None if golden.update_goldens else golden.out["out_log"]
+    with (contextlib.redirect_stdout(io.StringIO()) as stdout,
+          streaming_log(expected_log) as log):
+        print("============================================================")
+        machine.main(target, input_stream)
+    log.finish()
+
+    assert stdout.getvalue() == golden.out["out_stdout"]
+    if golden.update_goldens:
+        assert log.text == golden.out["out_log"]
+
+
+def log_messages(*messages: str) -> None:
+    for message in messages:
+        logging.info(message)
+
+
+def test_streaming_log_stops_at_first_divergence() -> None:
+    with streaming_log(None) as recorded:
+        log_messages("one", "two\nlines", "three")
+
+    with (pytest.raises(LogDivergence, match="line 2 \\(record 2\\)"),
+          streaming_log(recorded.text) as log):
+        log_messages("one", "two\nother", "three")
+    assert log.records == 1
+
+    with streaming_log(recorded.text) as log:
+        log_messages("one", "two\nlines")
+    with pytest.raises(LogDivergence, match="log ends at line 4"):
+        log.finish()
+
+    with streaming_log(recorded.text) as log:
+        log_messages("one", "two\nlines", "three")
+    log.finish()
@@ -0,0 +1,49 @@
+import pytest
+
+from src.compiler import compile
+from src.io_controller import NO_INTERRUPT, IOController
+from src.machine import Machine
+from src.trace import NullTraceSink
+
+ECHO = """
+INT:
+    OUT R2
+    JE R2, STOP
+    RST
+STOP:
+    SUB R2, R2
+    ADD R2, 1
+    ST R2, 0
+    RST
+
+START:
+    LD R1, 0
+    JE R1, START
+    HLT
+"""
+
+
+def test_input_events_are_delivered_in_stream_order() -> None:
+    controller = IOController()
+    assert controller.next_interrupt_tick == NO_INTERRUPT
+
+    controller.load_input([(10, 1), (5, 2)])
+    controller.schedule([(20, 3)])
+    assert controller.next_interrupt_tick == 10
+    assert controller.pop_input() == 1
+    assert controller.next_interrupt_tick == 5
+    assert [controller.pop_input(), controller.pop_input()] == [2, 3]
+    assert controller.next_interrupt_tick == NO_INTERRUPT
+
+
+@pytest.mark.parametrize("engine", ["signal", "fast", "jit"])
+def test_long_input_stream(engine: str) -> None:
+    text = "abcdefghij" * 200
+    events = [(i * 20, ord(c)) for i, c in enumerate(text)]
+    events.append((len(text) * 20, 0))
+
+    machine = Machine()
+    with pytest.raises(StopIteration):
+        machine.simulate(events, compile(ECHO), limit=10**6,
+                         engine=engine, trace=NullTraceSink())  # type: ignore
+    assert bytes(machine.io_controller.output_buffer[:-1]).decode() == text
@@ -0,0 +1,92 @@
+import io
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from src import machine
+from src.io_controller import IOController
+from src.io_ports import (
+    StreamOutput,
+    iter_input_events,
+    parse_input_events,
+    read_input_events,
+)
+from src.machine_config import MachineConfig
+
+
+@pytest.mark.parametrize("name", ["cat", "hello", "hello_user", "input"])
+def test_parser_matches_python_literals(name: str, examples: Path) -> None:
+    path = examples / (f"{name}.txt" if name == "input" else f"{name}.input")
+    text = path.read_text()
+    expected = [(int(tick), ord(char)) for tick, char in eval(text)]
+
+    assert parse_input_events(text) == expected
+    assert read_input_events(path) == expected
+    for chunk_size in [1, 3, 7]:
+        assert list(iter_input_events(io.StringIO(text), chunk_size)) == \
+            expected
+
+
+@pytest.mark.parametrize("text", [
+    "[(0, 'ab')]",
+    "[(0, 'a'), __import__('os')]",
+    "[(x, 'a')]",
+    "[(0, 'a'",
+])
+def test_parser_rejects_malformed_input(text: str) -> None:
+    with pytest.raises(ValueError):
+        parse_input_events(text)
+    with pytest.raises(ValueError):
+        list(iter_input_events(io.StringIO(text), 2))
+
+
+def test_lazy_input_keeps_a_bounded_window() -> None:
+    consumed = 0
+
+    def events() -> Iterator[tuple[int, int]]:
+        nonlocal consumed
+        for i in range(10**6):
+            consumed += 1
+            yield i, 65
+
+    controller = IOController()
+    controller.load_input(events())
+    assert len(controller.input_buffer) == 2
+    for _ in range(5):
+        controller.pop_input()
+    assert consumed == 7
+    assert controller.next_interrupt_tick == 5
+
+
+def test_stream_output_flushes_in_chunks() -> None:
+    stream = io.StringIO()
+    output = StreamOutput(stream, buffer_size=3)
+    for c in b"hello":
+        output.append(c)
+    assert stream.getvalue() == "hel"
+    assert len(output) == 5
+    output.flush()
+    assert stream.getvalue() == "hello"
+
+
+def test_main_streams_output(examples: Path) -> None:
+    stream = io.StringIO()
+    machine.main(examples / "hello_user.bin", examples / "hello_user.input",
+                 engine="fast", output=stream)
+    assert stream.getvalue() == "hello, Alice\0"
+
+
+def test_main_prints_words_that_are_not_characters(
+    examples: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    # prob1's sum wraps to a negative 16-bit word
+    config = MachineConfig(word_width=16)
+    machine.main(examples / "prob1.bin", examples / "prob1.input",
+                 engine="fast", config=config)
+    assert capsys.readouterr().out == "[-28976]\n"
+
+    stream = io.StringIO()
+    machine.main(examples / "prob1.bin", examples / "prob1.input",
+                 engine="fast", config=config, output=stream)
+    assert stream.getvalue() == "-28976"
@@ -1,20 +1,42 @@
+import dataclasses
 import struct
+import subprocess
+import sys
+import zlib
+from pathlib import Path
 
 import pytest
 
 from src.isa import (
+    DECODE_TABLE_MAGIC,
+    VALID_OPCODES,
+    ArgType,
     ArithmeticInstructionImm,
     ArithmeticInstructionReg,
+    ColumnarInstructions,
     Instruction,
+    InstructionSequence,
     IOMemoryInstructionImm,
     IOMemoryInstructionReg,
     IOOutInstruction,
     JumpEqInstruction,
     JumpInstruction,
     ManagementInstruction,
+    MappedInstructions,
     Opcode,
+    Program,
     Registers,
+    compact_program,
+    decode_columns,
+    decode_table,
+    decode_word,
+    decode_words,
+    encode_word,
+    map_program,
+    pack_program,
+    shared_instruction,
     unpack,
+    unpack_program,
 )
 
 test_instruction_packing_cases = [
@@ -89,3 +111,155 @@ test_instruction_packing_cases = [
 def test_instruction_packing_successful(instr: Instruction, expected: bytes) -> None:
     assert instr.pack() == expected
     assert instr == unpack(expected)
+
+
+def test_encode_word_matches_pack() -> None:
+    for word in range(0x10000):
+        if word >> 12 not in VALID_OPCODES:
+            continue
+        instr = decode_word(word)
+        assert struct.pack(">H", encode_word(instr)) == instr.pack()
+
+
+def test_program_round_trip() -> None:
+    instructions = [instr for instr, _ in test_instruction_packing_cases]
+    program = Program(entry=3, instructions=instructions)
+    data = pack_program(program)
+
+    assert data == struct.pack(">H", 3) + b"".join(
+        instr.pack() for instr in instructions)
+    unpacked = unpack_program(data)
+    assert unpacked == program
+    assert pack_program(unpacked) == data
+
+
+def test_unpack_program_rejects_unknown_opcodes() -> None:
+    with pytest.raises(ValueError, match="Unknown opcode"):
+        unpack_program(struct.pack(">HH", 0, 0b0001 << 12))
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_decode_columns(use_numpy: bool) -> None:
+    if use_numpy:
+        pytest.importorskip("numpy")
+    data = b"".join(instr.pack() for instr, _ in test_instruction_packing_cases)
+    columns = decode_columns(data, use_numpy)
+
+    assert list(columns.opcode[:3]) == [
+        Opcode.ADD.value, Opcode.SUB.value, Opcode.MUL.value]
+    assert list(columns.arg_type[4:6]) == [ArgType.IMM.value] * 2
+    assert list(columns.dest[:4]) == [0, 0, 1, 1]
+    assert list(columns.src[:4]) == [0, 1, 0, 1]
+    assert list(columns.imm[4:8]) == [0x1, 0x3FF, 0x1, 0x3FF]
+
+
+def test_compact_program_is_list_compatible() -> None:
+    instructions = [instr for instr, _ in test_instruction_packing_cases]
+    program = Program(entry=1, instructions=instructions)
+    compact = compact_program(program)
+
+    assert isinstance(compact.instructions, ColumnarInstructions)
+    assert compact == program
+    assert len(compact.instructions) == len(instructions)
+    assert compact.instructions[-1] == instructions[-1]
+    assert compact.instructions[2:4] == instructions[2:4]
+    assert pack_program(compact) == pack_program(program)
+    assert compact_program(unpack_program(pack_program(program))) == program
+
+
+def test_instructions_are_slotted_and_shared() -> None:
+    instr = ArithmeticInstructionImm(Opcode.ADD, Registers.R1, 1)
+    assert not hasattr(instr, "__dict__")
+
+    program = compact_program(Program(0, [instr, instr]))
+    assert program.instructions[0] is program.instructions[1]
+
+
+def test_map_program_decodes_on_first_fetch(tmp_path: Path) -> None:
+    instructions = [instr for instr, _ in test_instruction_packing_cases]
+    program = Program(entry=1, instructions=instructions)
+    path = tmp_path / "program.bin"
+    path.write_bytes(pack_program(program)
+                     + struct.pack(">H", 0b0001 << 12))
+
+    mapped = map_program(path)
+    assert isinstance(mapped.instructions, MappedInstructions)
+    assert mapped.entry == 1
+    assert len(mapped.instructions) == len(instructions) + 1
+    assert mapped.instructions.decoded == 0
+
+    assert mapped.instructions[2] == instructions[2]
+    assert mapped.instructions[2] is mapped.instructions[2]
+    assert mapped.instructions.decoded == 1
+    assert mapped.instructions[:len(instructions)] == instructions
+    # a bad word is only reported once it is fetched
+    with pytest.raises(ValueError, match="Unknown opcode: 1"):
+        mapped.instructions[len(instructions)]
+    with pytest.raises(IndexError):
+        mapped.instructions[len(instructions) + 1]
+
+
+def test_decode_table_shares_frozen_instructions() -> None:
+    table = decode_table()
+    assert len(table) == 0x10000
+    assert all(table[word] is None for word in range(0x1000, 0x4000))
+    assert len({id(instr) for instr in table if instr is not None}) <= 16413
+    # RET ignores its low bits, every RET word is the same object
+    ret = shared_instruction(Opcode.RET.value << 12)
+    assert shared_instruction(Opcode.RET.value << 12 | 0xABC) is ret
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        ret.opcode = Opcode.JMP  # type: ignore
+
+    words = [word for word in range(0, 0x10000, 7) if word >> 12 in VALID_OPCODES]
+    assert decode_words(words) == [decode_word(word) for word in words]
+
+
+def test_decode_table_persists(tmp_path: Path) -> None:
+    path = tmp_path / "decode.table"
+    path.write_bytes(DECODE_TABLE_MAGIC + b"\0\0")
+    decode_table(path)
+    # a stale file is rebuilt in place
+    data = path.read_bytes()
+    assert data.startswith(DECODE_TABLE_MAGIC)
+    assert len(data) > 2 * 0x10000
+
+    # so is a truncated, corrupt or inconsistent one
+    start = len(data) - 2 * 0x10000 - 4
+    words = bytearray(data[start:-4])
+    words[2 * 0xB001:2 * 0xB001 + 2] = struct.pack("<H", 0xB001)
+    stale = bytes(words) + struct.pack("<I", zlib.crc32(words))
+    flipped = data[:start] + bytes([data[start] ^ 1]) + data[start + 1:]
+    for broken in (data[:-10], flipped, data[:start] + stale):
+        path.write_bytes(broken)
+        decode_table(path)
+        assert path.read_bytes() == data
+
+    # a fresh process decodes each distinct instruction once
+    script = f"""
+from pathlib import Path
+import src.isa as isa
+decoded = []
+decode_word = isa.decode_word
+def counted(word):
+    decoded.append(word)
+    return decode_word(word)
+isa.decode_word = counted
+table = isa.decode_table(Path({str(path)!r}))
+assert table[0x4000] is isa.shared_instruction(0x4000)
+assert all(table[word] == decode_word(word) for word in range(0x4000, 0x10000))
+assert len(decoded) == len(set(map(id, filter(None, table))))
+print(sum(instr is not None for instr in table))
+"""
+    out = subprocess.run([sys.executable, "-c", script], check=True,
+                         capture_output=True, text=True,
+                         cwd=Path(__file__).parent.parent).stdout
+    assert int(out) == 0x10000 - 0x3000
+
+
+def test_sequence_without_word_cannot_be_created() -> None:
+    class Incomplete(InstructionSequence):
+        def __len__(self) -> int:
+            return 0
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()  # type: ignore
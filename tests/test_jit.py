@@ -0,0 +1,99 @@
+import pytest
+
+from src.compiler import compile
+from src.jit import BlockCompiler, block_instructions
+from src.machine import Engine, Machine
+from src.machine_config import MachineConfig
+from src.trace import NullTraceSink
+from tests.conftest import Example, Simulate, State
+
+# every program faults inside a compiled block, after earlier instructions
+# of the block changed registers, memory and the output
+FAULTS = {
+    "divide": ["ADD R1, 5", "ST R1, 3", "OUT R1", "DIV R1, R2"],
+    "load": ["ADD R1, 7", "ST R1, 1", "OUT R1", "LD R2, 1000"],
+    "store": ["ADD R2, 9", "OUT R2", "SUB R1, 1", "ST R2, 300"],
+    "overflow": ["ADD R1, 1", "ST R1, 2", "CALL START"],
+    "return": ["ADD R1, 3", "OUT R1", "RET"],
+    # RST pops twice and jumps, then underflows on the third pop
+    "restore": ["ADD R1, 4", "CALL NEXT", "NEXT:", "CALL LAST", "LAST:",
+                "RST"],
+}
+
+
+@pytest.mark.parametrize("name", ["prob1", "cat", "hello", "hello_user"])
+def test_jit_matches_signal_engine(
+    name: str, example: Example, simulate: Simulate, state: State
+) -> None:
+    program, events = example(name)
+    assert state(simulate(program, events, "jit")) == \
+        state(simulate(program, events, "signal"))
+
+
+@pytest.mark.parametrize("limit", [1, 7, 30, 31, 95, 1000])
+def test_jit_stops_exactly_at_limit(
+    limit: int, example: Example, simulate: Simulate, state: State
+) -> None:
+    program, events = example("hello_user")
+    assert state(simulate(program, events, "jit", limit)) == \
+        state(simulate(program, events, "signal", limit))
+
+
+def test_blocks_end_at_control_transfer(example: Example) -> None:
+    program, _ = example("prob1")
+    compiler = BlockCompiler(program)
+    loop = program.entry + 2
+
+    assert [str(i.opcode) for i in block_instructions(program, loop)] == [
+        "SUB", "JE"]
+    block = compiler.block_at(loop + 2)
+    assert block is not None
+    assert block.length == 6
+    assert block.lead_ticks == 5
+    assert compiler.block_at(loop + 2) is block
+
+
+@pytest.mark.parametrize("engine", ["jit", "fast"])
+@pytest.mark.parametrize("name", FAULTS)
+def test_fault_leaves_reference_state(
+    name: str, engine: Engine, state: State
+) -> None:
+    program = compile("\n".join(["INT:", "RST", "START:", *FAULTS[name]]))
+    states, errors = [], []
+    for run in ("signal", engine):
+        machine = Machine(config=MachineConfig(256, 16))
+        with pytest.raises((ValueError, IndexError, ZeroDivisionError)) as e:
+            machine.simulate([], program, engine=run, trace=NullTraceSink())
+        states.append(state(machine))
+        errors.append(repr(e.value))
+    assert states[0] == states[1]
+    assert errors[0] == errors[1]
+
+
+# values a 16-bit stack cannot hold, pushed before the program starts. RET
+# and RST return to 65539 + 0, which the ALU wraps to 3.
+RAW_STACK = {
+    "RET": [65539],
+    "RST": [-70000, 70000, 65539, 0],
+}
+
+
+@pytest.mark.parametrize("engine", ["jit", "fast"])
+@pytest.mark.parametrize("opcode", RAW_STACK)
+def test_return_address_wraps_like_signal_engine(
+    opcode: str, engine: Engine, state: State
+) -> None:
+    program = compile("\n".join(["INT:", "RST", "START:", opcode, "HLT"]))
+    states = []
+    for run in ("signal", engine):
+        machine = Machine(config=MachineConfig(256, 16))
+        machine.prepare([], program, engine=run)
+        dp = machine.datapath
+        for value in RAW_STACK[opcode]:
+            dp.data_memory[dp.stack_pointer] = value
+            dp.stack_pointer -= 1
+        with pytest.raises(StopIteration):
+            machine.run(trace=NullTraceSink())
+        states.append(state(machine))
+    assert states[0] == states[1]
+    assert states[0][1] == 3
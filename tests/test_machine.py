@@ -0,0 +1,119 @@
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from src.cache import CacheConfig
+from src.compiler import compile_with_labels
+from src.io_ports import read_input_events
+from src.machine import Engine, Machine, RunResult, StopReason
+from src.trace import NullTraceSink
+from tests.conftest import Example, Simulate, State
+
+ENGINES = ["signal", "fast", "jit"]
+Prepare = Callable[[str, Engine], tuple[Machine, dict[str, int]]]
+
+
+@pytest.fixture
+def prepare(examples: Path) -> Prepare:
+    # a machine ready at the entry of an example, and the example's labels
+    def ready(name: str, engine: Engine) -> tuple[Machine, dict[str, int]]:
+        program, labels = compile_with_labels(
+            (examples / f"{name}.asm").read_text())
+        machine = Machine()
+        machine.prepare(read_input_events(examples / f"{name}.input"),
+                        program, engine=engine)
+        return machine, labels
+    return ready
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("name", ["prob1", "hello_user"])
+def test_stepping_matches_simulate(
+    name: str, engine: Engine, prepare: Prepare,
+    example: Example, simulate: Simulate, state: State,
+) -> None:
+    expected = simulate(*example(name))
+    machine, _ = prepare(name, engine)
+
+    first = machine.step(7)
+    assert (first.reason, first.instructions) == (StopReason.LIMIT, 7)
+    while (result := machine.step()).reason == StopReason.LIMIT:
+        assert result.instructions == 1
+    assert result.reason == StopReason.HALT
+    assert state(machine) == state(expected)
+
+
+def test_prepare_defaults_to_the_simulate_engine(example: Example) -> None:
+    program, events = example("hello")
+    prepared = Machine()
+    prepared.prepare(events, program)
+    simulated = Machine()
+    with pytest.raises(StopIteration):
+        simulated.simulate(events, program, trace=NullTraceSink())
+    assert prepared.engine == simulated.engine == "signal"
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_breakpoints(engine: Engine, prepare: Prepare) -> None:
+    machine, labels = prepare("prob1", engine)
+    machine.breakpoints.add(labels["ADD_TO_SUM"])
+
+    hits = 0
+    while (result := machine.run_until()).reason == StopReason.BREAKPOINT:
+        assert result.pc == labels["ADD_TO_SUM"]
+        hits += 1
+    assert hits == 466
+    assert result.reason == StopReason.HALT
+    assert machine.io_controller.output_buffer == [233168]
+
+    machine, labels = prepare("prob1", engine)
+    result = machine.run_until(pc=labels["END"])
+    assert (result.reason, result.pc) == (StopReason.BREAKPOINT, labels["END"])
+    assert machine.datapath.data_memory[0] == 233168
+
+
+def test_tick_and_limit_stops_agree_across_engines(prepare: Prepare) -> None:
+    results: dict[str, list[RunResult]] = {}
+    for engine in ENGINES:
+        machine, _ = prepare("hello_user", engine)
+        results[engine] = [
+            machine.run_until(tick=37),
+            machine.run_until(limit=20),
+            machine.run_until(tick=1),
+        ]
+    assert results["fast"] == results["signal"] == results["jit"]
+    tick_stop, limit_stop, late = results["signal"]
+    assert tick_stop.reason == StopReason.TICK and tick_stop.tick >= 37
+    assert limit_stop.reason == StopReason.LIMIT
+    assert limit_stop.instructions == 20
+    # the tick is already behind, nothing runs
+    assert (late.reason, late.instructions) == (StopReason.TICK, 0)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_watchpoints_and_predicates(
+    engine: Engine, prepare: Prepare, example: Example
+) -> None:
+    machine, _ = prepare("prob1", engine)
+    machine.watchpoints.add(0)
+    result = machine.run_until()
+    assert result.reason == StopReason.WATCHPOINT
+    assert result.watch == (0, 0, 999)
+
+    # the sum is stored into a write-back cache, memory only sees it on
+    # eviction
+    program, _ = example("prob1")
+    machine = Machine(cache=CacheConfig())
+    machine.prepare([], program, engine=engine)
+    machine.watchpoints.add(0)
+    result = machine.run_until()
+    assert result.reason == StopReason.WATCHPOINT
+    assert result.watch == (0, 0, 999)
+    assert machine.datapath.data_memory[0] == 0
+
+    machine, _ = prepare("hello_user", engine)
+    result = machine.run_until(
+        predicate=lambda m: len(m.io_controller.output_buffer) == 3)
+    assert result.reason == StopReason.CONDITION
+    assert len(machine.io_controller.output_buffer) == 3
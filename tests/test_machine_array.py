@@ -0,0 +1,124 @@
+import random
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from src.compiler import compile  # noqa: E402
+from src.machine_array import MachineArray, mismatched_lanes  # noqa: E402
+from src.machine_config import MachineConfig  # noqa: E402
+
+# the first input picks how the lane ends: 1 divides by zero, 2 recurses
+# until the stack overflows, 3 returns with an empty stack, 4 loads past
+# the end of memory and anything else halts
+FAULTS = """
+INT:
+    ST R2, 0
+    RST
+
+START:
+    LD R1, 0
+    JE R1, START
+    SUB R1, 1
+    JE R1, DIVIDE
+    SUB R1, 1
+    JE R1, RECURSE
+    SUB R1, 1
+    JE R1, UNDERFLOW
+    SUB R1, 1
+    JE R1, OUTSIDE
+    HLT
+
+DIVIDE:
+    DIV R1, R2
+
+RECURSE:
+    CALL RECURSE
+
+UNDERFLOW:
+    RET
+
+OUTSIDE:
+    LD R1, 1000
+"""
+
+
+def random_streams(lanes: int, seed: int) -> list[list[tuple[int, int]]]:
+    rng = random.Random(seed)
+    streams = []
+    for _ in range(lanes):
+        tick, events = rng.randint(0, 30), []
+        for _ in range(rng.randint(0, 10)):
+            tick += rng.randint(0, 15)
+            events.append((tick, rng.choice([0, 10, 65, rng.randint(1, 300)])))
+        streams.append(events)
+    return streams
+
+
+@pytest.mark.parametrize("name", ["cat", "hello", "hello_user", "prob1"])
+@pytest.mark.parametrize("config", [
+    MachineConfig(),
+    MachineConfig(word_width=16),
+    MachineConfig(data_memory_size=64, stack_base=40),
+], ids=["default", "16bit", "small"])
+def test_lanes_match_scalar_machine(
+    name: str, config: MachineConfig, examples: Path
+) -> None:
+    program = compile((examples / f"{name}.asm").read_text())
+    streams = random_streams(12, seed=len(name))
+    array = MachineArray(program, streams, config)
+    array.run(limit=2000)
+    assert mismatched_lanes(array, program, streams, limit=2000) == []
+
+
+@pytest.mark.parametrize("width", [16, 32])
+@pytest.mark.parametrize("name", ["cat", "hello_user"])
+def test_wide_inputs_wrap_like_scalar_machine(
+    name: str, width: int, examples: Path
+) -> None:
+    # R2 holds an input as it came, ST and OUT wrap it through the ALU
+    program = compile((examples / f"{name}.asm").read_text())
+    streams = [
+        [(0, 0x1F600), (40, 0)],
+        [(0, 1 << 40), (25, (1 << 40) + 65), (60, 0)],
+        [(0, -(1 << 33)), (30, 0x10041), (70, 0)],
+    ]
+    config = MachineConfig(256, width)
+    array = MachineArray(program, streams, config)
+    results = array.run(limit=2000)
+    assert mismatched_lanes(array, program, streams, limit=2000) == []
+    assert config.wrap(0x1F600) in results[0].output
+
+
+def test_lanes_fail_independently() -> None:
+    program = compile(FAULTS)
+    streams = [[(5, choice)] for choice in range(6)]
+    array = MachineArray(program, streams, MachineConfig(data_memory_size=32))
+    results = array.run(limit=1000)
+
+    assert [r.exit_reason for r in results] == [
+        "limit",
+        "error: ZeroDivisionError: integer division or modulo by zero",
+        "error: ValueError: Stack overflow",
+        "error: ValueError: Stack underflow",
+        "error: IndexError: list index out of range",
+        "halt",
+    ]
+    assert mismatched_lanes(array, program, streams, limit=1000) == []
+
+
+def test_result_reports_ticks_and_output(examples: Path) -> None:
+    program = compile((examples / "cat.asm").read_text())
+    streams = [
+        [(10 * i, ord(c)) for i, c in enumerate(text + "\0")]
+        for text in ["cat", "lockstep"]
+    ]
+    short, long = MachineArray(program, streams).run(limit=200)
+
+    assert (short.exit_reason, short.ticks, short.instructions) == (
+        "halt", 46, 19)
+    assert short.output == [ord(c) for c in "cat\0"]
+    assert long.exit_reason == "halt"
+    assert long.output == [ord(c) for c in "lockstep\0"]
+    assert long.ticks > short.ticks
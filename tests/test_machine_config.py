@@ -0,0 +1,95 @@
+import pytest
+
+from src.checkpoint import dumps, loads
+from src.compiler import compile
+from src.machine import Engine, Machine
+from src.machine_config import MachineConfig
+from src.trace import NullTraceSink
+from tests.conftest import Example, Simulate
+
+OVERFLOW = """
+INT: RST
+START:
+    ADD R1, 1000
+    MUL R1, 100     ; 100000
+    ADD R2, 1000
+    SUB R1, R2
+    SUB R1, R2      ; 98000
+    ST R1, 0
+    OUT R1
+    HLT
+"""
+
+
+def test_config_validation() -> None:
+    with pytest.raises(ValueError, match="Word width"):
+        MachineConfig(word_width=8)  # type: ignore
+    with pytest.raises(ValueError, match="outside data memory"):
+        MachineConfig(16, stack_base=16)
+    assert MachineConfig(16, stack_base=7).initial_stack_pointer == 7
+    assert MachineConfig(16).initial_stack_pointer == 15
+
+
+@pytest.mark.parametrize("width", [16, 32, 64])
+def test_wrap(width: int) -> None:
+    config = MachineConfig(word_width=width)  # type: ignore
+    assert config.wrap(config.word_max + 1) == config.word_min
+    assert config.wrap(config.word_min - 1) == config.word_max
+    assert config.wrap(-1) == -1
+
+
+@pytest.mark.parametrize("engine", ["signal", "fast", "jit"])
+def test_arithmetic_wraps_around(engine: Engine, simulate: Simulate) -> None:
+    program = compile(OVERFLOW)
+    machine = simulate(program, [], engine,
+                       config=MachineConfig(word_width=16))
+    # 100000 wraps to -31072, two subtractions later it wraps back
+    assert machine.io_controller.output_buffer == [98000 - 2**16]
+    assert machine.datapath.data_memory[0] == 98000 - 2**16
+
+    wide = simulate(program, [], engine)
+    assert wide.io_controller.output_buffer == [98000]
+
+
+@pytest.mark.parametrize("engine", ["signal", "fast", "jit"])
+def test_wide_input_wraps_when_stored_and_printed(
+    engine: Engine, example: Example, simulate: Simulate
+) -> None:
+    # cat stores and prints R2, which holds the input as it came
+    program, _ = example("cat")
+    machine = simulate(program, [(0, 0x1F600)], engine,
+                       config=MachineConfig(word_width=16))
+    assert machine.io_controller.output_buffer == [0x1F600 - 2**17]
+    assert machine.datapath.data_memory[0] == 0x1F600 - 2**17
+
+
+@pytest.mark.parametrize("engine", ["signal", "fast", "jit"])
+def test_stack_base_and_underflow(engine: Engine, simulate: Simulate) -> None:
+    source = "INT: RST\nSTART: CALL SUB\nSUB: HLT\n"
+    machine = simulate(compile(source), [], engine,
+                       config=MachineConfig(32, stack_base=20))
+    # CALL pushes its own address
+    assert machine.datapath.data_memory[20] == 2
+    assert machine.datapath.stack_pointer == 19
+
+    with pytest.raises(ValueError, match="Stack underflow"):
+        simulate(compile("INT: RST\nSTART: RET\n"), [], engine,
+                 config=MachineConfig(32))
+
+
+def test_simulate_resizes_data_memory() -> None:
+    machine = Machine()
+    with pytest.raises(StopIteration):
+        machine.simulate([], compile("INT: RST\nSTART: HLT\n"),
+                         data_memory_size=16, trace=NullTraceSink())
+    assert len(machine.datapath.data_memory) == 16
+    assert machine.datapath.stack_pointer == 15
+    assert machine.config.data_memory_size == 16
+
+
+def test_checkpoint_keeps_the_config(simulate: Simulate) -> None:
+    machine = simulate(compile(OVERFLOW), [], "fast",
+                       config=MachineConfig(64, 16, stack_base=40))
+    restored = loads(dumps(machine))
+    assert restored.config == machine.config
+    assert restored.datapath.data_memory[0] == 98000 - 2**16
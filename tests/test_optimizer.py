@@ -0,0 +1,147 @@
+from pathlib import Path
+
+import pytest
+
+from src.compiler import compile, compile_with_labels
+from src.io_ports import read_input_events
+from src.isa import (
+    ArithmeticInstructionImm,
+    ArithmeticInstructionReg,
+    CallInstruction,
+    IOOutInstruction,
+    IORstInstruction,
+    JumpEqInstruction,
+    JumpInstruction,
+    ManagementInstruction,
+    Opcode,
+    Registers,
+)
+from src.machine_config import MachineConfig
+from src.optimizer import (
+    IRProgram,
+    _raw_input_pcs,
+    dynamic_ticks_saved,
+    optimize,
+    remove_dead_code,
+    remove_identities,
+    thread_jumps,
+)
+from tests.conftest import Simulate, State
+
+WASTEFUL = """
+INT:
+    RST
+START:
+    SUB R1, R1
+    ADD R1, 0
+    SUB R1, R1
+    ADD R1, 65
+    MUL R1, 1
+    JE R2, HOP
+HOP:
+    JMP SKIP
+DEAD:
+    OUT R2
+SKIP:
+    JMP PRINT
+PRINT:
+    OUT R1
+    HLT
+    OUT R2
+"""
+
+
+def test_optimize_removes_waste_and_remaps_labels() -> None:
+    program, labels = compile_with_labels(WASTEFUL)
+    optimized, new_labels, report = optimize(program, labels)
+
+    assert list(optimized.instructions) == [
+        CallInstruction(Opcode.CALL, 1),
+        IORstInstruction(Opcode.RST),
+        ArithmeticInstructionReg(Opcode.SUB, Registers.R1, Registers.R1),
+        ArithmeticInstructionImm(Opcode.ADD, Registers.R1, 65),
+        IOOutInstruction(Opcode.OUT, Registers.R1),
+        ManagementInstruction(Opcode.HLT),
+    ]
+    assert optimized.entry == new_labels["START"] == 2
+    # labels of removed instructions point where execution falls through to
+    assert new_labels["HOP"] == new_labels["DEAD"] == new_labels["PRINT"] == 4
+    assert report.instructions_removed == len(program.instructions) - len(
+        optimized.instructions)
+    assert report.static_ticks_saved > 0
+    assert dynamic_ticks_saved(program, optimized, []) == 6
+
+
+def test_thread_jumps_retargets_chains() -> None:
+    program = compile("""
+    INT: RST
+    START:
+        JE R1, FIRST
+        HLT
+    FIRST: JMP SECOND
+    SECOND: JMP THIRD
+    THIRD: HLT
+    """)
+    threaded = thread_jumps(IRProgram.from_program(program))
+    assert threaded.instructions[2] == JumpEqInstruction(
+        Opcode.JE, Registers.R1, 6)
+    assert threaded.instructions[4] == JumpInstruction(Opcode.JMP, 6)
+
+
+def test_dead_code_keeps_interrupt_entry() -> None:
+    program = compile("""
+    START:
+        HLT
+        OUT R1
+    INT:
+        RST
+    """)
+    ir = remove_dead_code(IRProgram.from_program(program))
+    assert ir.instructions == [
+        CallInstruction(Opcode.CALL, 2),
+        ManagementInstruction(Opcode.HLT),
+        IORstInstruction(Opcode.RST),
+    ]
+
+
+@pytest.mark.parametrize("name", ["prob1", "cat", "hello", "hello_user"])
+def test_examples_keep_their_output(name: str, examples: Path) -> None:
+    program = compile((examples / f"{name}.asm").read_text())
+    optimized = compile((examples / f"{name}.asm").read_text(), optimize=True)
+    events = read_input_events(examples / f"{name}.input")
+    assert dynamic_ticks_saved(program, optimized, events) >= 0
+
+
+RAW_INPUT = """
+INT:
+    ADD R2, 0
+    SUB R1, R1
+    ADD R1, 30000
+    DIV R1, R2
+    OUT R1
+    RST
+START:
+    ADD R2, 0
+    ADD R1, 0
+LOOP:
+    JMP LOOP
+"""
+
+
+def test_identities_keep_wrapping_a_raw_input(
+    simulate: Simulate, state: State
+) -> None:
+    # the interrupt reads 40000 into R2, ADD R2, 0 wraps it at 16 bits
+    program = compile(RAW_INPUT)
+    ir = IRProgram.from_program(program)
+    assert _raw_input_pcs(ir) == {0, 1}
+    optimized = remove_identities(ir).to_program()
+    assert len(optimized.instructions) == len(program.instructions) - 2
+    assert optimized.instructions[1] == program.instructions[1]
+
+    config = MachineConfig(word_width=16)
+    events = [(5, 40000)]
+    expected = simulate(program, events, limit=200, config=config)
+    actual = simulate(optimized, events, limit=200, config=config)
+    assert actual.io_controller.output_buffer == (
+        expected.io_controller.output_buffer) == [30000 // -25536]
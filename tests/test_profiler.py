@@ -0,0 +1,137 @@
+import json
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from src.compiler import compile_with_labels
+from src.io_ports import read_input_events
+from src.isa import (
+    ArithmeticInstructionImm,
+    Opcode,
+    Program,
+    Registers,
+    map_program,
+)
+from src.machine import Engine, Machine
+from src.profiler import Profiler
+from src.trace import NullTraceSink
+
+Profile = Callable[..., tuple[Machine, Profiler]]
+
+
+@pytest.fixture
+def profile(examples: Path) -> Profile:
+    def profiled(
+        name: str, engine: Engine = "fast"
+    ) -> tuple[Machine, Profiler]:
+        program, labels = compile_with_labels(
+            (examples / f"{name}.asm").read_text())
+        profiler = Profiler(program, labels)
+        machine = Machine(profiler=profiler)
+        with pytest.raises(StopIteration):
+            machine.simulate(read_input_events(examples / f"{name}.input"),
+                             program, engine=engine, trace=NullTraceSink())
+        return machine, profiler
+    return profiled
+
+
+@pytest.mark.parametrize("engine", ["signal", "fast", "jit"])
+def test_ticks_add_up(engine: Engine, profile: Profile) -> None:
+    machine, profiler = profile("hello_user", engine)
+
+    assert profiler.total_ticks == machine.cu._tick
+    assert profiler.interrupts == machine.io_controller.inputs_taken
+    assert profiler.interrupt_ticks == 4 * profiler.interrupts
+    assert sum(t for _, t in profiler.by_label().values()) == sum(
+        profiler.ticks)
+    assert sum(t for _, t in profiler.by_opcode().values()) == sum(
+        profiler.ticks)
+    assert profile("hello_user", "signal")[1].to_dict() == profiler.to_dict()
+
+
+def test_calls_and_stacks(profile: Profile) -> None:
+    _, profiler = profile("hello_user")
+    report = profiler.to_dict()
+
+    # every serviced input enters INT through the CALL at PC 0, inputs
+    # arrive faster than INT reaches its RST so the handlers nest
+    assert report["calls"] == [
+        {"caller": "INT", "callee": "INT", "count": profiler.interrupts - 1},
+        {"caller": "START", "callee": "INT", "count": 1},
+    ]
+    assert report["labels"]["INT"]["count"] == 4 * profiler.interrupts + 1
+    assert report["opcodes"]["OUT"]["count"] == 13
+
+    stacks = dict(line.rsplit(" ", 1)
+                  for line in profiler.collapsed().splitlines())
+    assert stacks["START;[interrupt]"] == "4"
+    deepest = max((s for s in stacks if s.endswith("INT")), key=len)
+    assert deepest == ";".join(["START"] + ["INT"] * profiler.interrupts)
+    assert sum(map(int, stacks.values())) == profiler.total_ticks
+
+
+def test_limit_closes_last_instruction(examples: Path) -> None:
+    program, labels = compile_with_labels(
+        (examples / "prob1.asm").read_text())
+    profiler = Profiler(program, labels)
+    machine = Machine(profiler=profiler)
+    with pytest.raises(StopIteration, match="limit"):
+        machine.simulate([], program, limit=1000, trace=NullTraceSink())
+
+    assert sum(profiler.counts) == 1000
+    assert profiler.total_ticks == machine.cu._tick
+
+
+def test_mapped_program_is_decoded_as_it_runs(
+    tmp_path: Path, examples: Path
+) -> None:
+    path = tmp_path / "prob1.bin"
+    path.write_bytes((examples / "prob1.bin").read_bytes())
+    program = map_program(path)
+    profiler = Profiler(program)
+    assert program.instructions.decoded == 0
+
+    machine = Machine(profiler=profiler)
+    with pytest.raises(StopIteration):
+        machine.simulate([], program, engine="jit", trace=NullTraceSink())
+    reference = Profiler(program)
+    with pytest.raises(StopIteration):
+        Machine(profiler=reference).simulate(
+            [], program, engine="signal", trace=NullTraceSink())
+    # jit blocks are expanded into the same per-PC report
+    assert profiler.to_dict() == reference.to_dict()
+    assert profiler.total_ticks == machine.cu._tick
+
+
+def test_write_formats(tmp_path: Path, profile: Profile) -> None:
+    _, profiler = profile("prob1")
+
+    profiler.write(tmp_path / "profile.json")
+    profiler.write(tmp_path / "profile.folded")
+    profiler.write(tmp_path / "profile.txt")
+
+    report = json.loads((tmp_path / "profile.json").read_text())
+    # 466 multiples of 3 or 5 below 1000
+    assert report["labels"]["ADD_TO_SUM"]["count"] == 466 * 4
+    assert (tmp_path / "profile.folded").read_text() == (
+        f"START {profiler.total_ticks}\n")
+    flat = (tmp_path / "profile.txt").read_text().splitlines()
+    assert flat[1].split()[4] == "LOOP"
+
+
+def test_labels_resolve_to_closest_preceding() -> None:
+    program = Program(entry=0, instructions=[
+        ArithmeticInstructionImm(Opcode.ADD, Registers.R1, 1)] * 6)
+    profiler = Profiler(program, {"A": 2, "B": 2, "C": 4})
+    for pc in range(6):
+        profiler.enter(pc, pc)
+    profiler.close(6)
+
+    assert [profiler.label_of(pc) for pc in range(6)] == [
+        "@0", "@1", "A", "A", "C", "C"]
+    # reports agree with label_of, the first of two labels at one address
+    assert profiler.by_label() == {
+        "@0": (1, 1), "@1": (1, 1), "A": (2, 2), "C": (2, 2)}
+    assert [row["label"] for row in profiler.to_dict()["pcs"]] == [
+        "@0", "@1", "A", "A", "C", "C"]
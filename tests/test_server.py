@@ -0,0 +1,161 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from src.compiler import compile
+from src.isa import pack_program
+from src.server import (
+    MAX_LIMIT,
+    MAX_TIMEOUT,
+    SimulationServer,
+    encode_program,
+    parse_job,
+    submit,
+)
+from tests.conftest import Example
+
+SPIN = encode_program(pack_program(compile("""
+INT: RST
+START:
+    JMP START
+""")))
+# prints once, then never halts
+CHATTY = encode_program(pack_program(compile("""
+INT: RST
+START:
+    SUB R1, R1
+    ADD R1, 33
+    OUT R1
+LOOP:
+    JMP LOOP
+""")))
+
+
+@pytest.fixture
+def cat(example: Example) -> str:
+    program, _ = example("cat")
+    return encode_program(pack_program(program))
+
+
+def by_id(messages: list[dict[str, Any]]) -> dict[str, list[dict[str, Any]]]:
+    grouped: dict[str, list[dict[str, Any]]] = {}
+    for message in messages:
+        grouped.setdefault(message["id"], []).append(message)
+    return grouped
+
+
+async def collect(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    requests: list[dict[str, Any]],
+) -> list[tuple[float, dict[str, Any]]]:
+    start = time.monotonic()
+    return [(time.monotonic() - start, message)
+            async for message in submit(reader, writer, requests)]
+
+
+def test_parse_job_rejects_bad_requests(cat: str) -> None:
+    job = parse_job(0, {"program": cat, "input": "[(0, 'a'), (5, 'b')]"})
+    assert job.events == [(0, 97), (5, 98)]
+    assert parse_job(1, {"program": cat, "input": [[3, 7]]}).events == [(3, 7)]
+    with pytest.raises(ValueError, match="base64"):
+        parse_job(2, {"program": 5})
+    with pytest.raises(ValueError, match="engine"):
+        parse_job(3, {"program": cat, "engine": "turbo"})
+    with pytest.raises(ValueError, match="positive"):
+        parse_job(4, {"program": cat, "timeout": 0})
+    for bad in ({"limit": -1}, {"limit": 1.5}, {"limit": "5"},
+                {"limit": True}, {"timeout": "10"}, {"timeout": None}):
+        with pytest.raises(ValueError, match="limit|timeout"):
+            parse_job(5, {"program": cat, **bad})
+    assert parse_job(6, {"program": cat}).max_ticks is None
+    assert parse_job(7, {"program": cat, "max_ticks": None}).max_ticks is None
+    assert parse_job(8, {"program": cat, "max_ticks": 0}).max_ticks == 0
+    for bad in ("abc", -1, 2.5, True, float("inf")):
+        with pytest.raises(ValueError, match="max_ticks"):
+            parse_job(9, {"program": cat, "max_ticks": bad})
+
+
+def test_parse_job_clamps_limit_and_timeout(cat: str) -> None:
+    job = parse_job(0, {"program": cat, "limit": 10**12, "timeout": 1e9})
+    assert (job.limit, job.timeout) == (MAX_LIMIT, MAX_TIMEOUT)
+    job = parse_job(1, {"program": cat, "limit": 500, "timeout": 2},
+                    max_limit=100, max_timeout=1.5)
+    assert (job.limit, job.timeout) == (100, 1.5)
+    job = parse_job(2, {"program": cat, "limit": 50, "timeout": 1})
+    assert (job.limit, job.timeout) == (50, 1.0)
+
+
+def test_jobs_run_concurrently_over_unix_socket(
+    tmp_path: Path, examples: Path, cat: str
+) -> None:
+    async def scenario() -> list[tuple[float, dict[str, Any]]]:
+        async with SimulationServer(workers=2) as server:
+            await server.listen_unix(tmp_path / "server.sock")
+            reader, writer = await asyncio.open_unix_connection(
+                str(tmp_path / "server.sock"))
+            messages = await collect(reader, writer, [
+                {"id": "spin", "program": SPIN, "timeout": 1,
+                 "limit": 10**12},
+                {"id": "cat", "program": cat,
+                 "input": (examples / "cat.input").read_text()},
+                {"id": "ticks", "program": SPIN, "max_ticks": 500},
+                {"id": "chatty", "program": CHATTY, "timeout": 0.5,
+                 "limit": 10**12},
+                {"id": "bad", "program": "not base64!"},
+            ])
+            writer.close()
+            return messages
+
+    timed = asyncio.run(scenario())
+    messages = by_id([message for _, message in timed])
+    finished = {message["id"]: at for at, message in timed
+                if message["type"] in ("result", "error")}
+
+    assert messages["cat"] == [
+        {"id": "cat", "type": "output", "values": [99, 97, 116, 0]},
+        {"id": "cat", "type": "result", "exit_reason": "halt", "ticks": 46,
+         "instructions": 19},
+    ]
+    assert messages["ticks"][-1]["exit_reason"] == "ticks"
+    assert messages["ticks"][-1]["ticks"] == 500
+    assert messages["bad"][0]["type"] == "error"
+    # the runaway job does not hold up the others
+    assert messages["spin"][-1]["exit_reason"] == "timeout"
+    assert finished["spin"] >= 1
+    assert max(finished["cat"], finished["ticks"]) < finished["spin"]
+    # output is streamed while the job is still running
+    chatty = messages["chatty"]
+    assert [m["type"] for m in chatty] == ["output", "result"]
+    assert chatty[0]["values"] == [33]
+    assert chatty[1]["exit_reason"] == "timeout"
+    output_at = next(at for at, m in timed
+                     if m["id"] == "chatty" and m["type"] == "output")
+    assert output_at < finished["chatty"] - 0.2
+
+
+def test_tcp_limit_and_invalid_lines() -> None:
+    async def scenario() -> list[dict[str, Any]]:
+        async with SimulationServer(workers=1, max_limit=1000) as server:
+            listener = await server.listen_tcp()
+            host, port = listener.sockets[0].getsockname()[:2]
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b"[1, 2]\n")
+            messages = [m async for m in submit(reader, writer, [
+                {"id": 1, "program": SPIN, "limit": 10**9},
+                {"id": 2, "program": SPIN, "max_ticks": "abc"},
+            ])]
+            writer.close()
+            return messages
+
+    messages = asyncio.run(scenario())
+    invalid, bad_ticks, result = sorted(
+        messages, key=lambda m: (m["id"] is not None, m["type"]))
+    assert invalid["type"] == "error" and invalid["id"] is None
+    assert (bad_ticks["id"], bad_ticks["type"]) == (2, "error")
+    assert "max_ticks" in bad_ticks["message"]
+    assert (result["id"], result["exit_reason"], result["instructions"]) == (
+        1, "limit", 1000)
@@ -0,0 +1,100 @@
+import io
+import logging
+
+import pytest
+
+from src.control_unit import ControlUnit
+from src.isa import (
+    ArithmeticInstructionImm,
+    JumpInstruction,
+    ManagementInstruction,
+    Opcode,
+    Program,
+    Registers,
+)
+from src.machine import Machine
+from src.trace import (
+    BinaryTraceSink,
+    NullTraceSink,
+    TraceSink,
+    read_binary_trace,
+)
+
+# CALL-free loop: PC 0 adds, PC 1 jumps back, PC 2 is never reached
+LOOP = Program(entry=0, instructions=[
+    ArithmeticInstructionImm(Opcode.ADD, Registers.R1, 1),
+    JumpInstruction(Opcode.JMP, 0),
+    ManagementInstruction(Opcode.HLT),
+])
+
+
+class CollectingSink(TraceSink):
+    records: list[tuple[int, int]]
+
+    def __init__(self, **kwargs: object) -> None:
+        super().__init__(**kwargs)  # type: ignore
+        self.records = []
+
+    def emit(self, cu: ControlUnit) -> None:
+        self.records.append((cu._tick, cu.program_counter))
+
+
+def run(sink: TraceSink, limit: int = 10) -> Machine:
+    machine = Machine()
+    with pytest.raises(StopIteration):
+        machine.simulate([], LOOP, limit=limit, trace=sink)
+    return machine
+
+
+def test_null_sink_never_renders_state(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    caplog.set_level(logging.INFO)
+
+    def fail(self: ControlUnit) -> str:
+        raise AssertionError("state rendered")
+
+    monkeypatch.setattr(ControlUnit, "__repr__", fail)
+    machine = run(NullTraceSink())
+    assert machine.datapath.r1 == 5
+    assert caplog.messages == ["Starting simulation"]
+
+
+def test_every_step_is_recorded_by_default() -> None:
+    sink = CollectingSink()
+    run(sink, limit=4)
+    assert sink.records == [(0, 0), (1, 1), (2, 0), (3, 1), (4, 0)]
+
+
+def test_sampling_every_nth_tick() -> None:
+    sink = CollectingSink(every=3)
+    run(sink, limit=10)
+    assert sink.records == [(0, 0), (3, 1), (6, 0), (9, 1)]
+
+
+def test_sampling_pc_range() -> None:
+    sink = CollectingSink(pc_range=(1, 2))
+    run(sink, limit=6)
+    assert sink.records == [(1, 1), (3, 1), (5, 1)]
+
+
+def test_binary_sink_round_trip() -> None:
+    stream = io.BytesIO()
+    run(BinaryTraceSink(stream), limit=2)
+    stream.seek(0)
+    records = list(read_binary_trace(stream))
+
+    assert [(r.tick, r.pc, r.r1) for r in records] == [
+        (0, 0, 0), (1, 1, 1), (2, 0, 1)
+    ]
+    assert records[1].alu_out == 1
+    assert records[1].sp == 255
+    assert not records[1].interrupted
+
+
+def test_sink_without_emit_cannot_be_created() -> None:
+    class Incomplete(TraceSink):
+        pass
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()  # type: ignore
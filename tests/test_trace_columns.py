@@ -0,0 +1,129 @@
+import contextlib
+import io
+import logging
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from src.isa import Program, pack_program
+from src.machine import Machine
+from src.trace import TextTraceSink, TraceSink
+from src.trace_columns import (
+    ColumnarTrace,
+    ColumnarTraceSink,
+    Condition,
+    format_state,
+    main,
+)
+from tests.conftest import Example
+
+
+class MessageHandler(logging.Handler):
+    messages: list[str]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if message := record.getMessage():
+            self.messages.append(message)
+
+
+Traced = Callable[[str, TraceSink], Program]
+TextStates = Callable[..., list[str]]
+
+
+@pytest.fixture
+def traced(example: Example) -> Traced:
+    def run(name: str, sink: TraceSink) -> Program:
+        program, events = example(name)
+        with pytest.raises(StopIteration):
+            Machine().simulate(events, program, limit=2000, engine="fast",
+                               trace=sink)
+        return program
+    return run
+
+
+@pytest.fixture
+def text_states(traced: Traced) -> TextStates:
+    def states(name: str, every: int = 1) -> list[str]:
+        logger = logging.getLogger(f"test_trace_columns.{name}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = MessageHandler()
+        logger.addHandler(handler)
+        try:
+            traced(name, TextTraceSink(logger, every=every))
+        finally:
+            logger.removeHandler(handler)
+        return handler.messages
+    return states
+
+
+@pytest.mark.parametrize("name", ["cat", "hello_user", "prob1"])
+def test_states_reconstruct_golden_text(
+    name: str, tmp_path: Path, traced: Traced, text_states: TextStates
+) -> None:
+    with ColumnarTraceSink(tmp_path, chunk_records=64) as sink:
+        program = traced(name, sink)
+
+    trace = ColumnarTrace(tmp_path)
+    states = [format_state(state, program) for state in trace.states()]
+    assert states == text_states(name)
+
+
+def test_sampled_trace_keeps_memory(
+    tmp_path: Path, traced: Traced, text_states: TextStates
+) -> None:
+    # memory writes between sampled records are found by a full diff
+    with ColumnarTraceSink(tmp_path, chunk_records=16, every=7) as sink:
+        program = traced("hello_user", sink)
+
+    trace = ColumnarTrace(tmp_path)
+    states = [format_state(state, program) for state in trace.states()]
+    assert states == text_states("hello_user", every=7)
+
+
+def test_queries_skip_chunks(tmp_path: Path, traced: Traced) -> None:
+    with ColumnarTraceSink(tmp_path, chunk_records=100) as sink:
+        program = traced("prob1", sink)
+    trace = ColumnarTrace(tmp_path)
+    rows = list(trace.rows())
+    assert len(trace) == len(rows) and len(trace.chunks) > 10
+
+    window = list(trace.rows(ticks=(500, 520)))
+    assert [row.tick for row in window] == list(range(500, 520))
+    assert list(trace.rows(pcs=(19, 20))) == [r for r in rows if r.pc == 19]
+
+    where = [Condition.parse("r1 >= 1000"), Condition.parse("pc == 21")]
+    assert list(trace.rows(where=where)) == [
+        r for r in rows if r.r1 >= 1000 and r.pc == 21]
+
+    full = {s.row.tick: format_state(s, program) for s in trace.states()}
+    for state in trace.states(ticks=(1234, 1240)):
+        assert format_state(state, program) == full[state.row.tick]
+
+    with pytest.raises(ValueError, match="Invalid condition"):
+        Condition.parse("alu == 1")
+
+
+def test_cli_prints_columns_and_text(tmp_path: Path, traced: Traced) -> None:
+    with ColumnarTraceSink(tmp_path / "trace") as sink:
+        program = traced("hello_user", sink)
+    code = tmp_path / "hello_user.bin"
+    code.write_bytes(pack_program(program))
+
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        main([str(tmp_path / "trace"), "--pc", "5:6", "--limit", "2"])
+    lines = out.getvalue().splitlines()
+    assert lines[0].split("\t")[:3] == ["tick", "pc", "opcode"]
+    assert [line.split("\t")[:2] for line in lines[1:]] == [
+        ["11", "5"], ["21", "5"]]
+
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        main([str(tmp_path / "trace"), "--where", "interrupted == 1",
+              "--text", str(code), "--limit", "1"])
+    assert out.getvalue().startswith(
+        "Current State:Interrupted with input: A\nTICK: 1\tPC: 40\n")